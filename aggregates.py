@@ -0,0 +1,136 @@
+import numpy as np
+
+from histogram_engine import N_PERIODS, N_SIDES, OTHER, MinuteCounts
+from timeline import OFFSETS
+
+# Minutes of the count arrays, StatsBomb minutes of regular goals stay below it (the axis grows if not)
+N_MINUTES = 130
+
+
+class GoalAggregate:
+    """
+    Goal counts per side, period and StatsBomb minute with the number of matches and of matches that
+    went to extra-time. Aggregates of new matches are added with update, and aggregates of different
+    competitions, seasons or workers merge with +, in any order and grouping. Rates, histograms and
+    the interval counts of the rate tests only need the aggregate, never the goal rows.
+
+    n_minutes: initial length of the minute axis
+    """
+
+    def __init__(self, n_minutes=N_MINUTES):
+        self.counts = np.zeros((N_SIDES, N_PERIODS, n_minutes), dtype=np.int64)
+        self.n_matches = 0
+        self.n_matches_ET = 0
+
+    @classmethod
+    def from_goals(cls, goals_df, n_matches, n_matches_ET=0):
+        aggregate = cls()
+        aggregate.update(goals_df, n_matches, n_matches_ET)
+        return aggregate
+
+    @property
+    def n_minutes(self):
+        return self.counts.shape[2]
+
+    def freeze(self):
+        # read-only counts, e.g. of the cached aggregates shared with forked workers, update raises then
+        self.counts.setflags(write=False)
+        return self
+
+    def _grow(self, n_minutes):
+        if n_minutes > self.n_minutes:
+            counts = np.zeros((N_SIDES, N_PERIODS, n_minutes), dtype=np.int64)
+            counts[:, :, :self.n_minutes] = self.counts
+            self.counts = counts
+
+    def update(self, goals_df, n_matches, n_matches_ET=0):
+        """
+        Add the goals of newly ingested matches.
+
+        goals_df: goals with 'period', 'goal_time' and optionally 'home' columns
+        n_matches: number of matches the goals were scored in (matches without goals included)
+        n_matches_ET: how many of them went to extra-time
+        """
+        period = goals_df['period'].to_numpy(dtype=np.int64)
+        minute = goals_df['goal_time'].to_numpy(dtype=np.int64)
+        side = goals_df['home'].to_numpy(dtype=np.int64) if 'home' in goals_df.columns \
+            else np.full(len(minute), OTHER)
+        self._grow(int(minute.max(initial=-1)) + 1)
+        np.add.at(self.counts, (side, period - 1, minute), 1)
+        self.n_matches += int(n_matches)
+        self.n_matches_ET += int(n_matches_ET)
+        return self
+
+    def __add__(self, other):
+        combined = GoalAggregate(max(self.n_minutes, other.n_minutes))
+        combined.counts[:, :, :self.n_minutes] += self.counts
+        combined.counts[:, :, :other.n_minutes] += other.counts
+        combined.n_matches = self.n_matches + other.n_matches
+        combined.n_matches_ET = self.n_matches_ET + other.n_matches_ET
+        return combined
+
+    def __radd__(self, other):
+        # so sum(aggregates) works without a start value
+        return self if other == 0 else self + other
+
+    def goals(self, sides=None, periods=None):
+        """
+        Returns:
+        Number of goals of the given side codes and periods, None counts all of them.
+        """
+        counts = self.counts if sides is None else self.counts[list(sides)]
+        if periods is not None:
+            counts = counts[:, [period - 1 for period in periods]]
+        return int(counts.sum())
+
+    def rate(self, sides=None, periods=None):
+        """
+        Returns:
+        Goals per match of the given sides and periods. Extra-time periods (3, 4) are divided by
+        the number of matches that went to extra-time, 0.0 if there are no such matches.
+        """
+        extra_time = periods is not None and all(period in (3, 4) for period in periods)
+        n_matches = self.n_matches_ET if extra_time else self.n_matches
+        return self.goals(sides, periods) / n_matches if n_matches else 0.0
+
+    def interval_counts(self, intervals, sides=None):
+        """
+        Number of goals in each interval, as rate_tests.interval_counts on the goal rows.
+
+        intervals: array with rows (period, start, stop), e.g. from rate_tests.period_intervals
+        sides: side codes to count, None counts all goals
+        """
+        counts = (self.counts if sides is None else self.counts[list(sides)]).sum(axis=0)
+        cumsum = np.zeros((N_PERIODS, self.n_minutes + 1), dtype=np.int64)
+        np.cumsum(counts, axis=1, out=cumsum[:, 1:])
+        intervals = np.asarray(intervals, dtype=np.int64).reshape(-1, 3)
+        period = intervals[:, 0] - 1
+        return cumsum[period, np.minimum(intervals[:, 2], self.n_minutes)] \
+            - cumsum[period, np.minimum(intervals[:, 1], self.n_minutes)]
+
+    def minute_counts(self, offsets=OFFSETS):
+        """
+        Returns:
+        histogram_engine.MinuteCounts on the plotting timeline, for the histograms of the apps.
+        """
+        period_offsets = offsets[1:N_PERIODS + 1].astype(np.int64)
+        n_minutes = self.n_minutes + int(period_offsets.max())
+        timeline = MinuteCounts(n_minutes=0)
+        timeline.counts = np.zeros((N_SIDES, N_PERIODS, n_minutes), dtype=np.int64)
+        for p, offset in enumerate(period_offsets):
+            timeline.counts[:, p, offset:offset + self.n_minutes] = self.counts[:, p]
+        timeline.n_matches = self.n_matches
+        timeline._update_cumsum()
+        return timeline
+
+    def to_dict(self):
+        # JSON-serializable form, e.g. to ship partial aggregates between workers or store them
+        return {'counts': self.counts.tolist(), 'n_matches': self.n_matches, 'n_matches_ET': self.n_matches_ET}
+
+    @classmethod
+    def from_dict(cls, data):
+        aggregate = cls(n_minutes=0)
+        aggregate.counts = np.array(data['counts'], dtype=np.int64).reshape(N_SIDES, N_PERIODS, -1)
+        aggregate.n_matches = data['n_matches']
+        aggregate.n_matches_ET = data['n_matches_ET']
+        return aggregate
@@ -0,0 +1,47 @@
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+# make the shared modules in the repository root importable
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import catalog
+from timeline import adjusted_goal_time
+
+
+def adjust_minutes(row):
+    # Reference: the row-wise function the scripts applied with DataFrame.apply(..., axis=1)
+    if row['period'] == 2:
+        return row['goal_time'] + 15
+    elif row['period'] == 3:
+        return row['goal_time'] + 30
+    elif row['period'] == 4:
+        return row['goal_time'] + 45
+    else:
+        return row['goal_time']
+
+
+def best_of(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+if __name__ == '__main__':
+    # all leagues and tournaments, repeated to reach the target number of goals
+    goals = catalog.union(catalog.CATALOG)
+    for n_goals in [10_000, 100_000, 1_000_000]:
+        goals_n = pd.concat([goals] * -(-n_goals // len(goals)), ignore_index=True).iloc[:n_goals]
+        t_lut, lut = best_of(lambda: adjusted_goal_time(goals_n['period'], goals_n['goal_time']), repeat=20)
+        text = f"{n_goals:8d} goals: lookup table {1e6 * t_lut:8.1f}us"
+        # the row-wise apply takes seconds per 100k goals, only run it on the smaller sets
+        if n_goals <= 100_000:
+            t_apply, applied = best_of(lambda: goals_n.apply(adjust_minutes, axis=1), repeat=1)
+            assert np.array_equal(applied.to_numpy(), lut), "lookup table and apply disagree"
+            text += f", apply {1e3 * t_apply:8.1f}ms, speed-up {t_apply / t_lut:8.0f}x"
+        print(text)
@@ -0,0 +1,96 @@
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+# make the shared modules in the repository root importable
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import catalog
+from ingestion import EVENT_COLUMNS, extract_goals
+from synthetic_data import SyntheticStatsBomb
+
+
+def extract_goals_loop(events_per_match, matches, tournament=False):
+    # Reference: the per-match loop over goals.iterrows() that make_df / make_df_tournament used before
+    home_teams = dict(zip(matches['match_id'], matches['home_team']))
+    away_teams = dict(zip(matches['match_id'], matches['away_team']))
+    stages = dict(zip(matches['match_id'], matches['competition_stage']))
+    goals_data = []
+    n_ET = 0
+    for match_id, events in events_per_match:
+        ET = (events[events['period'] == 3].shape[0] > 0)
+        n_ET += ET
+        if 'shot_outcome' in events.columns:
+            goals = events[(events['shot_outcome'] == 'Goal') | (events['type'] == 'Own Goal For')]
+        else:
+            goals = events[(events['type'] == 'Own Goal For')]
+        if tournament:
+            goals = goals[goals['period'] < 5]
+
+        for _, goal in goals.iterrows():
+            if tournament:
+                goals_data.append({
+                    'match_id': match_id,
+                    'period': goal['period'],
+                    'stage': stages[match_id],
+                    'goal_time': goal['minute'],
+                    'n_matches_ET': n_ET,
+                    'ET_match': ET
+                })
+            else:
+                if home_teams[match_id] == goal['team']:
+                    home = 1
+                elif away_teams[match_id] == goal['team']:
+                    home = 0
+                else:
+                    home = 2
+                goals_data.append({
+                    'match_id': match_id,
+                    'period': goal['period'],
+                    'goal_time': goal['minute'],
+                    'home': home,
+                })
+    return pd.DataFrame(goals_data)
+
+
+def synthetic_events(n_matches, tournament):
+    # events of a 64-match template season of a league or tournament of the catalog, repeated with new match
+    # ids up to n_matches
+    competition_id, season_id = (catalog.TOURNAMENTS if tournament else catalog.TOP5_2015_16)[0]
+    client = SyntheticStatsBomb(n_matches=64)
+    template = client.matches(competition_id=competition_id, season_id=season_id)
+    template_events = [client.events(match_id) for match_id in template['match_id']]
+
+    n_copies = -(-n_matches // len(template))
+    matches = pd.concat([template.assign(match_id=template['match_id'] + 1_000 * copy)
+                         for copy in range(n_copies)], ignore_index=True).iloc[:n_matches]
+    events_per_match = [(match_id, template_events[i % len(template)])
+                        for i, match_id in enumerate(matches['match_id'])]
+    return matches, events_per_match
+
+
+if __name__ == '__main__':
+    for tournament in [False, True]:
+        for n_matches in [380, 3_800, 38_000]:
+            matches, events_per_match = synthetic_events(n_matches, tournament)
+            events = pd.concat([events.reindex(columns=EVENT_COLUMNS).assign(match_id=match_id)
+                                for match_id, events in events_per_match], ignore_index=True)
+
+            start = time.perf_counter()
+            columnar = extract_goals(events, matches, tournament=tournament)
+            t_columnar = time.perf_counter() - start
+
+            # the loop gets slow, only run it on the smaller tables
+            if n_matches <= 3_800:
+                start = time.perf_counter()
+                loop = extract_goals_loop(events_per_match, matches, tournament=tournament)
+                t_loop = time.perf_counter() - start
+                assert np.array_equal(loop.values, columnar.values), "columnar and loop goals differ"
+                loop_text = f"loop {t_loop:8.3f}s, speed-up {t_loop / t_columnar:6.1f}x"
+            else:
+                loop_text = "loop skipped"
+
+            print(f"{'tournament' if tournament else 'league':10s} {n_matches:6d} matches, {len(events):9d} events: "
+                  f"columnar {t_columnar:6.3f}s, {loop_text}")
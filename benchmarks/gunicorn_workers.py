@@ -0,0 +1,147 @@
+import argparse
+import itertools
+import json
+import os
+import queue
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+CONFIG = os.path.join(ROOT, 'gunicorn.conf.py')
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+APPS = {
+    'home_away': ('home_away', 'interactive_histogram_with_home_away:server'),
+    'main': ('.', 'interactive_histogram:server'),
+}
+WORKERS = [1, 4, 16]
+REQUESTS_PER_WORKER = 50  # callback requests after the start, so the workers have touched the data
+START_TIMEOUT = 600
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def memory(pid):
+    """
+    Returns:
+    Dictionary with the RSS, PSS (shared pages divided by the processes sharing them) and USS (pages
+    only this process uses) of a process in MB, from /proc/<pid>/smaps_rollup.
+    """
+    fields = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                fields[parts[0].rstrip(':')] = int(parts[1]) / 1024
+    return {'rss': fields['Rss'], 'pss': fields['Pss'],
+            'uss': fields['Private_Clean'] + fields['Private_Dirty']}
+
+
+def children(pid):
+    with open(f'/proc/{pid}/task/{pid}/children') as f:
+        return [int(child) for child in f.read().split()]
+
+
+def callback_request(port, league, bin_width, weight_toggle, team_selector):
+    # the request dash-renderer sends when an input of the graph changes
+    inputs = [('league-selector', league), ('bin-width-slider', bin_width), ('weight-toggle', weight_toggle)]
+    if team_selector is not None:
+        inputs.append(('team-selector', team_selector))
+    payload = {
+        'output': 'graph.figure',
+        'outputs': {'id': 'graph', 'property': 'figure'},
+        'inputs': [{'id': id_, 'property': 'value', 'value': value} for id_, value in inputs],
+        'changedPropIds': ['league-selector.value'],
+        'state': [],
+    }
+    request = urllib.request.Request(f'http://127.0.0.1:{port}/_dash-update-component',
+                                     data=json.dumps(payload).encode(), headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(request) as response:
+        return response.status
+
+
+def measure(app, n_workers, preload):
+    """
+    Start gunicorn with n_workers workers, wait until all of them have loaded the app and answer some
+    callbacks, then read the memory of the master and the workers.
+
+    Returns:
+    Dictionary with the cold start in seconds (launch until all workers are ready), the mean memory per
+    worker and the memory of the master and of all processes together.
+    """
+    chdir, target = APPS[app]
+    port = free_port()
+    env = dict(os.environ, WEB_CONCURRENCY=str(n_workers), PRELOAD='1' if preload else '0',
+               BIND=f'127.0.0.1:{port}')
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', CONFIG, '--chdir', os.path.join(ROOT, chdir),
+                                target], env=env, stderr=subprocess.PIPE, text=True)
+    # read the log in a thread, so the pipe never fills up
+    lines = queue.Queue()
+    threading.Thread(target=lambda: [lines.put(line) for line in process.stderr], daemon=True).start()
+    try:
+        ready = 0
+        while ready < n_workers:
+            if time.perf_counter() - start > START_TIMEOUT or process.poll() is not None:
+                raise RuntimeError(f"gunicorn did not start {n_workers} workers")
+            try:
+                ready += 'Worker ready' in lines.get(timeout=1.0)
+            except queue.Empty:
+                pass
+        cold_start = time.perf_counter() - start
+
+        states = itertools.cycle(itertools.product(
+            ['England', 'Spain', 'Germany', 'Italy', 'France'], [1, 3, 5, 15, 45], ['weighted', 'not_weighted'],
+            ['home', 'away', 'both-separate', 'both'] if app == 'home_away' else [None]))
+        for state in itertools.islice(states, REQUESTS_PER_WORKER * n_workers):
+            callback_request(port, *state)
+
+        workers = [memory(pid) for pid in children(process.pid)]
+        master = memory(process.pid)
+    finally:
+        process.send_signal(signal.SIGTERM)
+        process.wait(timeout=60)
+    return {
+        'app': app,
+        'workers': n_workers,
+        'preload': preload,
+        'cold_start_seconds': cold_start,
+        'worker_rss_mb': sum(worker['rss'] for worker in workers) / len(workers),
+        'worker_pss_mb': sum(worker['pss'] for worker in workers) / len(workers),
+        'worker_uss_mb': sum(worker['uss'] for worker in workers) / len(workers),
+        'master_rss_mb': master['rss'],
+        'total_pss_mb': master['pss'] + sum(worker['pss'] for worker in workers),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Memory and cold start of the apps under gunicorn, with and "
+                                                 "without loading the app in the master (preload).")
+    parser.add_argument('--app', choices=list(APPS), default='home_away')
+    parser.add_argument('--workers', nargs='+', type=int, default=WORKERS)
+    parser.add_argument('--save', help="name of the result file in benchmarks/results")
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'workers':>7} {'preload':>7} {'start s':>8} {'RSS/worker':>10} {'PSS/worker':>10} {'USS/worker':>10} "
+          f"{'total PSS':>9}")
+    for n_workers in args.workers:
+        for preload in [False, True]:
+            result = measure(args.app, n_workers, preload)
+            results.append(result)
+            print(f"{n_workers:>7} {str(preload):>7} {result['cold_start_seconds']:>8.1f} "
+                  f"{result['worker_rss_mb']:>8.0f}MB {result['worker_pss_mb']:>8.0f}MB "
+                  f"{result['worker_uss_mb']:>8.0f}MB {result['total_pss_mb']:>7.0f}MB")
+    if args.save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        with open(os.path.join(RESULTS_DIR, f"{args.save}.json"), 'w') as f:
+            json.dump(results, f, indent=1)
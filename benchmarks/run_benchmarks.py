@@ -0,0 +1,265 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+from scipy.stats import mannwhitneyu
+
+# make the shared modules in the repository root importable
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import catalog
+from bench_adjust_minutes import adjust_minutes
+from bench_extract_goals import synthetic_events
+from histogram_engine import AWAY, HOME, MinuteCounts, app_bin_edges
+from ingestion import EVENT_COLUMNS, extract_goals
+from rate_tests import interval_counts, pairwise_rate_tests, period_intervals
+from timeline import adjusted_goal_time
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+SCALES = [1, 10, 100, 1000]  # multiples of the goals (and matches) of the five 2015/16 league csvs
+MIN_SECONDS = 0.2  # repeat a benchmark until it ran at least this long (and at least twice)
+BATCH_MATCHES = 2_000  # matches per extract_goals batch, ingestion extracts batch-wise as well
+# changes below these are timer and allocator noise, compare never reports them as regressions
+MIN_SECONDS_DIFFERENCE = 1e-4
+MIN_MIB_DIFFERENCE = 1.0
+
+
+def scaled_goals(scale):
+    # the goals of the five leagues repeated scale times, every copy with its own match ids
+    goals = catalog.union(catalog.TOP5_2015_16)
+    # int64, the match ids of the copies leave the int32 range of the dataset from about 500x
+    match_id = goals['match_id'].astype(np.int64)
+    offset = int(match_id.max()) + 1
+    return pd.concat([goals.assign(match_id=match_id + copy * offset) for copy in range(scale)],
+                     ignore_index=True)
+
+
+def n_matches(scale):
+    return scale * catalog.match_counts(catalog.TOP5_2015_16)['n_matches']
+
+
+#### Benchmark cases: setup(scale) prepares the inputs outside of the timing, run(inputs) is timed ####
+
+def setup_extract_goals(scale):
+    matches, events_per_match = synthetic_events(BATCH_MATCHES, tournament=False)
+    events = pd.concat([events.reindex(columns=EVENT_COLUMNS).assign(match_id=match_id)
+                        for match_id, events in events_per_match], ignore_index=True)
+    # one events frame per batch would not fit into memory at 1000x, so the same batch is extracted repeatedly
+    sizes = [BATCH_MATCHES] * (n_matches(scale) // BATCH_MATCHES)
+    if n_matches(scale) % BATCH_MATCHES:
+        sizes.append(n_matches(scale) % BATCH_MATCHES)
+    batches = {size: events[events['match_id'].isin(matches['match_id'][:size])] for size in set(sizes)}
+    return matches, batches, sizes
+
+
+def run_extract_goals(inputs):
+    matches, batches, sizes = inputs
+    return sum(len(extract_goals(batches[size], matches)) for size in sizes)
+
+
+def setup_goals(scale):
+    return scaled_goals(scale)
+
+
+def run_adjusted_goal_time(goals):
+    return adjusted_goal_time(goals['period'], goals['goal_time'])
+
+
+def run_adjust_minutes_apply(goals):
+    # the row-wise function the scripts used before the lookup table, kept as a reference
+    return goals.apply(adjust_minutes, axis=1)
+
+
+def setup_minute_counts(scale):
+    return scaled_goals(scale), n_matches(scale)
+
+
+def run_minute_counts(inputs):
+    goals, matches = inputs
+    return MinuteCounts(goals, matches)
+
+
+def setup_update_histogram(scale):
+    # the histograms of the update_histogram callbacks: all bin widths, sides and weightings
+    return MinuteCounts(scaled_goals(scale), n_matches(scale))
+
+
+def run_update_histogram(counts):
+    for bin_width in [1, 3, 5, 15, 45]:
+        bin_edges = app_bin_edges(bin_width)[2]
+        for sides in [None, [HOME], [AWAY]]:
+            for weighted in [False, True]:
+                counts.histogram(bin_edges, sides=sides, weighted=weighted)
+
+
+def setup_update_histogram_figure(scale):
+    # the update_histogram callback of the main app on a figure cache miss, with the counts of the scale for
+    # every league; imported here, as the app builds its figure cache at import
+    import interactive_histogram
+    counts = MinuteCounts(scaled_goals(scale), n_matches(scale))
+    interactive_histogram.league_counts.update({league: counts for league in interactive_histogram.league_counts})
+    return interactive_histogram.build_histogram
+
+
+def run_update_histogram_figure(build_histogram):
+    # the figures of all bin widths and weightings, serialized to the JSON Dash sends to the browser
+    for bin_width in [1, 3, 5, 15, 45]:
+        for weight_toggle in ['weighted', 'not_weighted']:
+            build_histogram('England', bin_width, weight_toggle).to_json()
+
+
+def setup_rate_test_matrix(scale):
+    return scaled_goals(scale), n_matches(scale), period_intervals(1, periods=(1, 2))
+
+
+def run_rate_test_matrix(inputs):
+    goals, matches, intervals = inputs
+    counts = interval_counts(goals['period'], goals['goal_time'], intervals)
+    return pairwise_rate_tests(counts, matches * (intervals[:, 2] - intervals[:, 1]), 'holm')
+
+
+def run_exact_rate_test_matrix(inputs):
+    goals, matches, intervals = inputs
+    counts = interval_counts(goals['period'], goals['goal_time'], intervals)
+    return pairwise_rate_tests(counts, matches * (intervals[:, 2] - intervals[:, 1]), 'holm', test='exact')
+
+
+def setup_mannwhitneyu(scale):
+    goals = scaled_goals(scale)
+    return goals[goals['home'] == HOME]['goal_time'].to_numpy(), goals[goals['home'] == AWAY]['goal_time'].to_numpy()
+
+
+def run_mannwhitneyu(inputs):
+    return mannwhitneyu(*inputs, alternative='two-sided')
+
+
+# name -> (setup, run, largest scale the case is run at)
+CASES = {
+    'extract_goals': (setup_extract_goals, run_extract_goals, 1000),
+    'adjusted_goal_time': (setup_goals, run_adjusted_goal_time, 1000),
+    'adjust_minutes_apply': (setup_goals, run_adjust_minutes_apply, 10),
+    'minute_counts': (setup_minute_counts, run_minute_counts, 1000),
+    'update_histogram': (setup_update_histogram, run_update_histogram, 1000),
+    'update_histogram_figure': (setup_update_histogram_figure, run_update_histogram_figure, 1000),
+    'rate_test_matrix': (setup_rate_test_matrix, run_rate_test_matrix, 1000),
+    'exact_rate_test_matrix': (setup_rate_test_matrix, run_exact_rate_test_matrix, 1000),
+    'mannwhitneyu': (setup_mannwhitneyu, run_mannwhitneyu, 1000),
+}
+
+
+def measure(run, inputs):
+    """
+    Wall time and peak memory of run(inputs).
+
+    Returns:
+    Dictionary with the best wall time in seconds over the repeats, the number of repeats and the peak
+    memory allocated during one run in MiB (traced in a separate run, tracing slows the code down).
+    """
+    timings = []
+    start = time.perf_counter()
+    while len(timings) < 2 or time.perf_counter() - start < MIN_SECONDS:
+        t = time.perf_counter()
+        run(inputs)
+        timings.append(time.perf_counter() - t)
+
+    tracemalloc.start()
+    run(inputs)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {'seconds': min(timings), 'repeat': len(timings), 'peak_mib': peak / 1024**2}
+
+
+def run_benchmarks(names, scales):
+    results = {}
+    for name in names:
+        setup, run, max_scale = CASES[name]
+        results[name] = {}
+        for scale in scales:
+            if scale > max_scale:
+                print(f"{name:24s} {scale:5d}x  skipped (run up to {max_scale}x)")
+                continue
+            result = measure(run, setup(scale))
+            results[name][str(scale)] = result
+            print(f"{name:24s} {scale:5d}x  {1e3 * result['seconds']:10.2f}ms  {result['peak_mib']:9.1f}MiB peak")
+    return results
+
+
+def metadata():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ''
+    return {
+        'commit': commit,
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'machine': platform.platform(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def compare(baseline, current, threshold):
+    """
+    Print the ratio of the wall times and peak memory of two runs, marking changes beyond threshold.
+
+    Returns:
+    Number of regressions (slower or larger by more than the threshold factor, and by more than
+    MIN_SECONDS_DIFFERENCE or MIN_MIB_DIFFERENCE).
+    """
+    regressions = 0
+    print(f"baseline {baseline['meta']['commit']} ({baseline['meta']['date']}) -> "
+          f"current {current['meta']['commit']} ({current['meta']['date']})")
+    for name, scales in current['results'].items():
+        for scale, result in scales.items():
+            before = baseline['results'].get(name, {}).get(scale)
+            if before is None:
+                continue
+            time_ratio = result['seconds'] / before['seconds']
+            memory_ratio = (result['peak_mib'] + 1e-3) / (before['peak_mib'] + 1e-3)
+            slower = time_ratio > threshold and result['seconds'] - before['seconds'] > MIN_SECONDS_DIFFERENCE
+            larger = memory_ratio > threshold and result['peak_mib'] - before['peak_mib'] > MIN_MIB_DIFFERENCE
+            marks = []
+            if slower or larger:
+                marks.append('REGRESSION')
+                regressions += 1
+            elif time_ratio < 1 / threshold and before['seconds'] - result['seconds'] > MIN_SECONDS_DIFFERENCE:
+                marks.append('faster')
+            print(f"{name:24s} {scale:>5s}x  time {time_ratio:6.2f}x  memory {memory_ratio:6.2f}x  {' '.join(marks)}")
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline on 1x to 1000x the five 2015/16 leagues.")
+    parser.add_argument('--cases', nargs='+', default=list(CASES), choices=list(CASES))
+    parser.add_argument('--scales', nargs='+', type=int, default=SCALES)
+    parser.add_argument('--save', help="name of the result file in benchmarks/results, e.g. the commit")
+    parser.add_argument('--compare', nargs='+', metavar='RESULT',
+                        help="compare two saved results, or one saved result with this run")
+    parser.add_argument('--threshold', type=float, default=1.25, help="ratio reported as a regression")
+    args = parser.parse_args()
+
+    def load(name):
+        path = name if os.path.exists(name) else os.path.join(RESULTS_DIR, f"{name}.json")
+        with open(path) as f:
+            return json.load(f)
+
+    if args.compare and len(args.compare) == 2:
+        sys.exit(1 if compare(load(args.compare[0]), load(args.compare[1]), args.threshold) else 0)
+
+    current = {'meta': metadata(), 'results': run_benchmarks(args.cases, args.scales)}
+    if args.save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        with open(os.path.join(RESULTS_DIR, f"{args.save}.json"), 'w') as f:
+            json.dump(current, f, indent=1)
+    if args.compare:
+        sys.exit(1 if compare(load(args.compare[0]), current, args.threshold) else 0)
@@ -0,0 +1,194 @@
+import os
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+import dataset
+import metrics
+from aggregates import GoalAggregate
+
+# Folder holding the goals_competition{X}_season{Y}.csv files written by ingestion.py, and the parquet
+# dataset in its goal_dataset subfolder. GOALS_DATA_DIR points the apps and scripts to another folder,
+# e.g. to the synthetic datasets of synthetic_data.py.
+DATA_DIR = os.environ.get('GOALS_DATA_DIR', os.path.dirname(os.path.abspath(__file__)))
+DATASET_DIR = os.path.join(DATA_DIR, 'goal_dataset')
+
+# Every dataset of the project: (competition_id, season_id) -> description.
+# Adding a competition only needs a new entry here (and a group below if it belongs to one).
+CATALOG = {
+    (2, 27): {'name': 'England', 'kind': 'league', 'season': '2015/2016'},
+    (9, 27): {'name': 'Germany', 'kind': 'league', 'season': '2015/2016'},
+    (11, 27): {'name': 'Spain', 'kind': 'league', 'season': '2015/2016'},
+    (7, 27): {'name': 'France', 'kind': 'league', 'season': '2015/2016'},
+    (12, 27): {'name': 'Italy', 'kind': 'league', 'season': '2015/2016'},
+    (43, 106): {'name': 'World Cup 2022', 'kind': 'tournament', 'season': '2022'},
+    (43, 3): {'name': 'World Cup 2018', 'kind': 'tournament', 'season': '2018'},
+    (55, 43): {'name': 'Euro 2020', 'kind': 'tournament', 'season': '2020'},
+}
+
+# Groups of datasets that are analysed together
+TOP5_2015_16 = [(2, 27), (9, 27), (11, 27), (7, 27), (12, 27)]
+TOURNAMENTS = [key for key, entry in CATALOG.items() if entry['kind'] == 'tournament']
+
+# League name -> key, for the league selectors of the interactive apps
+LEAGUES = {CATALOG[key]['name']: key for key in TOP5_2015_16}
+
+# Loaded datasets and unions are kept in memory up to this many bytes, least recently used ones are dropped
+MAX_CACHE_BYTES = 256 * 1024**2
+
+_cache = OrderedDict()
+_cache_bytes = 0
+_cache_hits = 0
+_cache_misses = 0
+_aggregates = {}
+_lock = threading.Lock()
+
+
+def csv_path(competition_id, season_id):
+    return os.path.join(DATA_DIR, f"goals_competition{competition_id}_season{season_id}.csv")
+
+
+def _load(competition_id, season_id):
+    # prefer the parquet dataset, unless the csv has been rewritten since it was converted
+    csv_name = csv_path(competition_id, season_id)
+    parquet_name = dataset.partition_path(competition_id, season_id, DATASET_DIR)
+    if os.path.exists(parquet_name) and (not os.path.exists(csv_name)
+                                         or os.path.getmtime(parquet_name) >= os.path.getmtime(csv_name)):
+        return dataset.load_goals(competition_id, season_id, root=DATASET_DIR)
+    goals_df = pd.read_csv(csv_name)
+    return goals_df.astype({column: dtype for column, dtype in dataset.DTYPES.items() if column in goals_df.columns})
+
+
+def _cached(key, load):
+    global _cache_bytes, _cache_hits, _cache_misses
+    with _lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            _cache_hits += 1
+            return _cache[key]
+        _cache_misses += 1
+
+    goals_df = load()
+    size = int(goals_df.memory_usage(deep=True).sum())
+    with _lock:
+        if key not in _cache:
+            _cache[key] = goals_df
+            _cache_bytes += size
+            # evict the least recently used frames, but always keep the one just loaded
+            while _cache_bytes > MAX_CACHE_BYTES and len(_cache) > 1:
+                _, evicted = _cache.popitem(last=False)
+                _cache_bytes -= int(evicted.memory_usage(deep=True).sum())
+        return _cache[key]
+
+
+def get(competition_id, season_id):
+    """
+    Goals of one competition and season, loaded on first access and then served from memory.
+
+    Returns:
+    DataFrame in the csv layout. It is a shallow copy of the cached frame, so adding
+    columns to it does not change the cache.
+    """
+    key = (competition_id, season_id)
+    if key not in CATALOG:
+        raise KeyError(f"competition {competition_id}, season {season_id} is not in the catalog")
+    return _cached(key, lambda: _load(competition_id, season_id)).copy(deep=False)
+
+
+def union(keys):
+    """
+    Goals of several competitions and seasons in one frame, e.g. union(TOP5_2015_16).
+    The concatenation is cached as well, so repeated calls do not concatenate again.
+
+    keys: list of (competition_id, season_id) pairs
+    """
+    keys = tuple(keys)
+    goals_df = _cached(('union',) + keys, lambda: pd.concat([get(*key) for key in keys], ignore_index=True))
+    return goals_df.copy(deep=False)
+
+
+def match_counts(keys):
+    """
+    Number of matches of several competitions and seasons.
+
+    Returns:
+    Dictionary with the summed n_matches (leagues), n_matches_group, n_matches_ko and
+    n_matches_ET (tournaments) of the datasets having the respective columns. A dataset without
+    goals counts the constants of its df.attrs (see dataset.load_goals), or zero matches.
+    """
+    counts = {}
+    for key in keys:
+        goals_df = get(*key)
+        for column in ['n_matches', 'n_matches_group', 'n_matches_ko']:
+            if column in goals_df.columns:
+                value = int(goals_df[column].iloc[0]) if len(goals_df) else goals_df.attrs.get(column, 0)
+                counts[column] = counts.get(column, 0) + value
+        if 'n_matches_ET' in goals_df.columns:
+            # running count, the last row holds the total
+            value = int(goals_df['n_matches_ET'].iloc[-1]) if len(goals_df) else 0
+            counts['n_matches_ET'] = counts.get('n_matches_ET', 0) + value
+    return counts
+
+
+def _dataset_aggregate(key, stage):
+    goals_df = get(*key)
+    if CATALOG[key]['kind'] == 'league':
+        return GoalAggregate.from_goals(goals_df, match_counts([key])['n_matches'])
+    counts = match_counts([key])
+    group_stage = (goals_df['stage'] == 'Group Stage').to_numpy()
+    group = GoalAggregate.from_goals(goals_df[group_stage], counts['n_matches_group'])
+    # all matches going to extra-time are knockout matches
+    knockout = GoalAggregate.from_goals(goals_df[~group_stage], counts['n_matches_ko'], counts.get('n_matches_ET', 0))
+    return {'group': group, 'knockout': knockout, None: group + knockout}[stage]
+
+
+def aggregate(keys, stage=None):
+    """
+    Goal counts per side, period and minute of several competitions and seasons, see aggregates.py.
+    The aggregate of each dataset is built once, a union of datasets is then a merge of small arrays.
+
+    keys: list of (competition_id, season_id) pairs
+    stage: None for all matches, or 'group' or 'knockout' for the matches of that tournament stage
+
+    Returns:
+    A new GoalAggregate, so updating it does not change the cached ones.
+    """
+    merged = GoalAggregate()
+    for key in keys:
+        with _lock:
+            cached = _aggregates.get((key, stage))
+        if cached is None:
+            cached = _dataset_aggregate(key, stage)
+            with _lock:
+                _aggregates[(key, stage)] = cached
+        merged = merged + cached
+    return merged
+
+
+def freeze():
+    """
+    Make the cached aggregates read-only before the process forks, e.g. in the master of gunicorn
+    --preload (see gunicorn.conf.py), so the workers share them instead of copying them on a write.
+    """
+    with _lock:
+        for cached in _aggregates.values():
+            cached.freeze()
+
+
+def cache_info():
+    with _lock:
+        lookups = _cache_hits + _cache_misses
+        return {'entries': len(_cache), 'bytes': _cache_bytes, 'max_bytes': MAX_CACHE_BYTES, 'hits': _cache_hits,
+                'misses': _cache_misses, 'hit_rate': _cache_hits / lookups if lookups else 0.0}
+
+
+metrics.register_collector('catalog', cache_info)
+
+
+def clear_cache():
+    global _cache_bytes
+    with _lock:
+        _cache.clear()
+        _aggregates.clear()
+        _cache_bytes = 0
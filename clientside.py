@@ -0,0 +1,132 @@
+from histogram_engine import AWAY, HOME, OTHER
+
+# Clientside version of build_histogram: rebins the per-minute counts shipped in the 'minute-counts' store
+# and builds the same figure in the browser, so changing the inputs costs no server round trip.
+# Arguments: the store data, then the selected league, bin width, weight toggle and (optional) team selector.
+REBIN_JS = """
+function(store, league, binWidth, weightToggle, teamSelector) {
+    teamSelector = teamSelector || 'both';
+    var range = function(start, stop, step) {
+        var values = [];
+        for (var value = start; value < stop; value += step) { values.push(value); }
+        return values;
+    };
+
+    // bin edges, see histogram_engine.app_bin_edges
+    var edgesH1 = range(0, 46, binWidth);
+    var edgesH2 = range(60, 105, binWidth);
+    var edges = binWidth === 1 ? range(0, 121, 1) : edgesH1.concat(edgesH2, [105, 120]);
+    var nBins = edges.length - 1;
+
+    // histogram from the prefix sums of the per-minute counts, same as np.histogram (last bin includes its right edge)
+    var data = store.leagues[league];
+    var weighted = weightToggle === 'weighted';
+    var histogram = function(sides) {
+        var nMinutes = data.counts[0].length;
+        var cumsum = [0];
+        for (var m = 0; m < nMinutes; m++) {
+            var count = 0;
+            sides.forEach(function(side) { count += data.counts[side][m]; });
+            cumsum.push(cumsum[m] + count);
+        }
+        var at = function(edge) { return cumsum[Math.max(0, Math.min(edge, nMinutes))]; };
+        var hist = [];
+        for (var i = 0; i < nBins; i++) { hist.push(at(edges[i + 1]) - at(edges[i])); }
+        hist[nBins - 1] += at(edges[nBins] + 1) - at(edges[nBins]);
+        return weighted ? hist.map(function(value) { return value / data.n_matches; }) : hist;
+    };
+
+    // hover text for each bin (showing interval, with adjustments for injury time)
+    var hoverText = [];
+    if (binWidth === 1) {
+        for (var i = 0; i < nBins; i++) {
+            var shift = i < 60 ? 0 : 15;
+            hoverText.push((edges[i] - shift) + ' - ' + (edges[i + 1] - shift));
+        }
+    } else {
+        for (var i = 0; i < edgesH1.length - 1; i++) { hoverText.push(edgesH1[i] + ' - ' + edgesH1[i + 1]); }
+        hoverText.push('45+');
+        for (var i = 0; i < edgesH2.length - 1; i++) { hoverText.push((edgesH2[i] - 15) + ' - ' + (edgesH2[i + 1] - 15)); }
+        hoverText.push((edgesH2[edgesH2.length - 1] - 15) + ' - 90');
+        hoverText.push('90+');
+    }
+
+    var bar = function(y, color, name) {
+        var trace = {
+            type: 'bar',
+            x: edges.slice(0, nBins).map(function(edge, i) { return (edge + edges[i + 1]) / 2; }),
+            y: y,
+            width: edges.slice(0, nBins).map(function(edge, i) { return edges[i + 1] - edge; }),
+            marker: {color: color},
+            hovertemplate: '<b>Interval:</b> %{text}<br><b>Count:</b> %{y}<br><extra></extra>',
+            text: hoverText
+        };
+        if (name) { trace.name = name; }
+        return trace;
+    };
+
+    var traces;
+    if (teamSelector === 'both-separate') {
+        traces = [bar(histogram([store.sides.home]), '#6096BA', 'Home Goals'),
+                  bar(histogram([store.sides.away]), '#FF6F61', 'Away Goals')];
+    } else if (teamSelector === 'home') {
+        traces = [bar(histogram([store.sides.home]), '#6096BA')];
+    } else if (teamSelector === 'away') {
+        traces = [bar(histogram([store.sides.away]), '#6096BA')];
+    } else {
+        traces = [bar(histogram([store.sides.away, store.sides.home, store.sides.other]), '#6096BA')];
+    }
+
+    // y-axis range depending on bin width and weighting, the rest of the layout is shared with the server figures
+    var yaxis;
+    if (weighted) {
+        yaxis = Object.assign({}, store.yaxis.weighted[binWidth], {title: {text: 'Goals per match'}});
+    } else {
+        var ranges = league === 'All Leagues' ? store.yaxis.total_all_leagues : store.yaxis.total;
+        yaxis = Object.assign({}, ranges[binWidth], {title: {text: 'Total Goals'}});
+    }
+    var layout = Object.assign({}, store.layout, {
+        title: {text: 'Goals Distribution - ' + league},
+        yaxis: yaxis
+    });
+    return {data: traces, layout: layout};
+}
+"""
+
+
+def shared_layout(figure):
+    """
+    Layout shared by all figures of an app (x-axis, bar mode, template), taken from a figure built by the
+    server callback so both modes look the same. The title and y-axis are set by REBIN_JS.
+
+    Returns:
+    Layout as a plain dict.
+    """
+    layout = figure.to_plotly_json()['layout']
+    return {key: value for key, value in layout.items() if key not in ('title', 'yaxis')}
+
+
+def store_data(league_counts, yaxis, yaxis_total, yaxis_total_all_leagues, layout):
+    """
+    Data of the 'minute-counts' store used by REBIN_JS: per league, the goal counts per timeline minute
+    of each side (summed over the periods) and the number of matches, plus the y-axis ranges and layout.
+
+    league_counts: dictionary league -> histogram_engine.MinuteCounts
+    yaxis, yaxis_total, yaxis_total_all_leagues: y-axis ranges per bin width, as used by the server callback
+    layout: layout shared by all figures, see shared_layout
+
+    Returns:
+    JSON-serializable dictionary, shipped to the browser once with the page.
+    """
+    return {
+        'leagues': {
+            league: {
+                'n_matches': int(counts.n_matches),
+                'counts': counts.counts.sum(axis=1).tolist(),
+            }
+            for league, counts in league_counts.items()
+        },
+        'sides': {'away': AWAY, 'home': HOME, 'other': OTHER},
+        'yaxis': {'weighted': yaxis, 'total': yaxis_total, 'total_all_leagues': yaxis_total_all_leagues},
+        'layout': layout,
+    }
@@ -0,0 +1,144 @@
+import glob
+import os
+import re
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Root of the partitioned goal dataset: <root>/competition_id=<X>/season_id=<Y>/goals.parquet
+DATASET_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'goal_dataset')
+
+# Compact dtypes of the per-goal columns
+DTYPES = {
+    'match_id': 'int32',
+    'period': 'int8',
+    'goal_time': 'int16',
+    'home': 'int8',
+    'stage': 'category',
+    'n_matches_ET': 'int32',
+    'ET_match': 'bool',
+}
+
+# Match-level constants, stored once per partition in the parquet metadata instead of on every goal row
+CONSTANT_COLUMNS = ['n_matches', 'n_matches_group', 'n_matches_ko']
+
+
+def partition_path(competition_id, season_id, root=DATASET_DIR):
+    return os.path.join(root, f"competition_id={competition_id}", f"season_id={season_id}", "goals.parquet")
+
+
+def write_goals(goals_df, competition_id, season_id, root=DATASET_DIR):
+    """
+    Write the goals of a competition and season as a partition of the dataset.
+
+    goals_df: goals in the csv layout written by make_df / make_df_tournament
+    competition_id, season_id: StatsBomb ids, used as partition keys
+    root: root folder of the dataset
+    """
+    constants = {column: str(int(goals_df[column].iloc[0])) for column in CONSTANT_COLUMNS
+                 if column in goals_df.columns and len(goals_df) > 0}
+    if len(goals_df) == 0:
+        # a frame without goals has no row to read the constants from, they are kept in df.attrs (see load_goals)
+        constants = {column: str(int(goals_df.attrs[column])) for column in CONSTANT_COLUMNS
+                     if column in goals_df.attrs}
+    goals_df = goals_df.drop(columns=[column for column in CONSTANT_COLUMNS if column in goals_df.columns])
+    goals_df = goals_df.astype({column: dtype for column, dtype in DTYPES.items() if column in goals_df.columns})
+
+    table = pa.Table.from_pandas(goals_df, preserve_index=False)
+    metadata = {**table.schema.metadata, **{key.encode(): value.encode() for key, value in constants.items()}}
+    table = table.replace_schema_metadata(metadata)
+    path = partition_path(competition_id, season_id, root)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    pq.write_table(table, path, compression='zstd')
+
+
+def convert_csvs(csv_dir=".", root=DATASET_DIR):
+    """
+    Convert all goals_competition{X}_season{Y}.csv files of a folder into dataset partitions.
+
+    Returns:
+    List of the converted (competition_id, season_id) pairs.
+    """
+    converted = []
+    for csv_name in sorted(glob.glob(os.path.join(csv_dir, "goals_competition*_season*.csv"))):
+        competition_id, season_id = map(int, re.search(r"competition(\d+)_season(\d+)\.csv$", csv_name).groups())
+        write_goals(pd.read_csv(csv_name), competition_id, season_id, root)
+        converted.append((competition_id, season_id))
+    return converted
+
+
+def read_constants(competition_id, season_id, root=DATASET_DIR):
+    """
+    Returns:
+    Dictionary with the match-level constants (n_matches, ...) of a partition, read from its metadata only.
+    """
+    metadata = pq.read_schema(partition_path(competition_id, season_id, root)).metadata or {}
+    return {column: int(metadata[column.encode()]) for column in CONSTANT_COLUMNS if column.encode() in metadata}
+
+
+def load_goals(competition_id, season_id, columns=None, memory_map=True, with_constants=True, root=DATASET_DIR):
+    """
+    Load the goals of a competition and season from the dataset.
+
+    competition_id, season_id: StatsBomb ids of the partition
+    columns: goal columns to read, None reads all of them
+    memory_map: memory-map the parquet file instead of reading it into a buffer
+    with_constants: add the match-level constants as columns, so the frame has the same layout as the csv
+    root: root folder of the dataset
+
+    Returns:
+    DataFrame of the goals. The match-level constants are also available in df.attrs.
+    """
+    path = partition_path(competition_id, season_id, root)
+    columns = None if columns is None else [column for column in columns if column not in CONSTANT_COLUMNS]
+    goals_df = pq.read_table(path, columns=columns, memory_map=memory_map).to_pandas()
+    constants = read_constants(competition_id, season_id, root)
+    goals_df.attrs.update(constants)
+    if with_constants:
+        for column, value in constants.items():
+            goals_df[column] = value
+    return goals_df
+
+
+if __name__ == '__main__':
+    # Convert the csvs of the repository and compare loading them with pd.read_csv
+    import tempfile
+    import time
+
+    csv_dir = os.path.dirname(os.path.abspath(__file__))
+    converted = convert_csvs(csv_dir)
+    print(f"converted {len(converted)} csvs into {DATASET_DIR}")
+
+    def best_of(function, repeat=20):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = function()
+            timings.append(time.perf_counter() - start)
+        return min(timings), result
+
+    for competition_id, season_id in converted:
+        csv_name = os.path.join(csv_dir, f"goals_competition{competition_id}_season{season_id}.csv")
+        t_csv, df_csv = best_of(lambda: pd.read_csv(csv_name))
+        t_pq, df_pq = best_of(lambda: load_goals(competition_id, season_id, with_constants=False))
+        t_proj, _ = best_of(lambda: load_goals(competition_id, season_id, columns=['period', 'goal_time'],
+                                               with_constants=False))
+        mem_csv = df_csv.memory_usage(deep=True).sum()
+        mem_pq = df_pq.memory_usage(deep=True).sum()
+        print(f"{competition_id:3d}/{season_id:3d}: read_csv {1000 * t_csv:5.2f}ms {mem_csv / 1024:6.1f}KiB | "
+              f"parquet {1000 * t_pq:5.2f}ms {mem_pq / 1024:6.1f}KiB | period+goal_time {1000 * t_proj:5.2f}ms")
+
+    # the csvs are tiny, so also compare a season repeated 1000 times
+    big = pd.concat([pd.read_csv(os.path.join(csv_dir, "goals_competition43_season3.csv"))] * 1000, ignore_index=True)
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_name = os.path.join(tmp, "goals_competition43_season3.csv")
+        big.to_csv(csv_name, index=False)
+        write_goals(big, 43, 3, root=tmp)
+        t_csv, df_csv = best_of(lambda: pd.read_csv(csv_name), repeat=5)
+        t_pq, df_pq = best_of(lambda: load_goals(43, 3, with_constants=False, root=tmp), repeat=5)
+        t_proj, _ = best_of(lambda: load_goals(43, 3, columns=['period', 'goal_time'], with_constants=False,
+                                               root=tmp), repeat=5)
+        print(f"x1000 : read_csv {1000 * t_csv:5.1f}ms {df_csv.memory_usage(deep=True).sum() / 1024**2:5.1f}MiB | "
+              f"parquet {1000 * t_pq:5.1f}ms {df_pq.memory_usage(deep=True).sum() / 1024**2:5.1f}MiB | "
+              f"period+goal_time {1000 * t_proj:5.1f}ms")
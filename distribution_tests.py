@@ -0,0 +1,183 @@
+import functools
+import itertools
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+from scipy.stats import kstwo
+
+import catalog
+from timeline import adjusted_goal_time
+
+# Interpolation table of the Anderson-Darling p-values for two samples (Scholz and Stephens 1987, as scipy.stats.anderson_ksamp)
+AD_SIGNIFICANCE = np.array([0.25, 0.1, 0.05, 0.025, 0.01, 0.005, 0.001])
+AD_CRITICAL = np.array([0.675, 1.281, 1.645, 1.96, 2.326, 2.573, 3.085]) \
+    + np.array([-0.245, 0.25, 0.678, 1.149, 1.822, 2.364, 3.615]) \
+    + np.array([-0.105, -0.305, -0.362, -0.391, -0.396, -0.345, -0.154])
+
+
+def minute_count_matrix(groups):
+    """
+    Goal counts per minute of every group, the only input the distribution tests need.
+
+    groups: dictionary name -> goal minutes (non-negative integers, e.g. adjusted goal times)
+
+    Returns:
+    Tuple (names, counts) with counts[g, m] the number of goals of group g in minute m.
+    """
+    names = list(groups)
+    minutes = [np.asarray(groups[name], dtype=np.int64) for name in names]
+    n_minutes = max(int(group.max(initial=-1)) for group in minutes) + 1
+    counts = np.array([np.bincount(group, minlength=n_minutes) for group in minutes]).reshape(len(names), n_minutes)
+    return names, counts
+
+
+def pairwise_ks(counts):
+    """
+    Two-sample Kolmogorov-Smirnov tests between all groups, from the ECDFs of the per-minute counts.
+
+    counts: goal counts per group and minute, see minute_count_matrix
+
+    Returns:
+    Matrices of the KS statistics and their two-sided p-values, as scipy.stats.ks_2samp with method='asymp'.
+    """
+    n = counts.sum(axis=1)
+    ecdf = np.cumsum(counts, axis=1) / n[:, None]
+    statistic = np.abs(ecdf[:, None, :] - ecdf[None, :, :]).max(axis=2)
+
+    # the exact distribution of the statistic is slow to evaluate, so only do it once per pair
+    rows, cols = np.triu_indices(len(n), 1)
+    en = np.round(n[rows] * n[cols] / (n[rows] + n[cols]))
+    p_value = np.ones_like(statistic)
+    p_value[rows, cols] = p_value[cols, rows] = kstwo.sf(statistic[rows, cols], en)
+    return statistic, p_value
+
+
+@functools.lru_cache(maxsize=None)
+def _ad_harmonics(N):
+    # sums h and g of the Anderson-Darling variance, they only depend on the pooled sample size
+    hs_cs = np.cumsum(1 / np.arange(N - 1, 1, -1))
+    return hs_cs[-1] + 1, (hs_cs / np.arange(2, N)).sum()
+
+
+def _ad_variance(n1, n2):
+    # variance of the two-sample Anderson-Darling statistic (k = 2) for sample sizes n1 and n2
+    N = n1 + n2
+    H = 1 / n1 + 1 / n2
+    h, g = _ad_harmonics(int(N))
+    k = 2
+    a = (4*g - 6) * (k - 1) + (10 - 6*g)*H
+    b = (2*g - 4)*k**2 + 8*h*k + (2*g - 14*h - 4)*H - 8*h + 4*g - 6
+    c = (6*h + 2*g - 2)*k**2 + (4*h - 4*g + 6)*k + (2*h - 6)*H + 4*h
+    d = (2*h + 6)*k**2 - 4*h*k
+    return (a*N**3 + b*N**2 + c*N + d) / ((N - 1.) * (N - 2.) * (N - 3.))
+
+
+def pairwise_ad(counts):
+    """
+    Two-sample Anderson-Darling tests between all groups (midrank version for ties), from the
+    per-minute counts of each pair instead of the sorted goals.
+
+    counts: goal counts per group and minute, see minute_count_matrix
+
+    Returns:
+    Matrices of the standardized AD statistics and their p-values, as scipy.stats.anderson_ksamp.
+    The p-values are interpolated from a table, so they are capped to [0.001, 0.25].
+    """
+    counts = counts.astype(float)
+    n = counts.sum(axis=1)
+    before = np.cumsum(counts, axis=1) - counts  # goals before each minute
+
+    # all pairs at once: [a, b, minute] for the pooled sample of groups a and b
+    N = n[:, None, None] + n[None, :, None]
+    pooled = counts[:, None, :] + counts[None, :, :]
+    B = before[:, None, :] + before[None, :, :] + pooled / 2
+    denominator = B * (N - B) - N * pooled / 4
+    weight = np.divide(pooled / N, denominator, out=np.zeros_like(denominator), where=(pooled > 0) & (denominator > 0))
+    A2 = np.zeros((len(n), len(n)))
+    for M, n_i in [(before[:, None, :] + counts[:, None, :] / 2, n[:, None, None]),
+                   (before[None, :, :] + counts[None, :, :] / 2, n[None, :, None])]:
+        A2 += (weight * (N * M - B * n_i)**2).sum(axis=2) / n_i[..., 0]
+    A2 *= (N[..., 0] - 1) / N[..., 0]
+
+    # standardize with the variance of each pair of sample sizes, computed once per pair
+    variance = np.ones_like(A2)
+    for i, j in itertools.combinations(range(len(n)), 2):
+        variance[i, j] = variance[j, i] = _ad_variance(n[i], n[j])
+    statistic = (A2 - 1) / np.sqrt(variance)
+
+    fit = np.polyfit(AD_CRITICAL, np.log(AD_SIGNIFICANCE), 2)
+    p_value = np.exp(np.polyval(fit, statistic))
+    p_value = np.where(statistic < AD_CRITICAL.min(), AD_SIGNIFICANCE.max(), p_value)
+    p_value = np.where(statistic > AD_CRITICAL.max(), AD_SIGNIFICANCE.min(), p_value)
+    return statistic, p_value
+
+
+def compare_distributions(groups):
+    """
+    KS and Anderson-Darling tests between every pair of groups of goal minutes.
+
+    groups: dictionary name -> goal minutes (non-negative integers)
+
+    Returns:
+    DataFrame with one row per pair: group_a, group_b, their number of goals n_a, n_b and the
+    ks_statistic, ks_p_value, ad_statistic and ad_p_value.
+    """
+    names, counts = minute_count_matrix(groups)
+    ks_statistic, ks_p_value = pairwise_ks(counts)
+    ad_statistic, ad_p_value = pairwise_ad(counts)
+    n = counts.sum(axis=1)
+    rows, cols = np.triu_indices(len(names), 1)
+    return pd.DataFrame({
+        'group_a': [names[i] for i in rows],
+        'group_b': [names[j] for j in cols],
+        'n_a': n[rows],
+        'n_b': n[cols],
+        'ks_statistic': ks_statistic[rows, cols],
+        'ks_p_value': ks_p_value[rows, cols],
+        'ad_statistic': ad_statistic[rows, cols],
+        'ad_p_value': ad_p_value[rows, cols],
+    })
+
+
+def plot_heatmap(table, column='ks_p_value', title=None, filename=None):
+    """
+    Heatmap of one column of the compare_distributions table over all pairs of groups.
+
+    column: column of the table to show, e.g. 'ks_statistic' or 'ad_p_value'
+    filename: if given, the figure is saved there
+    """
+    names = list(dict.fromkeys(list(table['group_a']) + list(table['group_b'])))
+    index = {name: i for i, name in enumerate(names)}
+    matrix = np.full((len(names), len(names)), np.nan)
+    matrix[table['group_a'].map(index), table['group_b'].map(index)] = table[column]
+    matrix[table['group_b'].map(index), table['group_a'].map(index)] = table[column]
+
+    plt.figure(figsize=(10, 8))
+    plt.style.use('dark_background')
+    plt.imshow(matrix, cmap='viridis')
+    plt.colorbar(label=column)
+    plt.xticks(range(len(names)), names, rotation=45, ha='right')
+    plt.yticks(range(len(names)), names)
+    plt.title(title or f'Pairwise comparison of goal-minute distributions ({column})')
+    plt.tight_layout()
+    if filename:
+        plt.savefig(filename)
+
+
+if __name__ == '__main__':
+    # every league, and the group stage and knockout matches of every tournament
+    groups = {}
+    for key, entry in catalog.CATALOG.items():
+        goals_df = catalog.get(*key)
+        minutes = adjusted_goal_time(goals_df['period'], goals_df['goal_time'])
+        if entry['kind'] == 'league':
+            groups[f"{entry['name']} {entry['season']}"] = minutes
+        else:
+            group_stage = (goals_df['stage'] == 'Group Stage').to_numpy()
+            groups[f"{entry['name']} group"] = minutes[group_stage]
+            groups[f"{entry['name']} knockout"] = minutes[~group_stage]
+
+    table = compare_distributions(groups)
+    print(table.sort_values('ks_p_value').to_string(index=False))
+    plot_heatmap(table, 'ks_p_value', filename='distribution_tests.png')
@@ -0,0 +1,230 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+
+from plotly.utils import PlotlyJSONEncoder
+
+INDEX_NAME = 'index.json'
+SEPARATOR = '|'  # between the inputs of a state in the keys of the index
+
+# Figures are named by the hash of their content and never change, the index tells which one a state uses
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'public, max-age=60, must-revalidate'
+
+
+def state_key(*inputs):
+    # e.g. ('England', 15, 'weighted', 'both') -> 'England|15|weighted|both'
+    return SEPARATOR.join(str(value) for value in inputs)
+
+
+def export_bundle(build, states, out_dir):
+    """
+    Precompute the figure of every state of an app into a bundle: one gzip-compressed JSON file per
+    distinct figure, named by the hash of its content, and an index mapping each state to its file.
+    The files are written deterministically, so an unchanged figure keeps its name and its cached copies.
+
+    build: function taking the inputs of a state and returning a plotly Figure, e.g. build_histogram
+    states: iterable of input tuples, e.g. itertools.product of all options
+    out_dir: folder of the bundle, files of figures that are no longer used are removed
+
+    Returns:
+    The index: dictionary with the bundle version (hash of the index) and state key -> file name.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    figures = {}
+    for state in states:
+        content = json.dumps(build(*state).to_plotly_json(), cls=PlotlyJSONEncoder, sort_keys=True,
+                             separators=(',', ':')).encode()
+        name = hashlib.sha256(content).hexdigest()[:16] + '.json.gz'
+        path = os.path.join(out_dir, name)
+        if not os.path.exists(path):
+            # mtime=0 keeps the compressed bytes independent of the time of the export
+            with open(f"{path}.tmp", 'wb') as f:
+                f.write(gzip.compress(content, compresslevel=9, mtime=0))
+            os.replace(f"{path}.tmp", path)
+        figures[state_key(*state)] = name
+
+    index = {'version': hashlib.sha256(json.dumps(figures, sort_keys=True).encode()).hexdigest()[:16],
+             'figures': figures}
+    with open(os.path.join(out_dir, f"{INDEX_NAME}.tmp"), 'w') as f:
+        json.dump(index, f, indent=1, sort_keys=True)
+    os.replace(os.path.join(out_dir, f"{INDEX_NAME}.tmp"), os.path.join(out_dir, INDEX_NAME))
+
+    for name in set(os.listdir(out_dir)) - set(figures.values()) - {INDEX_NAME}:
+        if name.endswith('.json.gz'):
+            os.remove(os.path.join(out_dir, name))
+    return index
+
+
+class FigureBundle:
+    """
+    Figures of an exported bundle (see export_bundle), a drop-in replacement of FigureCache for the app
+    callbacks: a callback becomes the lookup of a precomputed file and costs no figure build.
+
+    path: folder of the bundle
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, INDEX_NAME)) as f:
+            self.index = json.load(f)
+        self.version = self.index['version']
+        self.hits = 0
+        self.misses = 0
+        self.seconds = 0.0
+        self._figures = {}  # file name -> figure dict, decoded on first use
+        self._lock = threading.Lock()
+
+    def get(self, *inputs):
+        """
+        Returns:
+        The figure of the state as a plain dict, ready to be returned by a Dash callback.
+        """
+        start = time.perf_counter()
+        name = self.index['figures'][state_key(*inputs)]
+        figure = self._figures.get(name)
+        if figure is None:
+            figure = json.loads(self.read(name))
+            with self._lock:
+                self._figures[name] = figure
+                self.misses += 1
+                self.seconds += time.perf_counter() - start
+            return figure
+        with self._lock:
+            self.hits += 1
+            self.seconds += time.perf_counter() - start
+        return figure
+
+    def read(self, name):
+        # decompressed JSON of a figure file
+        with open(os.path.join(self.path, name), 'rb') as f:
+            return gzip.decompress(f.read())
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'mean_ms': 1000 * self.seconds / lookups if lookups else 0.0,
+                'size': len(self._figures),
+                'figures': len(set(self.index['figures'].values())),
+            }
+
+    def add_routes(self, server, prefix='/figures'):
+        """
+        Serve the bundle as static files on the Flask server of a Dash app: the compressed figure files
+        with a year of immutable caching (a CDN or HTTP cache in front holds them for the whole launch),
+        and the index with a short one. Clients that do not accept gzip get the decompressed JSON.
+        """
+        from flask import abort, request
+
+        def index_route():
+            with open(os.path.join(self.path, INDEX_NAME), 'rb') as f:
+                return f.read(), 200, {'Content-Type': 'application/json', 'Cache-Control': REVALIDATE,
+                                       'ETag': f'"{self.version}"'}
+
+        def figure_route(name):
+            if name not in set(self.index['figures'].values()):
+                abort(404)
+            headers = {'Content-Type': 'application/json', 'Cache-Control': IMMUTABLE, 'ETag': f'"{name}"',
+                       'Vary': 'Accept-Encoding'}
+            if 'gzip' in request.headers.get('Accept-Encoding', ''):
+                with open(os.path.join(self.path, name), 'rb') as f:
+                    return f.read(), 200, {**headers, 'Content-Encoding': 'gzip'}
+            return self.read(name), 200, headers
+
+        server.add_url_rule(f'{prefix}/{INDEX_NAME}', 'figure_bundle_index', index_route)
+        server.add_url_rule(f'{prefix}/<name>', 'figure_bundle_figure', figure_route)
+
+
+# Plain page showing the figures of a bundle with plotly.js, without any server code: it can be published
+# with the bundle on any static host or CDN. Options: JSON list of [input id, label, [[value, label], ...]].
+STATIC_PAGE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<script src="https://cdn.plot.ly/plotly-2.32.0.min.js"></script>
+</head>
+<body>
+<div id="graph"></div>
+<p id="error" style="color: #b00020"></p>
+<div id="controls"></div>
+<script>
+var options = {options};
+var index = null;
+
+// the figure files are gzip-compressed JSON, decompressed in the browser so any static host can serve them
+function loadFigure(name) {{
+    return fetch(name).then(function(response) {{
+        if (response.headers.get('Content-Encoding') === 'gzip') {{
+            return response.json();
+        }}
+        if (!window.DecompressionStream) {{
+            throw new Error('this browser cannot decompress the figures (no DecompressionStream), ' +
+                            'serve the bundle with Content-Encoding: gzip or use a newer browser');
+        }}
+        return new Response(response.body.pipeThrough(new DecompressionStream('gzip'))).json();
+    }});
+}}
+
+function update() {{
+    var key = options.map(function(option) {{
+        return document.querySelector('input[name="' + option[0] + '"]:checked').value;
+    }}).join('{separator}');
+    loadFigure(index.figures[key]).then(function(figure) {{
+        document.getElementById('error').textContent = '';
+        Plotly.react('graph', figure.data, figure.layout);
+    }}).catch(function(error) {{
+        document.getElementById('error').textContent = 'The figure could not be loaded: ' + error.message;
+    }});
+}}
+
+options.forEach(function(option, i) {{
+    var group = document.createElement('p');
+    group.appendChild(document.createTextNode(option[1] + ' '));
+    option[2].forEach(function(choice, j) {{
+        var label = document.createElement('label');
+        var input = document.createElement('input');
+        input.type = 'radio';
+        input.name = option[0];
+        input.value = choice[0];
+        input.checked = j === 0;
+        input.onchange = update;
+        label.appendChild(input);
+        label.appendChild(document.createTextNode(choice[1] + ' '));
+        group.appendChild(label);
+    }});
+    document.getElementById('controls').appendChild(group);
+}});
+
+fetch('{index}').then(function(response) {{ return response.json(); }}).then(function(data) {{
+    index = data;
+    update();
+}});
+</script>
+</body>
+</html>
+"""
+
+
+def write_static_page(out_dir, options, title='Goals Distribution'):
+    """
+    Write index.html next to the bundle, a static page switching between the precomputed figures.
+
+    options: list of (input name, label, [(value, label), ...]) in the order of the state inputs,
+        the first value of each input is selected at the start
+
+    Returns:
+    Path of the page.
+    """
+    page = STATIC_PAGE.format(title=title, options=json.dumps(options), separator=SEPARATOR, index=INDEX_NAME)
+    path = os.path.join(out_dir, 'index.html')
+    with open(path, 'w') as f:
+        f.write(page)
+    return path
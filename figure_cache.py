@@ -0,0 +1,87 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from plotly.utils import PlotlyJSONEncoder
+
+
+class FigureCache:
+    """
+    Bounded LRU cache of Plotly figures as JSON-ready dicts (plain lists and numbers, no numpy arrays, so
+    Dash encodes a hit without converting the arrays again), keyed by the inputs of a Dash callback.
+
+    The inputs of the interactive apps are a handful of discrete options, so every figure can be built
+    once and then served from memory. The builder must not have side effects, then a cached figure is
+    always identical to a freshly built one.
+
+    build: function taking the callback inputs and returning a plotly Figure
+    maxsize: maximal number of cached figures, the least recently used one is dropped first
+    """
+
+    def __init__(self, build, maxsize=256):
+        self.build = build
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.hit_seconds = 0.0
+        self.miss_seconds = 0.0
+        self._figures = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, *key):
+        """
+        Returns:
+        The figure for the inputs key as a plain dict, ready to be returned by a Dash callback. The dict
+        is shared by all callers of the key and must not be modified.
+        """
+        start = time.perf_counter()
+        with self._lock:
+            figure = self._figures.get(key)
+            if figure is not None:
+                self._figures.move_to_end(key)
+                self.hits += 1
+                self.hit_seconds += time.perf_counter() - start
+                return figure
+
+        # build outside of the lock, so slow builds do not block hits of other requests; the JSON round trip,
+        # as in figure_bundle.export_bundle, turns the numpy arrays into lists once instead of on every hit
+        figure = json.loads(json.dumps(self.build(*key).to_plotly_json(), cls=PlotlyJSONEncoder))
+        with self._lock:
+            self._figures[key] = figure
+            self._figures.move_to_end(key)
+            while len(self._figures) > self.maxsize:
+                self._figures.popitem(last=False)
+                self.evictions += 1
+            self.misses += 1
+            self.miss_seconds += time.perf_counter() - start
+        return figure
+
+    def warm_up(self, keys):
+        # build the figures of all given input combinations, e.g. itertools.product of all options
+        for key in keys:
+            self.get(*key)
+
+    def stats(self):
+        """
+        Returns:
+        Dictionary with the number of hits, misses and evictions, the hit rate, the mean latency
+        of hits and misses in milliseconds and the number of cached figures.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'mean_hit_ms': 1000 * self.hit_seconds / self.hits if self.hits else 0.0,
+                'mean_miss_ms': 1000 * self.miss_seconds / self.misses if self.misses else 0.0,
+                'size': len(self._figures),
+                'maxsize': self.maxsize,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._figures.clear()
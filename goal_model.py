@@ -0,0 +1,190 @@
+import time
+
+import numpy as np
+import pandas as pd
+from scipy.stats import norm
+
+import catalog
+from histogram_engine import AWAY, HOME
+from rate_tests import PERIOD_MINUTES, interval_counts, period_intervals
+from timeline import adjusted_goal_time
+
+# Covariates of the model: categorical ones get one indicator per level except the first,
+# the others are 0/1 indicators already
+CATEGORICAL_TERMS = ['segment', 'league']
+DEFAULT_TERMS = ['segment', 'second_half', 'extra_time', 'home', 'league', 'knockout']
+
+
+def goal_cells(keys=None, segment_width=15):
+    """
+    Goals and exposure of every cell of the model: one cell per competition, side, stage, period and
+    minute segment. The exposure is the number of team-matches times the minutes of the segment, so the
+    model intensity is goals per team and minute. Only the regular time of each period is used, the
+    length of the stoppage time is not known.
+
+    keys: (competition_id, season_id) pairs of the catalog, default all of them
+    segment_width: length of the minute segments
+
+    Returns:
+    DataFrame with one row per cell: league, side, period, start, stop (goal minutes), the covariates
+    segment, second_half, extra_time, home, knockout and the goals and exposure.
+    """
+    keys = list(catalog.CATALOG) if keys is None else keys
+    frames = []
+    for key in keys:
+        entry = catalog.CATALOG[key]
+        goals_df = catalog.get(*key)
+        counts = catalog.match_counts([key])
+        if entry['kind'] == 'league':
+            # one team per side and match
+            strata = [('home', goals_df['home'] == HOME, counts['n_matches'], 1, False, (1, 2)),
+                      ('away', goals_df['home'] == AWAY, counts['n_matches'], 1, False, (1, 2))]
+        else:
+            # neutral venues: both teams of a match share the cell
+            group_stage = goals_df['stage'] == 'Group Stage'
+            strata = [('neutral', group_stage, counts['n_matches_group'], 2, False, (1, 2)),
+                      ('neutral', ~group_stage, counts['n_matches_ko'], 2, True, (1, 2)),
+                      ('neutral', ~group_stage, counts.get('n_matches_ET', 0), 2, True, (3, 4))]
+
+        for side, selected, n_matches, n_teams, knockout, periods in strata:
+            intervals = period_intervals(segment_width, periods=periods)
+            goals = goals_df[selected.to_numpy()]
+            cells = pd.DataFrame(intervals, columns=['period', 'start', 'stop'])
+            cells['goals'] = interval_counts(goals['period'], goals['goal_time'], intervals)
+            cells['exposure'] = float(n_matches * n_teams) * (cells['stop'] - cells['start'])
+            cells['league'] = entry['name']
+            cells['side'] = side
+            cells['knockout'] = int(knockout)
+            frames.append(cells)
+
+    cells = pd.concat(frames, ignore_index=True)
+    cells = cells[cells['exposure'] > 0].reset_index(drop=True)
+    period_start = cells['period'].map({period: first for period, (first, last) in PERIOD_MINUTES.items()})
+    cells['segment'] = (cells['start'] - period_start) // segment_width
+    cells['second_half'] = cells['period'].isin([2, 4]).astype(int)
+    cells['extra_time'] = cells['period'].isin([3, 4]).astype(int)
+    cells['home'] = (cells['side'] == 'home').astype(int)
+    return cells
+
+
+def design_matrix(cells, terms=DEFAULT_TERMS):
+    """
+    Design matrix of the cells: an intercept, indicators of all levels but the first of the
+    categorical terms and the 0/1 terms as they are. Columns without variation are dropped.
+
+    Returns:
+    DataFrame with one column per coefficient.
+    """
+    columns = {'intercept': np.ones(len(cells))}
+    for term in terms:
+        if term in CATEGORICAL_TERMS:
+            levels = list(dict.fromkeys(cells[term]))
+            for level in levels[1:]:
+                columns[f'{term}={level}'] = (cells[term] == level).to_numpy(dtype=float)
+        else:
+            columns[term] = cells[term].to_numpy(dtype=float)
+    X = pd.DataFrame(columns, index=cells.index)
+    return X.loc[:, (X.nunique() > 1) | (X.columns == 'intercept')]
+
+
+def fit_poisson_glm(X, goals, exposure, max_iter=100, tol=1e-10):
+    """
+    Poisson regression with log link and log(exposure) offset, fitted by iteratively reweighted least
+    squares on the aggregated cells. The cost only depends on the number of cells and coefficients.
+
+    X: design matrix (DataFrame), see design_matrix
+    goals: goals of each cell
+    exposure: exposure of each cell
+
+    Returns:
+    Dictionary with the coefficient table (estimate, std_error, z, p_value, rate_ratio), the fitted
+    intensity (goals per unit of exposure) of each cell, the deviance and the number of iterations.
+    """
+    x = X.to_numpy(dtype=float)
+    y = np.asarray(goals, dtype=float)
+    offset = np.log(np.asarray(exposure, dtype=float))
+
+    # start from the overall rate
+    beta = np.zeros(x.shape[1])
+    beta[list(X.columns).index('intercept')] = np.log(y.sum() / np.exp(offset).sum())
+    for iteration in range(1, max_iter + 1):
+        eta = x @ beta + offset
+        mu = np.exp(eta)
+        working = eta - offset + (y - mu) / mu
+        information = x.T @ (mu[:, None] * x)
+        beta_new = np.linalg.solve(information, x.T @ (mu * working))
+        converged = np.max(np.abs(beta_new - beta)) < tol
+        beta = beta_new
+        if converged:
+            break
+
+    mu = np.exp(x @ beta + offset)
+    information = x.T @ (mu[:, None] * x)
+    std_error = np.sqrt(np.diag(np.linalg.inv(information)))
+    z = beta / std_error
+    with np.errstate(divide='ignore', invalid='ignore'):
+        deviance = 2 * np.sum(np.where(y > 0, y * np.log(y / mu), 0) - (y - mu))
+
+    coefficients = pd.DataFrame({
+        'estimate': beta,
+        'std_error': std_error,
+        'z': z,
+        'p_value': 2 * norm.sf(np.abs(z)),
+        'rate_ratio': np.exp(beta),
+    }, index=X.columns)
+    return {
+        'coefficients': coefficients,
+        'intensity': np.exp(x @ beta),
+        'deviance': deviance,
+        'iterations': iteration,
+    }
+
+
+def fit_goal_model(cells, terms=DEFAULT_TERMS):
+    """
+    Fit the goal intensity model on the cells of goal_cells.
+
+    Returns:
+    Dictionary of fit_poisson_glm, with the cells and their fitted 'intensity' (goals per team and
+    minute) and the fit time in seconds.
+    """
+    start = time.perf_counter()
+    X = design_matrix(cells, terms)
+    fit = fit_poisson_glm(X, cells['goals'], cells['exposure'])
+    fit['seconds'] = time.perf_counter() - start
+    fit['cells'] = cells.assign(intensity=fit.pop('intensity'))
+    return fit
+
+
+def intensity_curve(fitted_cells, league, side=None, knockout=0):
+    """
+    Fitted goal intensity of one league along the plotting timeline, e.g. to overlay on the histograms.
+
+    fitted_cells: the 'cells' of fit_goal_model
+    league: name of the league or tournament
+    side: 'home', 'away' or 'neutral', None sums the sides (total goals of a match)
+    knockout: stage of tournament matches
+
+    Returns:
+    DataFrame with the timeline start and stop of each segment and the expected goals per match and minute.
+    """
+    cells = fitted_cells[(fitted_cells['league'] == league) & (fitted_cells['knockout'] == knockout)]
+    if side is not None:
+        cells = cells[cells['side'] == side]
+    # goals per match: neutral cells hold both teams
+    n_teams = np.where(cells['side'] == 'neutral', 2, 1)
+    curve = pd.DataFrame({
+        'start': adjusted_goal_time(cells['period'], cells['start']),
+        'stop': adjusted_goal_time(cells['period'], cells['stop']),
+        'goals_per_match_minute': cells['intensity'].to_numpy() * n_teams,
+    })
+    return curve.groupby(['start', 'stop'], as_index=False).sum()
+
+
+if __name__ == '__main__':
+    for segment_width in [15, 5, 1]:
+        cells = goal_cells(segment_width=segment_width)
+        fit = fit_goal_model(cells)
+        print(f"{segment_width:2d}-minute segments: {len(cells)} cells, {len(fit['coefficients'])} coefficients, "
+              f"{fit['iterations']} iterations, {1e3 * fit['seconds']:.1f}ms, deviance {fit['deviance']:.1f}")
+    print(fit_goal_model(goal_cells(segment_width=15))['coefficients'].round(4).to_string())
@@ -0,0 +1,266 @@
+import numpy as np
+import pandas as pd
+
+import catalog
+from dataset import CONSTANT_COLUMNS, DTYPES
+from histogram_engine import OTHER
+from timeline import adjusted_goal_time
+
+NO_STAGE = -1  # stage code of the matches of leagues
+
+
+class GoalTable:
+    """
+    Goals of one or several competitions and seasons as typed NumPy arrays, a compact alternative to the
+    goal DataFrames (about 8 bytes per goal instead of a pandas row with int64 and string columns).
+
+    Per goal: match (int32 row of the match arrays), period (int8), minute (int16, the StatsBomb
+    goal_time) and side (int8 side code, OTHER for tournaments).
+    Per match: match_id (int32), dataset (int16, index into datasets), stage (int8 code into stages,
+    NO_STAGE for leagues), ET_match (bool) and n_matches_ET (int32, the running count of the csvs).
+    Per dataset: the (competition_id, season_id) key, the match counts and the column layout of its
+    frame, so to_frame gives back the frames of the catalog.
+
+    Build it with from_frame, from_catalog or concat, filter it with filter or a boolean mask.
+    """
+
+    def __init__(self, match, period, minute, side, matches, stages, datasets):
+        self.match = match
+        self.period = period
+        self.minute = minute
+        self.side = side
+        self.matches = matches  # dict of the per-match arrays
+        self.stages = stages
+        self.datasets = datasets  # list of dicts with 'key', 'counts', 'columns' and 'dtypes'
+
+    @classmethod
+    def from_frame(cls, goals_df, key=None):
+        """
+        Goals of one competition and season, in the csv layout of make_df / make_df_tournament (or of
+        dataset.load_goals, the match counts are then read from df.attrs).
+
+        key: (competition_id, season_id) of the dataset, kept for to_frame and filter
+        """
+        match_id = goals_df['match_id'].to_numpy(dtype=np.int32)
+        # matches in the order of their first goal, the order the running n_matches_ET is counted in
+        unique_ids, first, match = np.unique(match_id, return_index=True, return_inverse=True)
+        order = np.argsort(first, kind='stable')
+        rank = np.empty(len(order), dtype=np.int32)
+        rank[order] = np.arange(len(order), dtype=np.int32)
+        first = first[order]
+
+        stages = []
+        stage = np.full(len(first), NO_STAGE, dtype=np.int8)
+        if 'stage' in goals_df.columns:
+            values = goals_df['stage'].to_numpy(dtype=object)[first]
+            known = pd.notna(values)
+            stages, codes = np.unique(values[known].astype(str), return_inverse=True)
+            stages = stages.tolist()
+            stage[known] = codes
+        matches = {
+            'match_id': unique_ids[order],
+            'dataset': np.zeros(len(first), dtype=np.int16),
+            'stage': stage,
+            'ET_match': goals_df['ET_match'].to_numpy(dtype=bool)[first] if 'ET_match' in goals_df.columns
+            else np.zeros(len(first), dtype=bool),
+            'n_matches_ET': goals_df['n_matches_ET'].to_numpy(dtype=np.int32)[first]
+            if 'n_matches_ET' in goals_df.columns else np.zeros(len(first), dtype=np.int32),
+        }
+
+        # constants of a frame without goals come from df.attrs, or are zero, as in catalog.match_counts
+        counts = {column: int(goals_df[column].iloc[0]) if len(goals_df) else goals_df.attrs.get(column, 0)
+                  for column in CONSTANT_COLUMNS if column in goals_df.columns}
+        counts = {**{column: value for column, value in goals_df.attrs.items() if column in CONSTANT_COLUMNS},
+                  **counts}
+        if 'n_matches_ET' in goals_df.columns:
+            counts['n_matches_ET'] = int(goals_df['n_matches_ET'].iloc[-1]) if len(goals_df) else 0
+        dataset = {'key': key, 'counts': counts, 'columns': list(goals_df.columns),
+                   'dtypes': goals_df.dtypes.to_dict()}
+
+        side = goals_df['home'].to_numpy(dtype=np.int8) if 'home' in goals_df.columns \
+            else np.full(len(goals_df), OTHER, dtype=np.int8)
+        return cls(rank[match], goals_df['period'].to_numpy(dtype=np.int8),
+                   goals_df['goal_time'].to_numpy(dtype=np.int16), side, matches, stages, [dataset])
+
+    @classmethod
+    def from_catalog(cls, keys):
+        # e.g. GoalTable.from_catalog(catalog.TOP5_2015_16), the goals of catalog.union(keys)
+        return cls.concat([cls.from_frame(catalog.get(*key), key) for key in keys])
+
+    @classmethod
+    def concat(cls, tables):
+        """
+        Goals of several tables in one, the stage dictionaries are merged and the datasets appended.
+        """
+        stages = sorted(set().union(*[table.stages for table in tables]))
+        lookup = {stage: code for code, stage in enumerate(stages)}
+        matches = {column: [] for column in tables[0].matches}
+        goal_match = []
+        n_matches = 0
+        n_datasets = 0
+        for table in tables:
+            recode = np.array([lookup[stage] for stage in table.stages] + [NO_STAGE], dtype=np.int8)
+            for column, values in table.matches.items():
+                if column == 'stage':
+                    values = recode[values]  # NO_STAGE (-1) picks the last entry, NO_STAGE again
+                elif column == 'dataset':
+                    values = values + np.int16(n_datasets)
+                matches[column].append(values)
+            goal_match.append(table.match + np.int32(n_matches))
+            n_matches += len(table.matches['match_id'])
+            n_datasets += len(table.datasets)
+        return cls(np.concatenate(goal_match), np.concatenate([table.period for table in tables]),
+                   np.concatenate([table.minute for table in tables]),
+                   np.concatenate([table.side for table in tables]),
+                   {column: np.concatenate(values) for column, values in matches.items()}, stages,
+                   [dataset for table in tables for dataset in table.datasets])
+
+    def __len__(self):
+        return len(self.match)
+
+    def __getitem__(self, rows):
+        # goals selected by a boolean mask or row indices, the match arrays are shared, not copied
+        return GoalTable(self.match[rows], self.period[rows], self.minute[rows], self.side[rows], self.matches,
+                         self.stages, self.datasets)
+
+    def mask(self, keys=None, stage=None, sides=None, periods=None, max_minute=None):
+        """
+        Boolean mask of the goals matching all given conditions, None does not filter.
+
+        keys: (competition_id, season_id) pairs of the datasets to keep
+        stage: 'group' or 'knockout', or a list of stage names, e.g. ['Final']
+        sides: side codes, e.g. [HOME]
+        periods: periods, e.g. [1, 2] for regular time
+        max_minute: keep the goals before this StatsBomb minute, e.g. 45 for the first half without stoppage time
+        """
+        mask = np.ones(len(self), dtype=bool)
+        # conditions on the matches are evaluated once per match and then looked up per goal
+        match_mask = None
+        if keys is not None:
+            keys = set(map(tuple, keys))
+            datasets = np.array([dataset['key'] in keys for dataset in self.datasets])
+            match_mask = datasets[self.matches['dataset']]
+        if stage is not None:
+            if stage in ('group', 'knockout'):
+                selected = np.zeros(len(self.matches['stage']), dtype=bool)
+                if 'Group Stage' in self.stages:
+                    selected = self.matches['stage'] == self.stages.index('Group Stage')
+                if stage == 'knockout':
+                    selected = ~selected & (self.matches['stage'] != NO_STAGE)
+            else:
+                selected = np.isin(self.matches['stage'], [self.stages.index(name) for name in stage
+                                                           if name in self.stages])
+            match_mask = selected if match_mask is None else match_mask & selected
+        if match_mask is not None:
+            mask &= match_mask[self.match]
+        if sides is not None:
+            mask &= np.isin(self.side, sides)
+        if periods is not None:
+            mask &= np.isin(self.period, periods)
+        if max_minute is not None:
+            mask &= self.minute < max_minute
+        return mask
+
+    def filter(self, **conditions):
+        # goals matching the conditions of mask, e.g. table.filter(stage='knockout', periods=[3, 4])
+        return self[self.mask(**conditions)]
+
+    def match_ids(self):
+        return self.matches['match_id'][self.match]
+
+    def adjusted_goal_time(self):
+        # minutes on the plotting timeline, see timeline.adjusted_goal_time
+        return adjusted_goal_time(self.period, self.minute).astype(np.int16)
+
+    def match_counts(self):
+        """
+        Returns:
+        Dictionary with the summed match counts of the datasets, as catalog.match_counts.
+        """
+        counts = {}
+        for dataset in self.datasets:
+            for column, value in dataset['counts'].items():
+                counts[column] = counts.get(column, 0) + value
+        return counts
+
+    def to_frame(self):
+        """
+        Goals in the layout of the goal frames: the frame of the dataset (as given to from_frame) for
+        one dataset, the concatenation of the frames of all datasets, as catalog.union, for several.
+        """
+        dataset_of_goal = self.matches['dataset'][self.match]
+        frames = []
+        for index, dataset in enumerate(self.datasets):
+            rows = dataset_of_goal == index if len(self.datasets) > 1 else slice(None)
+            match = self.match[rows]
+            columns = {
+                'match_id': self.matches['match_id'][match],
+                'period': self.period[rows],
+                'goal_time': self.minute[rows],
+                'home': self.side[rows],
+                'ET_match': self.matches['ET_match'][match],
+                'n_matches_ET': self.matches['n_matches_ET'][match],
+            }
+            if 'stage' in dataset['columns']:
+                stages = np.array(self.stages + [None], dtype=object)
+                columns['stage'] = stages[self.matches['stage'][match]]
+            for column, value in dataset['counts'].items():
+                if column != 'n_matches_ET':
+                    columns[column] = np.full(len(match), value, dtype=np.int64)
+            frame = pd.DataFrame({column: columns[column] for column in dataset['columns']})
+            frames.append(frame.astype(dataset['dtypes']))
+        if len(frames) == 1:
+            return frames[0]
+        return pd.concat(frames, ignore_index=True)
+
+    def memory_usage(self):
+        """
+        Returns:
+        Dictionary with the bytes of the goal arrays, the match arrays and in total.
+        """
+        goals = sum(array.nbytes for array in [self.match, self.period, self.minute, self.side])
+        matches = sum(array.nbytes for array in self.matches.values())
+        return {'goals': goals, 'matches': matches, 'total': goals + matches}
+
+
+def memory_report(n_goals=10_000_000, seed=0):
+    """
+    Memory of n_goals synthetic goals, spread over the datasets of the catalog, as the frames the
+    scripts work with (the csvs read with pd.read_csv, concatenated, with the adjusted_goal_time column),
+    as frames with the compact dtypes of the dataset, and as a GoalTable.
+
+    Returns:
+    Dictionary representation -> bytes, plus the number of goals.
+    """
+    from synthetic_data import SyntheticStatsBomb
+
+    n_matches = int(n_goals / 2.75 / len(catalog.CATALOG)) + 1
+    client = SyntheticStatsBomb(n_matches=n_matches, seed=seed)
+    frames = {key: client.goals(*key) for key in catalog.CATALOG}
+    goals = pd.concat(frames.values(), ignore_index=True)
+    goals['adjusted_goal_time'] = adjusted_goal_time(goals['period'], goals['goal_time'])
+    report = {'goals': len(goals), 'frame': int(goals.memory_usage(deep=True).sum())}
+    del goals
+
+    compact = {key: frame.astype({column: dtype for column, dtype in DTYPES.items()
+                                  if column in frame.columns}) for key, frame in frames.items()}
+    report['compact_frames'] = int(sum(frame.memory_usage(deep=True).sum() for frame in compact.values()))
+    del compact
+    table = GoalTable.concat([GoalTable.from_frame(frame, key) for key, frame in frames.items()])
+    report['goal_table'] = table.memory_usage()['total']
+    return report
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Memory of the goal frames and of a GoalTable.")
+    parser.add_argument('--goals', type=int, default=10_000_000)
+    args = parser.parse_args()
+
+    report = memory_report(args.goals)
+    n_goals = report.pop('goals')
+    print(f"{n_goals} synthetic goals")
+    for name, n_bytes in report.items():
+        ratio = f", {report['frame'] / n_bytes:.1f}x smaller than the frame" if name != 'frame' else ''
+        print(f"{name:>15}: {n_bytes / 1e6:8.1f}MB, {n_bytes / n_goals:5.1f} bytes per goal{ratio}")
@@ -1,147 +1,24 @@
-from statsbombpy import sb
-import pandas as pd
-import warnings
 import matplotlib.pyplot as plt
 
-# Suppress the specific NoAuthWarning from statsbombpy
-warnings.filterwarnings("ignore", message="credentials were not supplied. open data access only")
-
-def make_df(competition_id, season_id):
-    csv_name = f"goals_competition{competition_id}_season{season_id}.csv"
-
-    # get the data for all matches from considered competition and season
-    matches = sb.matches(competition_id=competition_id, season_id=season_id)
-    n_matches = matches.shape[0]
-    goals_data = []
-
-    # Loop through each match to get the event data and filter for goals
-    for i, match_id in enumerate(matches['match_id']):
-        if i % 10 == 0:
-            print(i, " / ", len(matches['match_id']))
-        events = sb.events(match_id=match_id)
-        
-        # Filter for goals - either a shot with outcome goal or an own-goal
-        # Check if 'shot_outcome' exists in the DataFrame columns
-        if 'shot_outcome' in events.columns:
-            goals = events[
-                (events['shot_outcome'] == 'Goal') |
-                (events['type'] == 'Own Goal For')            
-            ]
-        else:
-            goals = events[
-                (events['type'] == 'Own Goal For')            
-            ]            
-
-        for _, goal in goals.iterrows():
-            goal_time = goal['minute']
-            period = goal['period']
-            goals_data.append({
-                'match_id': match_id,
-                'period': period,
-                'n_matches': n_matches,
-                'goal_time': goal_time
-            })
-
-    # Convert the list to a DataFrame and save it as a csv
-    goals_df = pd.DataFrame(goals_data)
-    goals_df.to_csv(csv_name, index=False)
-
-def make_df_tournament(competition_id, season_id):
-    csv_name = f"goals_competition{competition_id}_season{season_id}.csv"
-
-    # get the data for all matches from considered competition and season
-    matches = sb.matches(competition_id=competition_id, season_id=season_id)
-    goals_data = []
-
-    # filter for group stage and knockout-games
-    n_matches_group =  matches[matches['competition_stage'] == 'Group Stage'].shape[0]
-    n_matches_ko =  matches[matches['competition_stage'] != 'Group Stage'].shape[0]
-    # initialise a variable counting the number of matches going to extra-time:
-    n_ET = 0
-
-    # Loop through each match to get the event data and filter for goals
-    for i, match in matches.iterrows():        
-        if i % 10 == 0:
-            print(i, " / ", len(matches['match_id']))
-        
-        match_id = match['match_id']
-        events = sb.events(match_id=match_id)
-
-        # indicator for match going to extra-time (period 3 is first half of extra-time)
-        ET = (events[events['period'] == 3].shape[0] > 0)
-        # increment counter for number of matches going to extra-time
-        n_ET += ET
-
-        # Filter for goals - either a shot with outcome goal or an own-goal
-        # Check if 'shot_outcome' exists in the DataFrame columns
-        if 'shot_outcome' in events.columns:
-            goals = events[
-                (events['shot_outcome'] == 'Goal') |
-                (events['type'] == 'Own Goal For')
-            ]
-        else:
-            goals = events[
-                (events['type'] == 'Own Goal For')          
-            ]   
-        # remove penalty shoot-outs from goals
-        goals = goals[goals['period'] < 5]
-
-        for _, goal in goals.iterrows():
-            goal_time = goal['minute']
-            period = goal['period']
-            stage = match['competition_stage']
-            goals_data.append({
-                'match_id': match_id,
-                'period': period,
-                'stage': stage,
-                'goal_time': goal_time,
-                'n_matches_group': n_matches_group,
-                'n_matches_ko': n_matches_ko,
-                'n_matches_ET': n_ET,
-                'ET_match': ET
-            })
-
-    # Convert the list to a DataFrame and save it as a csv
-    goals_df = pd.DataFrame(goals_data)
-    goals_df.to_csv(csv_name, index=False)
-
-def adjust_minutes(row):
-    if row['period'] == 2:
-        return row['goal_time'] + 15
-    elif row['period'] == 3:
-        return row['goal_time'] + 30
-    elif row['period'] == 4:
-        return row['goal_time'] + 45
-    else:
-        return row['goal_time']
-
-# Make and save the data
-season_id = 27
-England_id = 2
-Germany_id = 9
-Spain_id = 11
-France_id = 7
-Italy_id = 12
-
-# World Cups:
-World_cup_id = 43
-season_22 = 106
-season_18 = 3
-Euros_id = 55
-season_20 = 43
+import catalog
+import metrics
+from timeline import adjusted_goal_time
+from scheduler import catalog_jobs, run_jobs
 
-CREATE_DATA = False
 
-if CREATE_DATA:
-    make_df(England_id, season_id)
-    make_df(Germany_id, season_id)
-    make_df(Spain_id, season_id)
-    make_df(France_id, season_id)
-    make_df(Italy_id, season_id)
+# Make and save the data for every competition and season of the catalog
+CREATE_DATA = False
+MAX_WORKERS = 8  # number of matches fetched concurrently by every job
+MAX_PROCESSES = None  # number of competitions ingested in parallel, None uses all cores
+INCREMENTAL = True  # only fetch matches that are not in the checkpoint of the last run
 
-    make_df_tournament(World_cup_id, season_22)
-    make_df_tournament(World_cup_id, season_18)
-    make_df_tournament(Euros_id, season_20)
+if CREATE_DATA and __name__ == '__main__':
+    # one job per competition and season, run in parallel processes with a global request-rate limit;
+    # matches and events are cached on disk, so a rebuild only fetches what is missing
+    metrics.configure_logging()
+    report = run_jobs(catalog_jobs(), csv_dir=catalog.DATA_DIR, max_processes=MAX_PROCESSES,
+                      max_workers=MAX_WORKERS, incremental=INCREMENTAL)
+    print(f"ingested {len(report['jobs'])} datasets in {report['wall_seconds']:.1f}s, see ingestion_report.json")
 
 
 
@@ -150,18 +27,16 @@ if CREATE_DATA:
 ####### INTERNATIONAL TOURNAMENTS #######
 
 # load and join data
-df_WC_22 = pd.read_csv(f"goals_competition{World_cup_id}_season{season_22}.csv")
-df_WC_18 = pd.read_csv(f"goals_competition{World_cup_id}_season{season_18}.csv")
-df_EC_20 = pd.read_csv(f"goals_competition{Euros_id}_season{season_20}.csv")
-goals_tournament = pd.concat([df_WC_22, df_WC_18, df_EC_20])
+goals_tournament = catalog.union(catalog.TOURNAMENTS)
 
-# use the adjust_minutes fct to be able to appropriately plot the injury-time at the end of halves
-goals_tournament['adjusted_goal_time'] = goals_tournament.apply(adjust_minutes, axis=1)
+# map the goal minutes to the timeline to be able to appropriately plot the injury-time at the end of halves
+goals_tournament['adjusted_goal_time'] = adjusted_goal_time(goals_tournament['period'], goals_tournament['goal_time'])
 
 # compute number of matches for group stage, knockout, extra-time
-n_matches_group = df_WC_22['n_matches_group'][0] + df_WC_18['n_matches_group'][0] + df_EC_20['n_matches_group'][0]
-n_matches_ko = df_WC_22['n_matches_ko'][0] + df_WC_18['n_matches_ko'][0] + df_EC_20['n_matches_ko'][0]
-n_matches_ET = df_WC_22['n_matches_ET'].values[-1] + df_WC_18['n_matches_ET'].values[-1] + df_EC_20['n_matches_ET'].values[-1]
+counts = catalog.match_counts(catalog.TOURNAMENTS)
+n_matches_group = counts['n_matches_group']
+n_matches_ko = counts['n_matches_ko']
+n_matches_ET = counts['n_matches_ET']
 
 # filter between group-stage and knockout matches and 1st vs 2nd half
 goals_group = goals_tournament[goals_tournament['stage'] == 'Group Stage']
@@ -236,22 +111,13 @@ plt.savefig('knockout.png')
 
 
 # load and join data
-df_england = pd.read_csv(f"goals_competition{England_id}_season{season_id}.csv")
-df_germany = pd.read_csv(f"goals_competition{Germany_id}_season{season_id}.csv")
-df_spain = pd.read_csv(f"goals_competition{Spain_id}_season{season_id}.csv")
-df_france = pd.read_csv(f"goals_competition{France_id}_season{season_id}.csv")
-df_italy = pd.read_csv(f"goals_competition{Italy_id}_season{season_id}.csv")
-goals_clubs = pd.concat([df_england, df_germany, df_spain, df_france, df_italy])
+goals_clubs = catalog.union(catalog.TOP5_2015_16)
 
-# use the adjust_minutes fct to be able to appropriately plot the injury-time at the end of halves
-goals_clubs['adjusted_goal_time'] = goals_clubs.apply(adjust_minutes, axis=1)
+# map the goal minutes to the timeline to be able to appropriately plot the injury-time at the end of halves
+goals_clubs['adjusted_goal_time'] = adjusted_goal_time(goals_clubs['period'], goals_clubs['goal_time'])
 
 # compute number of matches for group stage, knockout, extra-time
-n_matches = df_england['n_matches'][0]
-n_matches += df_germany['n_matches'][0]
-n_matches += df_spain['n_matches'][0]
-n_matches += df_france['n_matches'][0]
-n_matches += df_italy['n_matches'][0]
+n_matches = catalog.match_counts(catalog.TOP5_2015_16)['n_matches']
 
 # filter between 1st vs 2nd half
 goals_H1 = goals_clubs[goals_clubs['period'] == 1]
@@ -0,0 +1,32 @@
+# Deployment of the Dash apps with gunicorn, from the repository root:
+#
+#   gunicorn -c gunicorn.conf.py interactive_histogram:server
+#   gunicorn -c gunicorn.conf.py --chdir home_away interactive_histogram_with_home_away:server
+#
+# The app (its imports, the goal data and the precomputed counts and figures) is loaded once in the
+# master and the workers are forked from it, so they share that memory instead of each loading their own
+# copy. The shared data is made read-only and moved out of the garbage collector's reach before the fork:
+# a collection in a worker would otherwise write to every object it tracks and copy their pages.
+import gc
+import os
+import sys
+
+bind = os.environ.get('BIND', '0.0.0.0:8050')
+workers = int(os.environ.get('WEB_CONCURRENCY', 4))
+# PRELOAD=0 loads the app in every worker instead, e.g. to compare the memory
+preload_app = os.environ.get('PRELOAD', '1') != '0'
+
+
+def when_ready(server):
+    # runs in the master after the preload and before the first fork
+    if preload_app:
+        catalog = sys.modules.get('catalog')
+        if catalog is not None:
+            catalog.freeze()
+        gc.collect()
+        gc.freeze()
+
+
+def post_worker_init(worker):
+    # the app is loaded in the worker (imported, or inherited from the master with preload_app)
+    worker.log.info("Worker ready (pid: %s)", worker.pid)
@@ -0,0 +1,112 @@
+import numpy as np
+
+from timeline import adjusted_goal_time
+
+# Side codes of the 'home' column: 0 away team, 1 home team, 2 neither (unknown team)
+AWAY, HOME, OTHER = 0, 1, 2
+N_SIDES = 3
+N_PERIODS = 5
+
+
+def app_bin_edges(bin_width):
+    """
+    Bin edges of the interactive histograms: bins of bin_width minutes in both halves and one bin
+    each for the stoppage time at the end of the halves (45+ and 90+).
+
+    Returns:
+    Tuple (bin_edge_H1, bin_edge_H2, bin_edges) with the first half, second half and all bin edges.
+    """
+    bin_edge_H1 = list(range(0, 46, bin_width))  # First half bins
+    bin_edge_H2 = list(range(60, 105, bin_width))  # Second half bins
+    if bin_width == 1:
+        bin_edges = list(range(0, 121, 1))  # Special case for 1-minute bins
+    else:
+        bin_edges = bin_edge_H1 + bin_edge_H2 + [105, 120]  # Combine half bins and extra time
+    return bin_edge_H1, bin_edge_H2, bin_edges
+
+
+class MinuteCounts:
+    """
+    Goal counts per timeline minute of one or several leagues, split by side and period, with their
+    prefix sums. A histogram for any bin edges is the difference of the prefix sums at the edges, so it
+    costs O(bins) and never touches the goal rows again.
+
+    goals_df: goals with 'period', 'goal_time' and optionally 'home' columns
+    n_matches: number of matches the goals were scored in, used for goals per match
+    n_minutes: length of the timeline, minutes beyond it are dropped (default: up to the latest goal)
+    """
+
+    def __init__(self, goals_df=None, n_matches=0, n_minutes=None):
+        if goals_df is None:
+            minutes = np.zeros(0, dtype=np.int64)
+            period = side = minutes
+        else:
+            minutes = adjusted_goal_time(goals_df['period'], goals_df['goal_time']).astype(np.int64)
+            period = goals_df['period'].to_numpy(dtype=np.int64)
+            side = goals_df['home'].to_numpy(dtype=np.int64) if 'home' in goals_df.columns \
+                else np.full(len(minutes), OTHER)
+        if n_minutes is None:
+            n_minutes = int(minutes.max()) + 1 if len(minutes) else 0
+        keep = minutes < n_minutes
+
+        # counts[side, period, minute], one bincount over the flattened index
+        flat = (side[keep] * N_PERIODS + period[keep] - 1) * n_minutes + minutes[keep]
+        counts = np.bincount(flat, minlength=N_SIDES * N_PERIODS * n_minutes)
+        self.counts = counts.reshape(N_SIDES, N_PERIODS, n_minutes)
+        self.n_matches = n_matches
+        self._update_cumsum()
+
+    def _update_cumsum(self):
+        # cumsum[..., m] = number of goals before timeline minute m
+        self.cumsum = np.zeros(self.counts.shape[:2] + (self.counts.shape[2] + 1,), dtype=np.int64)
+        np.cumsum(self.counts, axis=2, out=self.cumsum[:, :, 1:])
+
+    @property
+    def n_minutes(self):
+        return self.counts.shape[2]
+
+    def freeze(self):
+        # read-only arrays, so processes forked after building them keep sharing their memory pages
+        self.counts.setflags(write=False)
+        self.cumsum.setflags(write=False)
+        return self
+
+    def __add__(self, other):
+        # pad the shorter timeline, then counts and matches simply add up
+        n_minutes = max(self.n_minutes, other.n_minutes)
+        combined = MinuteCounts(n_minutes=0)
+        combined.counts = np.zeros((N_SIDES, N_PERIODS, n_minutes), dtype=np.int64)
+        combined.counts[:, :, :self.n_minutes] += self.counts
+        combined.counts[:, :, :other.n_minutes] += other.counts
+        combined.n_matches = self.n_matches + other.n_matches
+        combined._update_cumsum()
+        return combined
+
+    def histogram(self, bin_edges, sides=None, periods=None, weighted=False):
+        """
+        Histogram of the goals on the timeline, equal to np.histogram on the adjusted goal times.
+
+        bin_edges: increasing integer bin edges (the last bin includes its right edge, as in np.histogram)
+        sides: side codes to count (e.g. [HOME]), None counts all goals
+        periods: periods to count, None counts all of them
+        weighted: if True, return goals per match instead of total goals
+
+        Returns:
+        Array with the (weighted) number of goals in each bin.
+        """
+        cumsum = self.cumsum
+        if sides is not None:
+            cumsum = cumsum[list(sides)]
+        if periods is not None:
+            cumsum = cumsum[:, [period - 1 for period in periods]]
+        cumsum = cumsum.sum(axis=(0, 1))
+
+        # clip the edges to the timeline, goals after its end do not exist
+        edges = np.clip(np.asarray(bin_edges, dtype=np.int64), 0, self.n_minutes)
+        hist = cumsum[edges[1:]] - cumsum[edges[:-1]]
+        # np.histogram includes the right edge in the last bin
+        last = min(int(bin_edges[-1]) + 1, self.n_minutes)
+        hist[-1] += cumsum[last] - cumsum[edges[-1]]
+        if weighted:
+            return hist / self.n_matches
+        return hist
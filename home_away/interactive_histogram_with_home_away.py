@@ -2,39 +2,29 @@ from dash import Dash, html, dcc
 from dash import html, dcc
 from dash.dependencies import Input, Output
 import plotly.graph_objects as go
-import pandas as pd
-import numpy as np
+import itertools
+import os
+import sys
 
-# Function to adjust goal times based on the period (half or extra time)
-def adjust_minutes(row):
-    if row['period'] == 2:
-        return row['goal_time'] + 15 # Adjust by adding 15 minutes for second half
-    else:
-        return row['goal_time']  # No adjustment needed for first half
-
-# Season and league IDs for fetching data from CSVs
-season_id = 27
-England_id = 2
-Germany_id = 9
-Spain_id = 11
-France_id = 7
-Italy_id = 12
-
-# Load goal data for each league from CSV files, see goal_times.py for creating the datasets
-df_england = pd.read_csv(f"goals_competition{England_id}_season{season_id}.csv")
-df_germany = pd.read_csv(f"goals_competition{Germany_id}_season{season_id}.csv")
-df_spain = pd.read_csv(f"goals_competition{Spain_id}_season{season_id}.csv")
-df_france = pd.read_csv(f"goals_competition{France_id}_season{season_id}.csv")
-df_italy = pd.read_csv(f"goals_competition{Italy_id}_season{season_id}.csv")
-
-# Create a dictionary mapping league names to their respective dataframes
-league_data = {
-    'England': df_england,
-    'Germany': df_germany,
-    'Spain': df_spain,
-    'France': df_france,
-    'Italy': df_italy
-}
+# make the shared modules in the repository root importable
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import catalog
+import clientside
+import figure_bundle
+import metrics
+from figure_cache import FigureCache
+from histogram_engine import AWAY, HOME, app_bin_edges
+
+
+# Goal counts per side, period and minute of each league through the shared catalog,
+# see goal_times.py for creating the datasets
+league_aggregates = {league: catalog.aggregate([key]) for league, key in catalog.LEAGUES.items()}
+
+# Precompute the per-minute goal counts of each league (and all leagues together) and the bin edges
+# of each bin width once, so the callback only takes differences of prefix sums instead of binning the goals again
+league_counts = {league: aggregate.minute_counts().freeze() for league, aggregate in league_aggregates.items()}
+league_counts['All Leagues'] = sum(league_aggregates.values()).minute_counts().freeze()
+BIN_EDGES = {bin_width: app_bin_edges(bin_width) for bin_width in [1, 3, 5, 15, 45]}
 
 # Dictionary to map bin widths to corresponding y-axis range (for goals per match)
 YAXIS = {
@@ -62,6 +52,11 @@ YAXIS_total_all_leagues = {
     45: dict(range=[0, 3000]),
 }
 
+# All states of the app: league, bin width, weighting and team selection (240 figures)
+LEAGUE_OPTIONS = ['All Leagues'] + list(league_aggregates.keys())
+TEAM_OPTIONS = ['home', 'away', 'both-separate', 'both']
+STATES = list(itertools.product(LEAGUE_OPTIONS, list(BIN_EDGES), ['weighted', 'not_weighted'], TEAM_OPTIONS))
+
 #########################################################
 ############ CREATING THE INTERACTIVE PLOT ##############
 #########################################################
@@ -89,7 +84,7 @@ app.layout = html.Div([
         dcc.RadioItems(
             id='league-selector',  # ID for callback
             options=[{'label': 'All Leagues', 'value': 'All Leagues'}] +  # Add "All Leagues" option
-                    [{'label': country, 'value': country} for country in league_data.keys()],  # List of leagues
+                    [{'label': country, 'value': country} for country in league_aggregates.keys()],  # List of leagues
             value='England',  # Default selected league
             labelStyle={'display': 'block'}  # Display options vertically
         ),
@@ -125,64 +120,45 @@ app.layout = html.Div([
     ], style={'paddingTop': '20px', 'paddingLeft': '20px'}),  # Styling for padding
 ])
 
-# Callback to update the graph based on user input
-@app.callback(
-    Output("graph", "figure"),  # Output: Update the 'figure' of the graph
-    [Input("league-selector", "value"),  # Input: Selected league
-     Input("bin-width-slider", "value"),  # Input: Selected bin width
-     Input("weight-toggle", "value"),  # Input: Weighted or not
-     Input("team-selector", "value")]  # Input: Weighted or not
-)
-def update_histogram(selected_league, bin_width, weight_toggle, team_selector):
-    # Filter data for the selected league
-    # Combine data if "All Leagues" is selected
-    if selected_league == 'All Leagues':
-        filtered_df = pd.concat(league_data.values())  # Combine all leagues' data
-        n_matches = sum([league['n_matches'][0] for league in league_data.values()])  # Sum of all matches
-    else:
-        filtered_df = league_data[selected_league]
-        n_matches = league_data[selected_league]['n_matches'][0]  # Get the number of matches in the league
-
-    filtered_df['adjusted_goal_time'] = filtered_df.apply(adjust_minutes, axis=1)  # Adjust goal times
+# Build the histogram figure for the user input, without side effects so figures can be cached
+def build_histogram(selected_league, bin_width, weight_toggle, team_selector):
+    # Time the stages of the build, see the /metrics route
+    stopwatch = metrics.Stopwatch(component='app')
 
-
-    
-    # Define bin edges based on the selected bin width
-    bin_edge_H1 = list(range(0, 46, bin_width))  # First half bins
-    bin_edge_H2 = list(range(60, 105, bin_width))  # Second half bins
-    if bin_width == 1:
-        bin_edges = list(range(0, 121, 1))  # Special case for 1-minute bins
-    else:
-        bin_edges = bin_edge_H1 + bin_edge_H2 + [105, 120]  # Combine half bins and extra time
+    # Counts of the selected league ("All Leagues" combines all of them) and bin edges of the selected bin width
+    counts = league_counts[selected_league]
+    bin_edge_H1, bin_edge_H2, bin_edges = BIN_EDGES[bin_width]
 
     # Initialize an empty figure
     fig = go.Figure()
 
-    # Filter goals based on team selector (home, away, both)
+    # Select goals based on team selector (home, away, both)
     if team_selector == 'home':
-        filtered_df = filtered_df[filtered_df['home'] == 1]  # Filter only home goals
+        sides = [HOME]  # Count only home goals
     elif team_selector == 'away':
-        filtered_df = filtered_df[filtered_df['home'] == 0]  # Filter only away goals
-    elif team_selector == 'both-separate':
-        home_goals = filtered_df[filtered_df['home'] == 1]['adjusted_goal_time']
-        away_goals = filtered_df[filtered_df['home'] == 0]['adjusted_goal_time']
+        sides = [AWAY]  # Count only away goals
+    else:
+        sides = None  # Count all goals
+    stopwatch.lap('data_prep')
 
+    if team_selector == 'both-separate':
         # Add histogram trace depending on whether weighted or not
         if weight_toggle == 'weighted':
             # Weighted histogram (goals per match)
-            home_hist_data, hist_edges = np.histogram(home_goals, bins=bin_edges, weights=[1/n_matches] * len(home_goals))
-            away_hist_data, hist_edges = np.histogram(away_goals, bins=bin_edges, weights=[1/n_matches] * len(away_goals))
+            home_hist_data = counts.histogram(bin_edges, sides=[HOME], weighted=True)
+            away_hist_data = counts.histogram(bin_edges, sides=[AWAY], weighted=True)
             yaxis_title = 'Goals per match'
             yaxis = YAXIS[bin_width]  # Use predefined y-axis range for goals per match
         else:
             # Non-weighted histogram (total goals)
-            home_hist_data, hist_edges = np.histogram(home_goals, bins=bin_edges)
-            away_hist_data, hist_edges = np.histogram(away_goals, bins=bin_edges)
+            home_hist_data = counts.histogram(bin_edges, sides=[HOME])
+            away_hist_data = counts.histogram(bin_edges, sides=[AWAY])
             yaxis_title = 'Total Goals'
             if selected_league == 'All Leagues':
                 yaxis = YAXIS_total_all_leagues[bin_width]  # Use predefined y-axis range for total goals
             else:
                 yaxis = YAXIS_total[bin_width]  # Use predefined y-axis range for total goals
+        stopwatch.lap('histogram')
 
         # Create hover text for each bin (showing interval)
         if bin_width == 1:
@@ -196,6 +172,7 @@ def update_histogram(selected_league, bin_width, weight_toggle, team_selector):
             hover_text += [f'{bin_edge_H2[i] - 15} - {bin_edge_H2[i+1] - 15}' for i in range(len(bin_edge_H2) - 1)]
             hover_text += [f'{bin_edge_H2[-1] - 15} - 90']
             hover_text += ["90+"]
+        stopwatch.lap('hover_text')
 
         # Add the bar trace for the histogram
         fig.add_trace(go.Bar(
@@ -224,23 +201,22 @@ def update_histogram(selected_league, bin_width, weight_toggle, team_selector):
 
 
     if team_selector != 'both-separate':    
-        # Extract goal times after adjustment
-        data = filtered_df['adjusted_goal_time']
-
         # Add histogram trace depending on whether weighted or not
         if weight_toggle == 'weighted':
             # Weighted histogram (goals per match)
-            hist_data, hist_edges = np.histogram(data, bins=bin_edges, weights=[1/n_matches] * len(data))
+            hist_data = counts.histogram(bin_edges, sides=sides, weighted=True)
             yaxis_title = 'Goals per match'
             yaxis = YAXIS[bin_width]  # Use predefined y-axis range for goals per match
         else:
             # Non-weighted histogram (total goals)
-            hist_data, hist_edges = np.histogram(data, bins=bin_edges)
+            hist_data = counts.histogram(bin_edges, sides=sides)
             yaxis_title = 'Total Goals'
             if selected_league == 'All Leagues':
                 yaxis = YAXIS_total_all_leagues[bin_width]  # Use predefined y-axis range for total goals
             else:
                 yaxis = YAXIS_total[bin_width]  # Use predefined y-axis range for total goals
+        stopwatch.lap('histogram')
+
         # Create hover text for each bin (showing interval)
         if bin_width == 1:
             # For 1-minute bins, show precise intervals
@@ -253,6 +229,7 @@ def update_histogram(selected_league, bin_width, weight_toggle, team_selector):
             hover_text += [f'{bin_edge_H2[i] - 15} - {bin_edge_H2[i+1] - 15}' for i in range(len(bin_edge_H2) - 1)]
             hover_text += [f'{bin_edge_H2[-1] - 15} - 90']
             hover_text += ["90+"]
+        stopwatch.lap('hover_text')
 
         # Add the bar trace for the histogram
         fig.add_trace(go.Bar(
@@ -280,9 +257,99 @@ def update_histogram(selected_league, bin_width, weight_toggle, team_selector):
         yaxis=yaxis,  # Set the y-axis limits based on the bin width
         barmode = 'overlay'
     )
-    
+    stopwatch.lap('figure_build')
+
     return fig  # Return the updated figure for display
 
+# In the clientside mode the per-minute counts are shipped to the browser once and the histograms are
+# rebinned there, so changing the inputs costs no server CPU and no network
+CLIENTSIDE = False
+
+# Folder of a figure bundle exported with --export-bundle, the callbacks then serve the precomputed figures
+FIGURE_BUNDLE = os.environ.get('FIGURE_BUNDLE')
+
+# Exporting a bundle (see the end of the file) builds every figure once itself, so the app does not warm up
+EXPORTING = __name__ == '__main__' and any(arg.split('=')[0] == '--export-bundle' for arg in sys.argv[1:])
+
+if CLIENTSIDE:
+    app.layout.children.append(dcc.Store(id='minute-counts', data=clientside.store_data(
+        league_counts, YAXIS, YAXIS_total, YAXIS_total_all_leagues,
+        clientside.shared_layout(build_histogram('England', 15, 'weighted', 'both')))))
+    app.clientside_callback(
+        clientside.REBIN_JS,
+        Output("graph", "figure"),
+        [Input("minute-counts", "data"),  # Input: Per-minute counts of all leagues
+         Input("league-selector", "value"),
+         Input("bin-width-slider", "value"),
+         Input("weight-toggle", "value"),
+         Input("team-selector", "value")]
+    )
+elif FIGURE_BUNDLE:
+    # Figures are looked up in the precomputed bundle, see the export below, and the bundle is also served
+    # as static files under /figures, so the callbacks cost no figure builds however many users there are
+    bundle = figure_bundle.FigureBundle(FIGURE_BUNDLE)
+    bundle.add_routes(server)
+
+    @app.callback(
+        Output("graph", "figure"),
+        [Input("league-selector", "value"),
+         Input("bin-width-slider", "value"),
+         Input("weight-toggle", "value"),
+         Input("team-selector", "value")]
+    )
+    def update_histogram(selected_league, bin_width, weight_toggle, team_selector):
+        with metrics.span('update_histogram', component='app'):
+            return bundle.get(selected_league, bin_width, weight_toggle, team_selector)
+
+    metrics.register_collector('figures', bundle.stats)
+else:
+    # Figures are cached by their inputs, and all of them are built at startup if WARM_UP_CACHE is set
+    WARM_UP_CACHE = not EXPORTING
+    figure_cache = FigureCache(build_histogram, maxsize=256)
+    if WARM_UP_CACHE:
+        figure_cache.warm_up(STATES)
+
+    # Callback to update the graph based on user input
+    @app.callback(
+        Output("graph", "figure"),  # Output: Update the 'figure' of the graph
+        [Input("league-selector", "value"),  # Input: Selected league
+         Input("bin-width-slider", "value"),  # Input: Selected bin width
+         Input("weight-toggle", "value"),  # Input: Weighted or not
+         Input("team-selector", "value")]  # Input: Weighted or not
+    )
+    def update_histogram(selected_league, bin_width, weight_toggle, team_selector):
+        with metrics.span('update_histogram', component='app'):
+            return figure_cache.get(selected_league, bin_width, weight_toggle, team_selector)
+
+    # Hit rate and latency of the figure cache
+    metrics.register_collector('figures', figure_cache.stats)
+
+    @server.route('/cache-stats')
+    def cache_stats():
+        return figure_cache.stats()
+
+# Stage timings, counters and cache hit rates in the Prometheus text format, and the structured logs on
+# stderr (GOALS_LOG_LEVEL=DEBUG adds the stage timings of every callback)
+metrics.add_route(server)
+metrics.configure_logging()
+
 # Run the app
 if __name__ == '__main__':
-    app.run_server(debug=True)  # Start the server for the Dash app in debug mode
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--export-bundle', metavar='DIR',
+                        help="precompute the figures of all states into DIR (with a static index.html) and exit")
+    args = parser.parse_args()
+    if args.export_bundle:
+        index = figure_bundle.export_bundle(build_histogram, STATES, args.export_bundle)
+        figure_bundle.write_static_page(args.export_bundle, [
+            ('league', 'League:', [[league, league] for league in LEAGUE_OPTIONS]),
+            ('bin_width', 'Bin width:', [[bin_width, str(bin_width)] for bin_width in BIN_EDGES]),
+            ('weight', 'Y-axis:', [['weighted', 'Goals / match'], ['not_weighted', 'Total goals']]),
+            ('team', 'Team:', [['both', 'Both'], ['home', 'Home'], ['away', 'Away'], ['both-separate', 'Both-Separate']]),
+        ])
+        print(f"exported {len(index['figures'])} states, {len(set(index['figures'].values()))} figures, "
+              f"version {index['version']}")
+    else:
+        app.run_server(debug=True)  # Start the server for the Dash app in debug mode
@@ -0,0 +1,376 @@
+import json
+import os
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import metrics
+
+# Suppress the specific NoAuthWarning from statsbombpy
+warnings.filterwarnings("ignore", message="credentials were not supplied. open data access only")
+
+# Number of matches fetched in parallel by default. The StatsBomb API is latency-bound,
+# so a handful of threads already gives a large speed-up without hammering the server.
+DEFAULT_MAX_WORKERS = 8
+
+# In incremental mode, the goals and the checkpoint are written every CHECKPOINT_EVERY matches
+CHECKPOINT_EVERY = 20
+
+# Version of the goal extraction, stored in the checkpoints: increase it with every change of extract_goals
+# (or of what make_df / make_df_tournament extract), so resuming rebuilds instead of mixing in goals of the old code
+EXTRACT_VERSION = 1
+
+
+def default_client():
+    # STATSBOMB_CLIENT=synthetic generates SYNTHETIC_MATCHES matches per season instead, for scale testing
+    if os.environ.get('STATSBOMB_CLIENT') == 'synthetic':
+        from synthetic_data import SyntheticStatsBomb
+        return SyntheticStatsBomb(n_matches=int(os.environ.get('SYNTHETIC_MATCHES', 380)))
+    # statsbombpy is only needed when data is actually fetched from the API
+    from statsbombpy import sb
+    return sb
+
+
+def iter_events(client, match_ids, max_workers=DEFAULT_MAX_WORKERS):
+    """
+    Fetch the event data of several matches in parallel.
+
+    client: object exposing events(match_id=...), e.g. statsbombpy's sb, or iter_events(match_ids, max_workers)
+        to fetch the matches itself
+    match_ids: list of match ids to fetch
+    max_workers: maximal number of concurrent requests (1 fetches sequentially)
+
+    Yields:
+    (match_id, events) tuples in the order of match_ids. If fetching a match fails,
+    a warning is issued and events is None, so one bad match does not abort the season.
+    """
+    match_ids = list(match_ids)
+
+    if hasattr(client, 'iter_events'):
+        # clients reading local files (open_data.OpenDataClient) parse them in their own worker processes
+        stream = client.iter_events(match_ids, max_workers)
+        for i in range(len(match_ids)):
+            if i % 10 == 0:
+                print(i, " / ", len(match_ids))
+            with metrics.span('fetch', component='ingestion'):
+                match_id, events = next(stream)
+            yield match_id, events
+        return
+
+    def fetch(match_id):
+        try:
+            with metrics.span('fetch', component='ingestion'):
+                return client.events(match_id=match_id)
+        except Exception as err:
+            warnings.warn(f"could not fetch events of match {match_id}: {err!r}")
+            return None
+
+    if max_workers <= 1:
+        for i, match_id in enumerate(match_ids):
+            if i % 10 == 0:
+                print(i, " / ", len(match_ids))
+            yield match_id, fetch(match_id)
+        return
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        # keep a bounded window of requests in flight and hand results out in order
+        window = 2 * max_workers
+        futures = [pool.submit(fetch, match_id) for match_id in match_ids[:window]]
+        for i, match_id in enumerate(match_ids):
+            if i % 10 == 0:
+                print(i, " / ", len(match_ids))
+            events = futures[i].result()
+            futures[i] = None  # release the frame as soon as it was handed out
+            if i + window < len(match_ids):
+                futures.append(pool.submit(fetch, match_ids[i + window]))
+            yield match_id, events
+
+
+# Event columns needed to find the goals, everything else is dropped right after fetching
+EVENT_COLUMNS = ['match_id', 'type', 'shot_outcome', 'period', 'minute', 'team']
+
+LEAGUE_COLUMNS = ['match_id', 'period', 'goal_time', 'home']
+TOURNAMENT_COLUMNS = ['match_id', 'period', 'stage', 'goal_time', 'n_matches_ET', 'ET_match']
+
+
+def extract_goals(events, matches, tournament=False, n_ET=0):
+    """
+    Extract the goals from the events of one or several matches with columnar operations.
+
+    events: events with a match_id column, e.g. the concatenated sb.events frames of several matches
+    matches: match listing with match_id, home_team, away_team and (for tournaments) competition_stage
+    tournament: if True, return the tournament columns (stage, extra-time) and drop penalty shoot-outs,
+        otherwise the league columns (home)
+    n_ET: number of matches that went to extra-time before these events, the running n_matches_ET
+        count continues from it in the order the matches appear in events
+
+    Returns:
+    DataFrame with one row per goal, in the order of the events.
+    """
+    # Filter for goals - either a shot with outcome goal or an own-goal
+    # (matches without any shot have no 'shot_outcome' column)
+    is_goal = events['type'] == 'Own Goal For'
+    if 'shot_outcome' in events.columns:
+        is_goal |= events['shot_outcome'] == 'Goal'
+    goals = events.loc[is_goal, ['match_id', 'period', 'minute', 'team']].rename(columns={'minute': 'goal_time'})
+
+    if not tournament:
+        goals = goals.merge(matches[['match_id', 'home_team', 'away_team']], on='match_id', how='left')
+        # 1 for the home team, 0 for the away team and 2 if the team matches neither
+        goals['home'] = np.select(
+            [goals['team'] == goals['home_team'], goals['team'] == goals['away_team']], [1, 0], 2)
+        return goals[LEAGUE_COLUMNS].reset_index(drop=True)
+
+    # indicator for match going to extra-time (period 3 is first half of extra-time) and the
+    # running number of matches going to extra-time, counted in the order of the matches
+    order = pd.unique(events['match_id'])
+    ET = pd.Series(np.isin(order, events.loc[events['period'] == 3, 'match_id'].unique()), index=order)
+    per_match = pd.DataFrame({'ET_match': ET, 'n_matches_ET': n_ET + ET.cumsum()})
+
+    # remove penalty shoot-outs from goals
+    goals = goals[goals['period'] < 5]
+    goals = goals.join(per_match, on='match_id')
+    goals = goals.merge(matches[['match_id', 'competition_stage']], on='match_id', how='left')
+    goals = goals.rename(columns={'competition_stage': 'stage'})
+    return goals[TOURNAMENT_COLUMNS].reset_index(drop=True)
+
+
+def load_checkpoint(csv_name):
+    """
+    Read the checkpoint of an incremental ingestion.
+
+    Returns:
+    Dictionary with the list of 'processed' match ids, the 'state' of running counters (e.g. the
+    number of matches that went to extra-time), and the goal 'columns' and EXTRACT_VERSION 'version'
+    the goals were extracted with, empty if there is no checkpoint yet.
+    """
+    try:
+        with open(f"{csv_name}.checkpoint.json") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {'processed': [], 'state': {}}
+
+
+def save_checkpoint(csv_name, processed, state, columns):
+    # write to a temporary file first, so a crash never leaves a truncated checkpoint behind
+    tmp_name = f"{csv_name}.checkpoint.json.tmp"
+    with open(tmp_name, 'w') as f:
+        json.dump({'processed': [int(match_id) for match_id in processed], 'state': state,
+                   'columns': list(columns), 'version': EXTRACT_VERSION}, f)
+    os.replace(tmp_name, f"{csv_name}.checkpoint.json")
+
+
+def ingest_goals(csv_name, match_ids, client, max_workers, incremental, extract, columns, state=None,
+                 on_goals=None):
+    """
+    Fetch the events of all matches and collect their goals.
+
+    In incremental mode, the goals of every CHECKPOINT_EVERY processed matches are appended to
+    '<csv_name>.partial' and the processed match ids are recorded in '<csv_name>.checkpoint.json'.
+    Matches that are already in the checkpoint are skipped, so an interrupted run resumes where it
+    stopped and a new round only fetches the new matches. A checkpoint written with other columns or
+    another EXTRACT_VERSION is discarded and all matches are fetched again. Only EVENT_COLUMNS are kept of the
+    fetched events, and the goals of every batch of CHECKPOINT_EVERY matches are extracted at once.
+
+    csv_name: final csv of the dataset, also used to name the checkpoint files
+    match_ids: match ids of the competition and season
+    client, max_workers: see iter_events
+    incremental: whether to resume from and write checkpoints
+    extract: function (events, state) returning the goal DataFrame of a batch of matches, where
+        state is a dict of running counters that is stored in the checkpoint
+    columns: columns of the goal DataFrame
+    state: initial running counters if there is no checkpoint yet
+    on_goals: optional function (goals, n_matches, state) called with the goals of the matches of
+        previous runs and then of every extracted batch, e.g. to update an aggregates.GoalAggregate
+
+    Returns:
+    Tuple (goals_df, processed, failed) with the goals of all processed matches (previous runs
+    included), the list of processed match ids and the list of match ids that could not be fetched.
+    """
+    start = time.perf_counter()
+    dataset = os.path.splitext(os.path.basename(csv_name))[0]
+    partial_name = f"{csv_name}.partial"
+    checkpoint = load_checkpoint(csv_name) if incremental else {'processed': [], 'state': {}}
+    if checkpoint['processed'] and (checkpoint.get('columns') != list(columns)
+                                    or checkpoint.get('version') != EXTRACT_VERSION):
+        # the goals of the checkpointed matches were extracted by other code, they are extracted again
+        print("checkpoint of another goal layout or extraction version, rebuilding")
+        checkpoint = {'processed': [], 'state': {}}
+    state = checkpoint['state'] or dict(state or {})
+    processed = list(checkpoint['processed'])
+
+    previous = []
+    if processed:
+        done = set(processed)
+        # goals of completed runs are in the final csv, the ones of an interrupted run in the partial file
+        if os.path.exists(csv_name):
+            goals_csv = pd.read_csv(csv_name)[columns]
+            previous.append(goals_csv[goals_csv['match_id'].isin(done)])
+        if os.path.exists(partial_name):
+            partial = pd.read_csv(partial_name)
+            # drop goals of matches that were written after the last checkpoint or are already in the csv
+            known = set(previous[0]['match_id']) if previous else set()
+            kept = partial['match_id'].isin(done) & ~partial['match_id'].isin(known)
+            if not kept.all():
+                # also on disk: this run fetches the dropped matches again and appends their goals, a
+                # second interruption would otherwise leave them twice in the partial file
+                partial = partial[kept]
+                tmp_name = f"{partial_name}.tmp"
+                partial.to_csv(tmp_name, index=False)
+                os.replace(tmp_name, partial_name)
+            previous.append(partial)
+    else:
+        # a full rebuild starts from scratch, leftovers of earlier runs would no longer match the csv
+        for name in [partial_name, f"{csv_name}.checkpoint.json"]:
+            if os.path.exists(name):
+                os.remove(name)
+
+    if on_goals is not None and processed:
+        on_goals(pd.concat(previous, ignore_index=True) if previous else pd.DataFrame(columns=columns),
+                 len(processed), state)
+
+    done = set(processed)
+    todo = [match_id for match_id in match_ids if match_id not in done]
+    if incremental:
+        print(f"{len(processed)} matches already processed, {len(todo)} to fetch")
+
+    goals_data = []
+    batch = []
+    failed = []
+
+    def extract_batch():
+        if batch:
+            with metrics.span('extract', component='ingestion'):
+                goals_data.append(extract(pd.concat(batch, ignore_index=True), state))
+            metrics.increment('ingested_matches', len(batch), dataset=dataset)
+            metrics.increment('extracted_goals', len(goals_data[-1]), dataset=dataset)
+            if on_goals is not None:
+                on_goals(goals_data[-1], len(batch), state)
+            batch.clear()
+
+    def checkpoint_now():
+        n_written = len(goals_data)
+        extract_batch()
+        with metrics.span('write', component='ingestion'):
+            for goals in goals_data[n_written:]:
+                goals.to_csv(partial_name, mode='a', header=not os.path.exists(partial_name), index=False)
+            save_checkpoint(csv_name, processed, state, columns)
+
+    # Loop through each match to get the event data, the goals are extracted batch-wise
+    for i, (match_id, events) in enumerate(iter_events(client, todo, max_workers)):
+        if events is None:
+            failed.append(match_id)
+            metrics.increment('failed_matches', dataset=dataset)
+            continue
+        # keep only the columns needed to find the goals
+        with metrics.span('filter', component='ingestion'):
+            batch.append(events.reindex(columns=EVENT_COLUMNS).assign(match_id=match_id))
+        processed.append(match_id)
+        if (i + 1) % CHECKPOINT_EVERY == 0:
+            checkpoint_now() if incremental else extract_batch()
+
+    checkpoint_now() if incremental else extract_batch()
+
+    if failed:
+        print(f"{len(failed)} matches could not be fetched: {failed}")
+
+    frames = previous + goals_data
+    goals_df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=columns)
+    metrics.log('ingest', dataset=dataset, matches=len(processed), failed=len(failed), goals=len(goals_df),
+                fetched=len(processed) - len(checkpoint['processed']), seconds=time.perf_counter() - start)
+    return goals_df, processed, failed
+
+
+def write_csv(goals_df, csv_name):
+    # replace the csv in one step, then the partial goals are contained in it and can be removed
+    with metrics.span('write', component='ingestion'):
+        tmp_name = f"{csv_name}.tmp"
+        goals_df.to_csv(tmp_name, index=False)
+        os.replace(tmp_name, csv_name)
+        if os.path.exists(f"{csv_name}.partial"):
+            os.remove(f"{csv_name}.partial")
+
+
+def make_df(competition_id, season_id, client=None, max_workers=DEFAULT_MAX_WORKERS, csv_dir="",
+            incremental=False, aggregate=None):
+    """
+    Create the goal dataset of a league season and save it as a csv.
+
+    competition_id, season_id: StatsBomb ids of the competition and season
+    client: StatsBomb client, defaults to statsbombpy's sb
+    max_workers: number of matches whose events are fetched concurrently
+    csv_dir: folder the csv is written to
+    incremental: only fetch matches that are not in the checkpoint of a previous run, see ingest_goals
+    aggregate: optional aggregates.GoalAggregate, updated with the goals batch by batch during ingestion
+
+    Returns:
+    List of match ids whose events could not be fetched.
+    """
+    client = client or default_client()
+    csv_name = os.path.join(csv_dir, f"goals_competition{competition_id}_season{season_id}.csv")
+
+    # get the data for all matches from considered competition and season
+    matches = client.matches(competition_id=competition_id, season_id=season_id)
+    goals_df, processed, failed = ingest_goals(
+        csv_name, matches['match_id'], client, max_workers, incremental,
+        lambda events, state: extract_goals(events, matches),
+        columns=LEAGUE_COLUMNS,
+        on_goals=None if aggregate is None else lambda goals, n_matches, state: aggregate.update(goals, n_matches))
+
+    # only count the matches whose goals are actually in the dataset
+    goals_df.insert(2, 'n_matches', len(processed))
+    write_csv(goals_df, csv_name)
+    return failed
+
+
+def make_df_tournament(competition_id, season_id, client=None, max_workers=DEFAULT_MAX_WORKERS, csv_dir="",
+                       incremental=False, aggregate=None):
+    """
+    Create the goal dataset of a tournament (group stage and knockout) and save it as a csv.
+
+    competition_id, season_id: StatsBomb ids of the competition and season
+    client: StatsBomb client, defaults to statsbombpy's sb
+    max_workers: number of matches whose events are fetched concurrently
+    csv_dir: folder the csv is written to
+    incremental: only fetch matches that are not in the checkpoint of a previous run, see ingest_goals
+    aggregate: optional aggregates.GoalAggregate, updated with the goals batch by batch during ingestion
+
+    Returns:
+    List of match ids whose events could not be fetched.
+    """
+    client = client or default_client()
+    csv_name = os.path.join(csv_dir, f"goals_competition{competition_id}_season{season_id}.csv")
+
+    # get the data for all matches from considered competition and season
+    matches = client.matches(competition_id=competition_id, season_id=season_id)
+
+    # the running extra-time count of the state tells how many of the new matches went to extra-time
+    n_ET_seen = [0]
+
+    def on_goals(goals, n_matches, state):
+        aggregate.update(goals, n_matches, state['n_ET'] - n_ET_seen[0])
+        n_ET_seen[0] = state['n_ET']
+
+    def extract(events, state):
+        goals = extract_goals(events, matches, tournament=True, n_ET=state['n_ET'])
+        # the number of matches going to extra-time is kept in the checkpoint,
+        # so that the running count continues where the previous run stopped
+        state['n_ET'] += int(events.loc[events['period'] == 3, 'match_id'].nunique())
+        return goals
+
+    goals_df, processed, failed = ingest_goals(
+        csv_name, matches['match_id'], client, max_workers, incremental, extract,
+        columns=TOURNAMENT_COLUMNS, state={'n_ET': 0}, on_goals=None if aggregate is None else on_goals)
+
+    # filter for group stage and knockout-games, only counting matches that were processed
+    fetched = matches[matches['match_id'].isin(processed)]
+    n_matches_group = fetched[fetched['competition_stage'] == 'Group Stage'].shape[0]
+    n_matches_ko = fetched[fetched['competition_stage'] != 'Group Stage'].shape[0]
+
+    goals_df.insert(4, 'n_matches_group', n_matches_group)
+    goals_df.insert(5, 'n_matches_ko', n_matches_ko)
+    write_csv(goals_df, csv_name)
+    return failed
@@ -0,0 +1,192 @@
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Structured logs: one JSON object per message, on the 'goals' logger (spans at DEBUG, summaries at INFO)
+logger = logging.getLogger('goals')
+LOG_LEVEL_ENV = 'GOALS_LOG_LEVEL'  # level of the structured logs printed by configure_logging, default INFO
+
+# Upper bounds in seconds of the buckets of the stage duration histograms
+BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 60)
+
+PREFIX = 'goals'
+
+_lock = threading.Lock()
+_durations = {}  # (stage, labels) -> [bucket counts..., count, sum]
+_counters = {}  # (name, labels) -> value
+_collectors = {}  # name -> function returning a dict of numbers, e.g. FigureCache.stats
+
+
+def _labels(labels):
+    return tuple(sorted(labels.items()))
+
+
+def log(event, level=logging.INFO, **fields):
+    # the JSON is only built if the level is enabled, so disabled logs cost next to nothing
+    if logger.isEnabledFor(level):
+        logger.log(level, json.dumps({'event': event, **fields}, default=str))
+
+
+def configure_logging(level=None):
+    """
+    Print the structured logs to stderr, one JSON object per line. Called once by every entry point
+    (scripts, apps, scheduler processes), the library modules only log.
+
+    level: level name or number, default the GOALS_LOG_LEVEL environment variable or INFO,
+        e.g. GOALS_LOG_LEVEL=DEBUG also prints the spans
+    """
+    level = level or os.environ.get(LOG_LEVEL_ENV) or 'INFO'
+    logger.setLevel(level.upper() if isinstance(level, str) else level)
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(handler)
+        # the JSON lines are printed once, also if the application configures the root logger
+        logger.propagate = False
+
+
+def observe(stage, seconds, **labels):
+    """
+    Record the duration of one run of a stage, e.g. observe('extract', 0.02, component='ingestion').
+    """
+    key = (stage, _labels(labels))
+    with _lock:
+        histogram = _durations.get(key)
+        if histogram is None:
+            histogram = _durations[key] = [0] * len(BUCKETS) + [0, 0.0]
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                histogram[i] += 1
+        histogram[-2] += 1
+        histogram[-1] += seconds
+    log('span', logging.DEBUG, stage=stage, seconds=seconds, **labels)
+
+
+@contextmanager
+def span(stage, **labels):
+    """
+    Time the block as one run of stage:
+
+        with metrics.span('extract', component='ingestion'):
+            ...
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - start, **labels)
+
+
+class Stopwatch:
+    """
+    Times consecutive stages of one function without nesting blocks: every lap(stage) records the time
+    since the previous lap (or the start) as one run of stage.
+    """
+
+    def __init__(self, **labels):
+        self.labels = labels
+        self.last = time.perf_counter()
+
+    def lap(self, stage):
+        now = time.perf_counter()
+        observe(stage, now - self.last, **self.labels)
+        self.last = now
+
+
+def increment(name, value=1, **labels):
+    # counters only go up, e.g. increment('ingested_matches', 20, dataset='goals_competition2_season27')
+    key = (name, _labels(labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def register_collector(name, stats):
+    """
+    Export the numbers of a stats function at every scrape, e.g. the hit rates of the caches.
+
+    name: value of the 'cache' label of the exported gauges
+    stats: function without arguments returning a dictionary, e.g. FigureCache.stats
+    """
+    with _lock:
+        _collectors[name] = stats
+
+
+def snapshot():
+    """
+    Returns:
+    Dictionary with the stage durations (count, total and mean seconds), the counters and the
+    collected stats, e.g. to log at the end of a run.
+    """
+    with _lock:
+        durations = {(stage, labels): (histogram[-2], histogram[-1]) for (stage, labels), histogram in _durations.items()}
+        counters = dict(_counters)
+        collectors = dict(_collectors)
+    return {
+        'stages': [{'stage': stage, **dict(labels), 'count': count, 'seconds': total, 'mean_ms': 1e3 * total / count}
+                   for (stage, labels), (count, total) in durations.items()],
+        'counters': [{'name': name, **dict(labels), 'value': value} for (name, labels), value in counters.items()],
+        'collectors': {name: stats() for name, stats in collectors.items()},
+    }
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = [(key, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+               for key, value in labels]
+    return '{' + ','.join(f'{key}="{value}"' for key, value in escaped) + '}'
+
+
+def render():
+    """
+    Returns:
+    All metrics in the Prometheus text exposition format.
+    """
+    with _lock:
+        durations = {key: list(histogram) for key, histogram in _durations.items()}
+        counters = dict(_counters)
+        collectors = dict(_collectors)
+
+    lines = [f'# HELP {PREFIX}_stage_seconds Duration of the instrumented stages.',
+             f'# TYPE {PREFIX}_stage_seconds histogram']
+    for (stage, labels), histogram in sorted(durations.items()):
+        labels = (('stage', stage),) + labels
+        for bound, count in zip(BUCKETS, histogram):
+            lines.append(f'{PREFIX}_stage_seconds_bucket{_format_labels(labels + (("le", bound),))} {count}')
+        lines.append(f'{PREFIX}_stage_seconds_bucket{_format_labels(labels + (("le", "+Inf"),))} {histogram[-2]}')
+        lines.append(f'{PREFIX}_stage_seconds_count{_format_labels(labels)} {histogram[-2]}')
+        lines.append(f'{PREFIX}_stage_seconds_sum{_format_labels(labels)} {histogram[-1]}')
+
+    for name in sorted({name for name, labels in counters}):
+        lines += [f'# TYPE {PREFIX}_{name}_total counter']
+        lines += [f'{PREFIX}_{name}_total{_format_labels(labels)} {value}'
+                  for (counter, labels), value in sorted(counters.items()) if counter == name]
+
+    # the stats of the caches as gauges, one per key with the cache as label
+    gauges = {}
+    for cache, stats in sorted(collectors.items()):
+        for key, value in stats().items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                gauges.setdefault(key, []).append((cache, value))
+    for key, values in sorted(gauges.items()):
+        lines.append(f'# TYPE {PREFIX}_cache_{key} gauge')
+        lines += [f'{PREFIX}_cache_{key}{_format_labels((("cache", cache),))} {value}' for cache, value in values]
+    return '\n'.join(lines) + '\n'
+
+
+def add_route(server, path='/metrics'):
+    # Prometheus scrape endpoint on the Flask server of a Dash app
+    def metrics_route():
+        return render(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+    server.add_url_rule(path, 'metrics', metrics_route)
+
+
+def reset():
+    with _lock:
+        _durations.clear()
+        _counters.clear()
+        _collectors.clear()
@@ -0,0 +1,49 @@
+import time
+
+import numpy as np
+
+from synthetic_data import SyntheticStatsBomb
+
+
+class OfflineStatsBomb:
+    """
+    Local stand-in for statsbombpy's sb to exercise the ingestion against: the reproducible matches and
+    events of synthetic_data.SyntheticStatsBomb behind an artificial network latency and random failures.
+
+    n_matches: number of matches returned for every competition and season
+    latency: seconds every events() call sleeps to mimic a request to the API
+    failure_rate: probability that an events() call raises an error
+    seed: seed making the generated matches, events and failures reproducible
+    kwargs: further options of SyntheticStatsBomb, e.g. seasons or n_filler
+    """
+
+    def __init__(self, n_matches=380, latency=0.05, failure_rate=0.0, seed=0, **kwargs):
+        self.client = SyntheticStatsBomb(n_matches=n_matches, seed=seed, **kwargs)
+        self.n_matches = n_matches
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.seed = seed
+
+    def matches(self, competition_id, season_id):
+        return self.client.matches(competition_id=competition_id, season_id=season_id)
+
+    def events(self, match_id):
+        time.sleep(self.latency)
+        # one random draw per match, so the same matches fail whatever the call order
+        if np.random.default_rng([self.seed, int(match_id)]).random() < self.failure_rate:
+            raise ConnectionError(f"simulated failure for match {match_id}")
+        return self.client.events(match_id=match_id)
+
+
+if __name__ == '__main__':
+    # Measure the ingestion throughput of a league season against the stand-in
+    import tempfile
+    from ingestion import make_df
+
+    client = OfflineStatsBomb(n_matches=380, latency=0.05)
+    with tempfile.TemporaryDirectory() as tmp:
+        for max_workers in [1, 4, 8, 16, 32]:
+            start = time.perf_counter()
+            make_df(2, 27, client=client, max_workers=max_workers, csv_dir=tmp)
+            duration = time.perf_counter() - start
+            print(f"max_workers={max_workers:2d}: {duration:6.2f}s, {client.n_matches / duration:7.1f} matches/s")
@@ -0,0 +1,208 @@
+import json
+import os
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+# Events kept of the events files: goals and the period markers telling which periods were played
+KEEP_TYPES = {'Own Goal For', 'Half Start'}
+EVENT_FIELDS = ['type', 'shot_outcome', 'period', 'minute', 'team']
+
+CHUNK_SIZE = 1 << 16  # bytes read at once from the JSON files
+
+_decoder = json.JSONDecoder()
+
+
+def iter_json_array(f, chunk_size=CHUNK_SIZE):
+    """
+    Stream the elements of a JSON array file one by one, so only the element being parsed and one
+    chunk of the file are held in memory, never the whole document.
+
+    f: file opened in text mode, holding a JSON array
+
+    Yields:
+    The decoded elements of the array.
+    """
+    buffer = f.read(chunk_size).lstrip()
+    if not buffer.startswith('['):
+        raise ValueError(f"{getattr(f, 'name', 'file')} does not hold a JSON array")
+    pos = 1
+    eof = False
+    while True:
+        # skip whitespace and the separators between the elements
+        while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+            pos += 1
+        if pos < len(buffer) and buffer[pos] == ']':
+            return
+        try:
+            element, end = _decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            # the element continues in the next chunk
+            if eof:
+                raise
+            chunk = f.read(chunk_size)
+            eof = not chunk
+            buffer = buffer[pos:] + chunk
+            pos = 0
+            continue
+        yield element
+        pos = end
+
+
+def _name(record, *keys):
+    # nested 'name' of e.g. record['shot']['outcome'], None if a level is missing
+    for key in keys:
+        record = record.get(key)
+        if record is None:
+            return None
+    return record.get('name')
+
+
+def read_events(path):
+    """
+    Goal and period-marker events of one events file of the open-data repository (data/events/<id>.json):
+    shots with outcome Goal, 'Own Goal For' and 'Half Start' records. The other events are parsed one
+    at a time and dropped right away.
+
+    Returns:
+    DataFrame with the flattened columns type, shot_outcome, period, minute and team of statsbombpy's
+    sb.events, in the order of the file.
+    """
+    rows = []
+    with open(path, encoding='utf-8') as f:
+        for event in iter_json_array(f):
+            event_type = _name(event, 'type')
+            shot_outcome = _name(event, 'shot', 'outcome') if 'shot' in event else None
+            if shot_outcome == 'Goal' or event_type in KEEP_TYPES:
+                rows.append((event_type, shot_outcome, event['period'], event['minute'], _name(event, 'team')))
+    return pd.DataFrame(rows, columns=EVENT_FIELDS)
+
+
+def _read_events_or_none(path):
+    # runs in the worker processes, a broken file must not abort the season
+    try:
+        return read_events(path)
+    except (OSError, ValueError) as err:
+        warnings.warn(f"could not read {path}: {err!r}")
+        return None
+
+
+class OpenDataClient:
+    """
+    StatsBomb client reading a local checkout of the open-data repository (github.com/statsbomb/open-data),
+    a drop-in replacement of statsbombpy's sb for make_df / make_df_tournament without network access.
+
+    The events files are stream-parsed and only the goal and period-marker events are kept, so the
+    memory of a worker stays at the size of one event plus one chunk of the file. Through iter_events,
+    ingestion parses the files in parallel worker processes.
+
+    root: folder of the checkout, holding the data folder
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.data_dir = os.path.join(root, 'data')
+
+    def competitions(self):
+        with open(os.path.join(self.data_dir, 'competitions.json'), encoding='utf-8') as f:
+            return pd.DataFrame(json.load(f))
+
+    def matches(self, competition_id, season_id):
+        path = os.path.join(self.data_dir, 'matches', str(competition_id), f"{season_id}.json")
+        rows = []
+        with open(path, encoding='utf-8') as f:
+            for match in iter_json_array(f):
+                rows.append((match['match_id'], match['home_team']['home_team_name'],
+                             match['away_team']['away_team_name'], _name(match, 'competition_stage')))
+        return pd.DataFrame(rows, columns=['match_id', 'home_team', 'away_team', 'competition_stage'])
+
+    def events_path(self, match_id):
+        return os.path.join(self.data_dir, 'events', f"{match_id}.json")
+
+    def events(self, match_id):
+        return read_events(self.events_path(match_id))
+
+    def iter_events(self, match_ids, max_workers):
+        """
+        Events of several matches parsed in parallel worker processes, see ingestion.iter_events.
+
+        Yields:
+        (match_id, events) tuples in the order of match_ids, events is None if the file could not be read.
+        """
+        match_ids = list(match_ids)
+        paths = [self.events_path(match_id) for match_id in match_ids]
+        if max_workers <= 1:
+            yield from zip(match_ids, map(_read_events_or_none, paths))
+            return
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            # the files are small, so hand them out in chunks to keep the inter-process overhead low
+            chunksize = max(1, min(64, len(paths) // (4 * max_workers)))
+            yield from zip(match_ids, pool.map(_read_events_or_none, paths, chunksize=chunksize))
+
+
+def ingest_open_data(root, csv_dir="", max_workers=None, incremental=False, competitions=None):
+    """
+    Build the goal csvs of all competitions and seasons of a local open-data checkout (or the given
+    ones). International competitions are ingested as tournaments, the others as leagues.
+
+    root: folder of the checkout
+    csv_dir: folder the csvs are written to
+    max_workers: number of worker processes parsing the events files, default the number of cores
+    incremental: see ingestion.make_df
+    competitions: optional list of (competition_id, season_id) pairs
+
+    Returns:
+    Dictionary (competition_id, season_id) -> list of match ids whose events could not be read.
+    """
+    from ingestion import make_df, make_df_tournament
+
+    client = OpenDataClient(root)
+    max_workers = max_workers or os.cpu_count()
+    entries = client.competitions()
+    if competitions is not None:
+        keys = pd.MultiIndex.from_frame(entries[['competition_id', 'season_id']])
+        entries = entries[keys.isin(competitions)]
+
+    failed = {}
+    for entry in entries.to_dict('records'):
+        key = (entry['competition_id'], entry['season_id'])
+        make = make_df_tournament if entry.get('competition_international') else make_df
+        failed[key] = make(*key, client=client, max_workers=max_workers, csv_dir=csv_dir, incremental=incremental)
+    return failed
+
+
+if __name__ == '__main__':
+    # Ingest a local checkout and compare the parsing with loading and flattening the whole events files
+    import argparse
+    import glob
+    import time
+    import metrics
+
+    metrics.configure_logging()
+    parser = argparse.ArgumentParser(description="Build the goal csvs from a local StatsBomb open-data checkout.")
+    parser.add_argument('root', help="folder of the open-data checkout")
+    parser.add_argument('--csv-dir', default='')
+    parser.add_argument('--max-workers', type=int)
+    args = parser.parse_args()
+
+    paths = sorted(glob.glob(os.path.join(args.root, 'data', 'events', '*.json')))[:200]
+    n_bytes = sum(os.path.getsize(path) for path in paths)
+    start = time.perf_counter()
+    for path in paths:
+        read_events(path)
+    streamed = time.perf_counter() - start
+    start = time.perf_counter()
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            pd.json_normalize(json.load(f), sep='_')
+    materialized = time.perf_counter() - start
+    print(f"{len(paths)} events files, {n_bytes / 1e6:.1f}MB: streaming {n_bytes / 1e6 / streamed:.1f}MB/s, "
+          f"json.load + json_normalize {n_bytes / 1e6 / materialized:.1f}MB/s")
+
+    start = time.perf_counter()
+    failed = ingest_open_data(args.root, csv_dir=args.csv_dir, max_workers=args.max_workers)
+    print(f"ingested {len(failed)} competitions and seasons in {time.perf_counter() - start:.1f}s")
+    for key, match_ids in failed.items():
+        if match_ids:
+            print(f"{key}: {len(match_ids)} events files could not be read")
@@ -0,0 +1,230 @@
+import numpy as np
+from scipy.stats import binom, norm
+
+# Minutes of the regular time of each period as counted by StatsBomb: the second half starts at 45,
+# extra-time at 90 and 105. Stoppage time keeps counting (45, 46, ...) after the end of a period.
+PERIOD_MINUTES = {1: (0, 45), 2: (45, 90), 3: (90, 105), 4: (105, 120)}
+# Minutes after the end of a period that are counted as its stoppage time, see timeline.STOPPAGE_SLOTS
+STOPPAGE_MINUTES = 15
+
+CORRECTIONS = ('bonferroni', 'holm', 'bh')
+TESTS = ('z', 'exact', 'mid-p')
+
+
+def poisson_rate_test(rate1, n1, rate2, n2):
+    """
+    Perform a two-sample Z-test for comparing two Poisson rates.
+
+    rate1: Poisson rate (goals per match) for group 1 (e.g., home team)
+    n1: Number of observations (matches) for group 1
+    rate2: Poisson rate (goals per match) for group 2 (e.g., away team)
+    n2: Number of observations (matches) for group 2
+
+    Returns:
+    Z-statistic and two-tailed p-value.
+    """
+    # Calculate the difference in rates and standard error of the difference
+    diff_rate = rate1 - rate2
+    std_error = np.sqrt(rate1 / n1 + rate2 / n2)
+
+    # Calculate the Z-statistic
+    z = diff_rate / std_error
+
+    # Two-tailed p-value from Z-distribution
+    p_value = 2 * norm.sf(np.abs(z))
+    return z, p_value
+
+
+def _first_true(predicate, lo, hi):
+    # smallest x in [lo, hi) with predicate(x) true for every element, hi if there is none (predicate monotone)
+    lo, hi = lo.copy(), hi.copy()
+    for _ in range(int(np.max(hi - lo, initial=0)).bit_length() + 1):
+        mid = (lo + hi) // 2
+        searching = lo < hi
+        found = searching & predicate(np.minimum(mid, hi - 1))
+        hi = np.where(found, mid, hi)
+        lo = np.where(searching & ~found, mid + 1, lo)
+    return lo
+
+
+def exact_rate_test(count1, exposure1, count2, exposure2, mid_p=False):
+    """
+    Exact conditional test for comparing two Poisson rates. Given the total count, count1 is binomial
+    with probability exposure1 / (exposure1 + exposure2) if the rates are equal. Unlike the Z-test it
+    stays valid for the small counts of short intervals or extra-time. All arguments may be arrays,
+    the tests of all elements are computed at once.
+
+    count1, count2: number of goals of group 1 and 2
+    exposure1, exposure2: exposure of group 1 and 2 (e.g. number of matches)
+    mid_p: if True, return the two-sided mid-p-value: twice the smaller one-sided p-value counting only half
+        of the probability of the observed count, at most 1
+
+    Returns:
+    Rate ratio and two-tailed p-value (all counts at most as likely as the observed one, as scipy.stats.binomtest,
+    or the mid-p-value).
+    """
+    count1, count2, exposure1, exposure2 = np.broadcast_arrays(count1, count2, exposure1, exposure2)
+    count1, count2 = count1.astype(np.int64), count2.astype(np.int64)
+    n = count1 + count2
+    prob = exposure1 / (exposure1 + exposure2)
+    mean = n * prob
+    likelihood = binom.pmf(count1, n, prob)
+    threshold = likelihood * (1 + 1e-7)  # relative tolerance of scipy.stats.binomtest
+
+    # first count on the other side of the mean that is at most as likely as the observed one
+    upper = _first_true(lambda x: binom.pmf(x, n, prob) <= threshold, np.ceil(mean).astype(np.int64), n + 1)
+    lower = _first_true(lambda x: binom.pmf(x, n, prob) > threshold, np.zeros_like(n), np.floor(mean).astype(np.int64) + 1) - 1
+    p_value = np.where(count1 < mean, binom.cdf(count1, n, prob) + binom.sf(upper - 1, n, prob),
+                       binom.cdf(lower, n, prob) + binom.sf(count1 - 1, n, prob))
+    p_value = np.where(count1 == mean, 1.0, np.minimum(p_value, 1.0))
+    if mid_p:
+        # twice the smaller one-sided mid-p-value, which counts half the probability of the observed count
+        # (halving only the observed count in the sum above would still count a mirrored tie in full)
+        lower_tail = binom.cdf(count1 - 1, n, prob) + likelihood / 2
+        upper_tail = binom.sf(count1, n, prob) + likelihood / 2
+        p_value = np.minimum(2 * np.minimum(lower_tail, upper_tail), 1.0)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rate_ratio = (count1 / exposure1) / (count2 / exposure2)
+    return rate_ratio, p_value
+
+
+def period_intervals(bin_width, periods=(1, 2), stoppage_time=False):
+    """
+    Intervals of bin_width minutes covering the regular time of the given periods. If bin_width does
+    not divide a period, its last interval is shorter.
+
+    bin_width: length of the intervals in minutes
+    periods: periods to cover (1, 2 for the halves, 3, 4 for extra-time)
+    stoppage_time: if True, add one interval for the stoppage time at the end of each period
+
+    Returns:
+    Integer array with one row (period, start, stop) per interval, goals with start <= goal_time < stop
+    in that period fall into it.
+    """
+    intervals = []
+    for period in periods:
+        first, last = PERIOD_MINUTES[period]
+        starts = np.arange(first, last, bin_width)
+        stops = np.minimum(starts + bin_width, last)
+        intervals += [(period, start, stop) for start, stop in zip(starts, stops)]
+        if stoppage_time:
+            intervals.append((period, last, last + STOPPAGE_MINUTES))
+    return np.array(intervals, dtype=np.int64).reshape(-1, 3)
+
+
+def interval_counts(period, goal_time, intervals):
+    """
+    Number of goals in each interval, counted in a single pass over the goals. The goals are counted
+    per period and minute once, each interval is then a difference of prefix sums, so the intervals
+    may have any length and may overlap.
+
+    period: periods of the goals
+    goal_time: minutes of the goals
+    intervals: array with rows (period, start, stop), e.g. from period_intervals
+
+    Returns:
+    Array with the number of goals in each interval.
+    """
+    period = np.asarray(period, dtype=np.int64)
+    goal_time = np.asarray(goal_time, dtype=np.int64)
+    intervals = np.asarray(intervals, dtype=np.int64).reshape(-1, 3)
+    n_periods = int(max(period.max(initial=0), intervals[:, 0].max(initial=0))) + 1
+    n_minutes = int(max(goal_time.max(initial=-1) + 1, intervals[:, 2].max(initial=0)))
+
+    counts = np.bincount(period * n_minutes + goal_time, minlength=n_periods * n_minutes)
+    cumsum = np.zeros((n_periods, n_minutes + 1), dtype=np.int64)
+    np.cumsum(counts.reshape(n_periods, n_minutes), axis=1, out=cumsum[:, 1:])
+    return cumsum[intervals[:, 0], intervals[:, 2]] - cumsum[intervals[:, 0], intervals[:, 1]]
+
+
+def adjust_p_values(p_values, method):
+    """
+    Correct p-values for multiple comparisons.
+
+    p_values: array of p-values of all comparisons
+    method: 'bonferroni', 'holm' (step-down family-wise error rate) or 'bh' (Benjamini-Hochberg
+            false discovery rate)
+
+    Returns:
+    Array of the adjusted p-values, in the order of p_values.
+    """
+    p_values = np.asarray(p_values, dtype=float)
+    m = p_values.size
+    if method == 'bonferroni':
+        return np.minimum(p_values * m, 1)
+    if method not in CORRECTIONS:
+        raise ValueError(f"Unknown correction {method!r}, use one of {CORRECTIONS}")
+
+    order = np.argsort(p_values, axis=None)
+    p_sorted = p_values.ravel()[order]
+    rank = np.arange(1, m + 1)
+    if method == 'holm':
+        adjusted = np.maximum.accumulate((m - rank + 1) * p_sorted)
+    else:
+        adjusted = np.minimum.accumulate((m / rank * p_sorted)[::-1])[::-1]
+    result = np.empty(m)
+    result[order] = np.minimum(adjusted, 1)
+    return result.reshape(p_values.shape)
+
+
+def pairwise_rate_tests(counts, exposures, correction=None, test='z'):
+    """
+    Poisson rate tests between all pairs of intervals, computed as array operations on the counts.
+    The rate of an interval is its number of goals per unit of exposure, with equal exposures the
+    Z-test equals poisson_rate_test on goals per match.
+
+    counts: number of goals in each interval, e.g. from interval_counts
+    exposures: exposure of each interval, e.g. number of matches times interval length in minutes
+    correction: None, or a method of adjust_p_values applied over the k(k-1)/2 distinct pairs
+    test: 'z' for the Z-test, 'exact' or 'mid-p' for exact_rate_test (better for sparse intervals)
+
+    Returns:
+    Statistic (Z-statistic or rate ratio) and two-tailed p-value matrices, entry [j, i] tests interval j
+    against interval i. The p-values are symmetric and 1 on the diagonal.
+    """
+    if test not in TESTS:
+        raise ValueError(f"Unknown test {test!r}, use one of {TESTS}")
+    counts = np.asarray(counts, dtype=float)
+    exposures = np.broadcast_to(np.asarray(exposures, dtype=float), counts.shape)
+
+    if test == 'z':
+        rates = counts / exposures
+        variances = rates / exposures
+        with np.errstate(divide='ignore', invalid='ignore'):
+            statistic = (rates[:, None] - rates[None, :]) / np.sqrt(variances[:, None] + variances[None, :])
+        # two intervals without goals do not differ
+        statistic = np.nan_to_num(statistic, nan=0.0)
+        p_values = 2 * norm.sf(np.abs(statistic))
+    else:
+        statistic, p_values = exact_rate_test(counts[:, None], exposures[:, None], counts[None, :], exposures[None, :],
+                                              mid_p=test == 'mid-p')
+        np.fill_diagonal(p_values, 1.0)
+
+    if correction is not None:
+        rows, cols = np.tril_indices(len(counts), -1)
+        adjusted = adjust_p_values(p_values[rows, cols], correction)
+        p_values = np.ones_like(p_values)
+        p_values[rows, cols] = adjusted
+        p_values[cols, rows] = adjusted
+    return statistic, p_values
+
+
+if __name__ == '__main__':
+    # Check the exact tests against scipy and against hand-computed mid-p-values
+    from scipy.stats import binomtest
+
+    for count1, count2, exposure1, exposure2 in [(2, 4, 1, 1), (3, 3, 1, 1), (7, 1, 2, 3), (0, 5, 1, 1), (40, 25, 380, 380)]:
+        _, p_value = exact_rate_test(count1, exposure1, count2, exposure2)
+        expected = binomtest(count1, count1 + count2, exposure1 / (exposure1 + exposure2)).pvalue
+        assert np.isclose(p_value, expected), (count1, count2, p_value, expected)
+
+    # 2 vs 4 goals with equal exposures: P(X < 2) = 7/64 and P(X = 2) = 15/64 for X ~ Binomial(6, 1/2),
+    # so the mid-p-value is 2 * (7/64 + 15/128) = 29/64; the mirrored 4 vs 2 gives the same
+    assert np.isclose(exact_rate_test(2, 1, 4, 1, mid_p=True)[1], 29 / 64)
+    assert np.isclose(exact_rate_test(4, 1, 2, 1, mid_p=True)[1], 29 / 64)
+    # the expected count of a symmetric test: both one-sided mid-p-values are 1/2
+    assert np.isclose(exact_rate_test(3, 1, 3, 1, mid_p=True)[1], 1.0)
+    # unequal exposures, X ~ Binomial(8, 2/5): 2 * P(X > 7) + P(X = 7) = 2 * 0.4**8 + 8 * 0.4**7 * 0.6
+    assert np.isclose(exact_rate_test(7, 2, 1, 3, mid_p=True)[1], 2 * 0.4**8 + 8 * 0.4**7 * 0.6)
+    print("exact_rate_test: p-values and mid-p-values match the references")
@@ -0,0 +1,249 @@
+import hashlib
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import catalog
+import dataset
+from histogram_engine import AWAY, HOME
+from timeline import adjusted_goal_time
+
+# Bump when the rendering code changes, so all figures are rendered again
+RENDER_VERSION = 1
+
+MANIFEST_NAME = '.render_manifest.json'
+
+# Timeline windows of the histograms: range of the bins and the tick labels (one per 15 minutes)
+WINDOWS = {
+    'regular': {'end': 125, 'periods': [1, 2],
+                'labels': ['0-15', '15-30', '30-45', '45+', '45-60', '60-75', '75-90', '90+']},
+    'extra_time': {'end': 185, 'periods': [1, 2, 3, 4],
+                   'labels': ['0-15', '15-30', '30-45', '45+', '45-60', '60-75', '75-90', '90+', '90-105', '105+',
+                              '105-120', '120+']},
+    # regular minutes of the first half only, the stoppage time is left out
+    'first_half': {'end': 45, 'periods': [1], 'labels': None},
+}
+
+# Options of a figure specification and their defaults
+DEFAULT_SPEC = {
+    'name': None,  # file name of the figure without extension
+    'datasets': 'TOP5_2015_16',  # group of the catalog, name of a dataset or list of names
+    'stage': None,  # None, 'group' or 'knockout' (tournaments)
+    'side': None,  # None, 'home' or 'away' (leagues)
+    'window': 'regular',  # see WINDOWS
+    'bin_width': 15,
+    'color': '#EA8C55',
+    'title': 'Distribution of goals in top five European leagues',
+    'ylim_per_minute': 0.06,  # upper limit of the y-axis is this times the bin width
+    'style': 'dark_background',
+    'figsize': [10, 6],
+    'format': 'png',
+}
+
+# The figures of goal_times.py and Half_Analysis
+FIGURES = [
+    {'name': 'group_stage', 'datasets': 'TOURNAMENTS', 'stage': 'group', 'color': '#9C0D38',
+     'title': 'Distribution of goals during group-stage matches'},
+    {'name': 'knockout', 'datasets': 'TOURNAMENTS', 'stage': 'knockout', 'window': 'extra_time', 'color': '#B3C2F2',
+     'title': 'Distribution of goals during knockout matches'},
+    {'name': 'clubs'},
+    {'name': 'first_half', 'window': 'first_half', 'bin_width': 5, 'color': '#9C0D38',
+     'title': 'Distribution of goals during first half'},
+]
+
+
+def expand_grid(template, **axes):
+    """
+    Figure specifications of all combinations of the given options, e.g.
+    expand_grid({'name': 'clubs_{datasets}_{side}_{bin_width}'}, datasets=['England', 'Spain'], side=['home', 'away']).
+    The name (and title) of the template are formatted with the options of each combination.
+
+    Returns:
+    List of specifications.
+    """
+    specs = []
+    for values in itertools.product(*axes.values()):
+        spec = {**DEFAULT_SPEC, **template, **dict(zip(axes, values))}
+        labels = {key: str(value).replace(' ', '_') for key, value in spec.items() if not isinstance(value, list)}
+        spec['name'] = spec['name'].format(**labels)
+        spec['title'] = spec['title'].format(**{key: spec[key] for key in axes})
+        specs.append(spec)
+    return specs
+
+
+def resolve_datasets(datasets):
+    # (competition_id, season_id) keys of a group of the catalog, a dataset name or a list of names
+    groups = {'TOP5_2015_16': catalog.TOP5_2015_16, 'TOURNAMENTS': catalog.TOURNAMENTS, 'ALL': list(catalog.CATALOG)}
+    if isinstance(datasets, str):
+        if datasets in groups:
+            return list(groups[datasets])
+        datasets = [datasets]
+    names = {entry['name']: key for key, entry in catalog.CATALOG.items()}
+    return [names[name] for name in datasets]
+
+
+def input_fingerprint(keys):
+    # size and modification time of the files a dataset is read from, see catalog._load
+    fingerprint = []
+    for key in keys:
+        for path in [catalog.csv_path(*key), dataset.partition_path(*key, catalog.DATASET_DIR)]:
+            if os.path.exists(path):
+                stat = os.stat(path)
+                fingerprint.append([path, stat.st_size, stat.st_mtime_ns])
+    return fingerprint
+
+
+def spec_hash(spec):
+    """
+    Returns:
+    Hash of everything a figure depends on: the specification, its input files and the renderer.
+    """
+    import matplotlib
+    content = json.dumps({'spec': spec, 'inputs': input_fingerprint(resolve_datasets(spec['datasets'])),
+                          'version': RENDER_VERSION, 'matplotlib': matplotlib.__version__}, sort_keys=True)
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def histogram_data(spec):
+    """
+    Goal minutes on the timeline and their weights (goals per match) of a figure specification.
+    Extra-time goals are divided by the number of matches that went to extra-time.
+    """
+    keys = resolve_datasets(spec['datasets'])
+    window = WINDOWS[spec['window']]
+    goals = catalog.union(keys)
+    counts = catalog.match_counts(keys)
+    if spec['stage'] == 'group':
+        goals = goals[goals['stage'] == 'Group Stage']
+        n_matches = counts['n_matches_group']
+    elif spec['stage'] == 'knockout':
+        goals = goals[goals['stage'] != 'Group Stage']
+        n_matches = counts['n_matches_ko']
+    else:
+        n_matches = counts.get('n_matches', counts.get('n_matches_group', 0) + counts.get('n_matches_ko', 0))
+    if spec['side'] is not None:
+        goals = goals[goals['home'] == {'home': HOME, 'away': AWAY}[spec['side']]]
+    goals = goals[goals['period'].isin(window['periods'])]
+    if spec['window'] == 'first_half':
+        goals = goals[goals['goal_time'] < 45]
+
+    minutes = adjusted_goal_time(goals['period'], goals['goal_time'])
+    extra_time = goals['period'].to_numpy() > 2
+    weights = np.where(extra_time, 1 / max(counts.get('n_matches_ET', 0), 1), 1 / n_matches)
+    return minutes, weights
+
+
+def render(spec, out_dir='.'):
+    """
+    Render one figure specification with the object-oriented matplotlib API (no global pyplot state
+    is changed, so specs can be rendered in any order and process) and save it to out_dir.
+
+    Returns:
+    Path of the figure.
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    spec = {**DEFAULT_SPEC, **spec}
+    window = WINDOWS[spec['window']]
+    minutes, weights = histogram_data(spec)
+    bin_width = spec['bin_width']
+
+    with plt.style.context(spec['style']):
+        fig, ax = plt.subplots(figsize=spec['figsize'])
+        ax.hist(minutes, bins=range(0, window['end'] + 1, bin_width), edgecolor='black', color=spec['color'],
+                weights=weights)
+        ax.set_title(spec['title'])
+        ax.set_xlabel('Minutes')
+        ax.set_ylabel('Goals / Match')
+        if window['labels']:
+            ax.set_xticks(range(7, window['end'] + 1, 15), labels=window['labels'])
+        ax.set_ylim(0, spec['ylim_per_minute'] * bin_width)
+        ax.tick_params(left=False, bottom=False)
+        path = os.path.join(out_dir, f"{spec['name']}.{spec['format']}")
+        fig.savefig(path)
+        plt.close(fig)
+    return path
+
+
+def _render_batch(specs, out_dir):
+    # runs in the worker processes
+    return [render(spec, out_dir) for spec in specs]
+
+
+def render_all(specs, out_dir='.', max_processes=None, force=False):
+    """
+    Render many figure specifications in parallel worker processes on the Agg backend. Specs whose
+    inputs, options and renderer are unchanged since the last render (see the manifest in out_dir)
+    are skipped, unless force is set.
+
+    specs: list of specifications, see DEFAULT_SPEC, FIGURES and expand_grid
+    max_processes: number of worker processes, default the number of cores
+
+    Returns:
+    Dictionary with the lists of 'rendered' and 'skipped' figure names and the wall time in 'seconds'.
+    """
+    start = time.perf_counter()
+    os.makedirs(out_dir, exist_ok=True)
+    manifest_path = os.path.join(out_dir, MANIFEST_NAME)
+    try:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        manifest = {}
+
+    specs = [{**DEFAULT_SPEC, **spec} for spec in specs]
+    hashes = {spec['name']: spec_hash(spec) for spec in specs}
+    todo = [spec for spec in specs if force or manifest.get(spec['name']) != hashes[spec['name']]
+            or not os.path.exists(os.path.join(out_dir, f"{spec['name']}.{spec['format']}"))]
+    skipped = [spec['name'] for spec in specs if spec not in todo]
+
+    max_processes = max_processes or os.cpu_count()
+    if todo:
+        if max_processes <= 1 or len(todo) == 1:
+            _render_batch(todo, out_dir)
+        else:
+            # a few specs per task, so the import of matplotlib and the data loading are amortized
+            chunk = max(1, -(-len(todo) // (4 * max_processes)))
+            with ProcessPoolExecutor(max_workers=max_processes) as pool:
+                list(pool.map(_render_batch, [todo[i:i + chunk] for i in range(0, len(todo), chunk)],
+                              itertools.repeat(out_dir)))
+
+    manifest.update({spec['name']: hashes[spec['name']] for spec in todo})
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+    return {'rendered': [spec['name'] for spec in todo], 'skipped': skipped, 'seconds': time.perf_counter() - start}
+
+
+# Variants for a post: every league and tournament stage per bin width and side
+VARIANTS = (
+    expand_grid({'name': 'league_{datasets}_{side}_{bin_width}', 'title': 'Distribution of goals - {datasets}'},
+                datasets=list(catalog.LEAGUES), side=[None, 'home', 'away'], bin_width=[1, 3, 5, 15])
+    + expand_grid({'name': 'tournament_{datasets}_{stage}_{bin_width}', 'window': 'extra_time', 'color': '#B3C2F2',
+                   'title': 'Distribution of goals - {datasets} ({stage})'},
+                  datasets=[catalog.CATALOG[key]['name'] for key in catalog.TOURNAMENTS], stage=['group', 'knockout'],
+                  bin_width=[5, 15])
+)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Render the static figures in parallel, skipping unchanged ones.")
+    parser.add_argument('--grid', choices=['figures', 'variants', 'all'], default='figures')
+    parser.add_argument('--out-dir', default='.')
+    parser.add_argument('--max-processes', type=int)
+    parser.add_argument('--force', action='store_true', help="render all specs, also unchanged ones")
+    args = parser.parse_args()
+
+    specs = {'figures': FIGURES, 'variants': VARIANTS, 'all': FIGURES + VARIANTS}[args.grid]
+    result = render_all(specs, args.out_dir, args.max_processes, args.force)
+    print(f"rendered {len(result['rendered'])}, skipped {len(result['skipped'])} unchanged figures "
+          f"in {result['seconds']:.2f}s")
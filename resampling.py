@@ -0,0 +1,230 @@
+import atexit
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from histogram_engine import AWAY, HOME
+
+DEFAULT_BATCH_SIZE = 50_000  # resamples drawn in one vectorized call
+
+# worker processes shared by all tests, started on first use and kept until the interpreter exits
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def per_match_counts(goals_df, n_matches):
+    """
+    Number of home and away goals of every match, including the matches without goals.
+
+    goals_df: goals with 'match_id' and 'home' columns
+    n_matches: number of matches the goals were scored in
+
+    Returns:
+    Tuple (home_counts, away_counts) of arrays of length n_matches.
+    """
+    match_index = np.unique(goals_df['match_id'], return_inverse=True)[1]
+    side = goals_df['home'].to_numpy()
+    home_counts = np.bincount(match_index[side == HOME], minlength=n_matches)
+    away_counts = np.bincount(match_index[side == AWAY], minlength=n_matches)
+    return home_counts, away_counts
+
+
+class RateDifference:
+    """
+    Difference of the home and away goals per match.
+
+    The permutation test swaps home and away within random matches, so only the per-match differences
+    matter: the number of swapped matches of each difference is binomial. The bootstrap resamples the
+    matches, i.e. draws the frequencies of the differences from a multinomial. Both work on the few
+    distinct differences instead of the matches.
+
+    home_counts, away_counts: goals of the home and away team of every match, see per_match_counts
+    """
+
+    def __init__(self, home_counts, away_counts):
+        differences = np.asarray(home_counts, dtype=np.int64) - np.asarray(away_counts, dtype=np.int64)
+        self.n = len(differences)
+        self.values, self.counts = np.unique(differences, return_counts=True)
+        self.statistic = differences.mean()
+
+    def permutation(self, rng, size):
+        values, counts = np.abs(self.values), self.counts
+        swapped = rng.binomial(counts[values > 0], 0.5, size=(size, np.sum(values > 0)))
+        return (counts[values > 0] - 2 * swapped) @ values[values > 0] / self.n
+
+    def bootstrap(self, rng, size):
+        frequencies = rng.multinomial(self.n, self.counts / self.n, size=size)
+        return frequencies @ self.values / self.n
+
+
+class MedianDifference:
+    """
+    Difference of the median minute of the home goals and the away goals.
+
+    Goal minutes are integers, so a permutation is fully described by how many goals of each minute
+    go to the home side, which is multivariate hypergeometric. The bootstrap only needs the middle order
+    statistics of each resample: the k-th smallest of n uniforms is Beta distributed, and resampling
+    with replacement maps it to the sorted minutes.
+
+    home_minutes, away_minutes: minutes of the home and away goals
+    """
+
+    def __init__(self, home_minutes, away_minutes):
+        home_minutes = np.asarray(home_minutes, dtype=np.int64)
+        away_minutes = np.asarray(away_minutes, dtype=np.int64)
+        if len(home_minutes) == 0 or len(away_minutes) == 0:
+            raise ValueError(f"the median difference needs goals on both sides, got {len(home_minutes)} home and "
+                             f"{len(away_minutes)} away goals")
+        self.first = min(home_minutes.min(), away_minutes.min())
+        n_minutes = max(home_minutes.max(), away_minutes.max()) - self.first + 1
+        self.home = np.bincount(home_minutes - self.first, minlength=n_minutes)
+        self.away = np.bincount(away_minutes - self.first, minlength=n_minutes)
+        self.n_home, self.n_away = len(home_minutes), len(away_minutes)
+        self.home_sorted, self.away_sorted = np.sort(home_minutes), np.sort(away_minutes)
+        self.statistic = np.median(home_minutes) - np.median(away_minutes)
+
+    def _medians(self, minute_counts, n):
+        # median of each row of minute counts, averaging the two middle goals like np.median
+        cumsum = np.cumsum(minute_counts, axis=1)
+        lower = np.argmax(cumsum > (n - 1) // 2, axis=1)
+        upper = np.argmax(cumsum > n // 2, axis=1)
+        return self.first + (lower + upper) / 2
+
+    def permutation(self, rng, size):
+        home = rng.multivariate_hypergeometric(self.home + self.away, self.n_home, size=size)
+        away = self.home + self.away - home
+        return self._medians(home, self.n_home) - self._medians(away, self.n_away)
+
+    @staticmethod
+    def _bootstrap_medians(rng, minutes, size):
+        # uniforms of the two middle order statistics, the upper one is the smallest uniform above the lower
+        n = len(minutes)
+        lower = (n - 1) // 2
+        u_lower = rng.beta(lower + 1, n - lower, size=size)
+        u_upper = u_lower if n % 2 else u_lower + (1 - u_lower) * rng.beta(1, n - lower - 1, size=size)
+        lower_minute = minutes[np.minimum((n * u_lower).astype(np.int64), n - 1)]
+        upper_minute = minutes[np.minimum((n * u_upper).astype(np.int64), n - 1)]
+        return (lower_minute + upper_minute) / 2
+
+    def bootstrap(self, rng, size):
+        return self._bootstrap_medians(rng, self.home_sorted, size) - self._bootstrap_medians(rng, self.away_sorted, size)
+
+
+def _check_resamples(n_resamples):
+    if n_resamples < 1:
+        raise ValueError(f"n_resamples must be at least 1, got {n_resamples}")
+
+
+def _resample(statistic, method, seed, size):
+    return getattr(statistic, method)(np.random.default_rng(seed), size)
+
+
+def _shutdown_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True, cancel_futures=True)
+            _pool = None
+
+
+def _get_pool(max_workers):
+    # the pool of the tests, replaced if a test asks for another number of workers
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is not None and _pool_workers != max_workers:
+            _pool.shutdown(wait=True, cancel_futures=True)
+            _pool = None
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=max_workers)
+            _pool_workers = max_workers
+            atexit.register(_shutdown_pool)
+        return _pool
+
+
+def iter_batches(statistic, method, n_resamples, batch_size=DEFAULT_BATCH_SIZE, seed=0, max_workers=None):
+    """
+    Resampled statistics, batch by batch and in order. Batch i is always drawn from the i-th child of
+    the seed, so the results do not depend on the number of workers. The worker processes are started
+    by the first call and reused by the later ones. Stopping the iteration early cancels the batches
+    that have not started yet.
+
+    statistic: RateDifference, MedianDifference or any object with the resampling method
+    method: 'permutation' or 'bootstrap'
+    n_resamples: total number of resamples, split into batches of batch_size and a smaller last one
+    batch_size: number of resamples per batch
+    seed: seed of the NumPy Generators
+    max_workers: number of processes (default: number of CPUs), 1 runs the batches in this process
+    """
+    sizes = [batch_size] * (n_resamples // batch_size) + ([n_resamples % batch_size] if n_resamples % batch_size else [])
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    max_workers = max_workers or os.cpu_count()
+    if max_workers == 1 or len(sizes) == 1:
+        for batch_seed, size in zip(seeds, sizes):
+            yield _resample(statistic, method, batch_seed, size)
+        return
+
+    # keep a bounded window of submitted batches, so an early stop wastes at most the window
+    pool = _get_pool(max_workers)
+    futures = []
+    try:
+        submitted = 0
+        for i in range(len(sizes)):
+            while submitted < len(sizes) and submitted < i + 2 * max_workers:
+                futures.append(pool.submit(_resample, statistic, method, seeds[submitted], sizes[submitted]))
+                submitted += 1
+            yield futures[i].result()
+            futures[i] = None
+    finally:
+        for future in futures:
+            if future is not None:
+                future.cancel()
+
+
+def permutation_test(statistic, n_resamples=10**6, tolerance=None, batch_size=DEFAULT_BATCH_SIZE, seed=0,
+                     max_workers=None):
+    """
+    Two-sided Monte Carlo permutation test. By default it draws exactly n_resamples permutations; with a
+    tolerance it stops after the first batch at which the Monte Carlo standard error of the p-value is
+    below tolerance * p-value, so small p-values are estimated as precisely (relatively) as large ones.
+
+    statistic: RateDifference or MedianDifference of the two groups
+    n_resamples: number of permutations drawn, the most drawn with a tolerance (at least 1)
+    tolerance: relative Monte Carlo error at which to stop early, e.g. 0.05, None never stops early
+
+    Returns:
+    Dictionary with the observed statistic, the p-value, its Monte Carlo error and the number of
+    permutations drawn.
+    """
+    _check_resamples(n_resamples)
+    observed = abs(statistic.statistic)
+    exceed = drawn = 0
+    for batch in iter_batches(statistic, 'permutation', n_resamples, batch_size, seed, max_workers):
+        # small slack, so permutations equal to the observed value are not lost to rounding
+        exceed += int(np.sum(np.abs(batch) >= observed - 1e-9))
+        drawn += len(batch)
+        p_value = (exceed + 1) / (drawn + 1)
+        mc_error = np.sqrt(p_value * (1 - p_value) / drawn)
+        if tolerance and mc_error < tolerance * p_value:
+            break
+    return {'statistic': statistic.statistic, 'p_value': p_value, 'mc_error': mc_error, 'n_resamples': drawn}
+
+
+def bootstrap_ci(statistic, n_resamples=10**5, confidence=0.95, batch_size=DEFAULT_BATCH_SIZE, seed=0,
+                 max_workers=None):
+    """
+    Percentile bootstrap confidence interval.
+
+    statistic: RateDifference or MedianDifference of the two groups
+    n_resamples: number of bootstrap resamples (at least 1)
+    confidence: coverage of the interval
+
+    Returns:
+    Dictionary with the observed statistic, the lower and upper bound and the number of resamples.
+    """
+    _check_resamples(n_resamples)
+    resampled = np.concatenate(list(iter_batches(statistic, 'bootstrap', n_resamples, batch_size, seed, max_workers)))
+    low, high = np.quantile(resampled, [(1 - confidence) / 2, (1 + confidence) / 2])
+    return {'statistic': statistic.statistic, 'low': low, 'high': high, 'n_resamples': len(resampled)}
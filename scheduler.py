@@ -0,0 +1,274 @@
+import contextlib
+import datetime
+import io
+import json
+import multiprocessing
+import os
+import random
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import catalog
+import metrics
+from aggregates import GoalAggregate
+from ingestion import DEFAULT_MAX_WORKERS, default_client, make_df, make_df_tournament
+from statsbomb_cache import CachedClient
+
+DEFAULT_RATE = 20  # requests per second to the StatsBomb API over all jobs and processes
+DEFAULT_RETRIES = 3  # retries of a failed request before the match is given up
+BACKOFF_SECONDS = 0.5  # wait before the first retry, doubled for every further retry
+PROGRESS_EVERY = 50  # matches between two progress messages of a job
+
+MODES = {'league': make_df, 'tournament': make_df_tournament}
+
+# set in every worker process by _init_worker
+_limiter = None
+_progress = None
+
+
+class RateLimiter:
+    """
+    Request-rate limit shared by all processes: every request reserves the next free slot of 1 / rate
+    seconds on a shared clock and sleeps until it comes.
+
+    rate: requests per second (None or 0 disables the limit)
+    """
+
+    def __init__(self, rate, context=multiprocessing):
+        self.interval = 1 / rate if rate else 0.0
+        self._lock = context.Lock()
+        self._next = context.Value('d', 0.0, lock=False)
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.time()
+            slot = max(self._next.value, now)
+            self._next.value = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class RateLimitedClient:
+    """
+    Wrapper of a StatsBomb client whose requests wait for the rate limit shared by the processes.
+    _run_job puts it below the on-disk cache, so only cache misses wait and a cached rebuild runs at
+    full speed.
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    def matches(self, competition_id, season_id):
+        if _limiter is not None:
+            _limiter.wait()
+        return self.client.matches(competition_id=competition_id, season_id=season_id)
+
+    def events(self, match_id):
+        if _limiter is not None:
+            _limiter.wait()
+        return self.client.events(match_id=match_id)
+
+
+def rate_limited(client):
+    # the client with the rate limit on its network requests: below the cache of a CachedClient
+    if isinstance(client, CachedClient):
+        client.client = RateLimitedClient(client.client)
+        return client
+    return RateLimitedClient(client)
+
+
+class ScheduledClient:
+    """
+    Wrapper of a StatsBomb client for a scheduled job: failed requests are retried with exponential
+    backoff and jitter, and the job's progress is reported. The rate limit is applied below, see
+    RateLimitedClient.
+
+    client: the wrapped client
+    job: name of the job in the progress messages
+    retries, backoff: number of retries and the wait before the first one in seconds
+    """
+
+    def __init__(self, client, job, retries=DEFAULT_RETRIES, backoff=BACKOFF_SECONDS):
+        self.client = client
+        self.job = job
+        self.retries = retries
+        self.backoff = backoff
+        self.n_retries = 0
+        self.n_total = 0
+        self.n_done = 0
+        self._lock = threading.Lock()
+
+    def _request(self, function, **kwargs):
+        for attempt in range(self.retries + 1):
+            try:
+                return getattr(self.client, function)(**kwargs)
+            except Exception:
+                if attempt == self.retries:
+                    raise
+                with self._lock:
+                    self.n_retries += 1
+                time.sleep(self.backoff * 2**attempt * random.uniform(0.5, 1.5))
+
+    def matches(self, competition_id, season_id):
+        matches = self._request('matches', competition_id=competition_id, season_id=season_id)
+        self.n_total = len(matches)
+        return matches
+
+    def events(self, match_id):
+        try:
+            return self._request('events', match_id=match_id)
+        finally:
+            with self._lock:
+                self.n_done += 1
+                n_done = self.n_done
+            if _progress is not None and (n_done % PROGRESS_EVERY == 0 or n_done == self.n_total):
+                _progress.put((self.job, n_done, self.n_total))
+
+
+def cached_client():
+    # default client factory: statsbombpy behind the on-disk cache (shared by the processes, see CachedClient)
+    return CachedClient(default_client())
+
+
+def catalog_jobs(keys=None):
+    """
+    Returns:
+    List of (competition_id, season_id, mode) jobs of the datasets of the catalog (default all of them).
+    """
+    keys = list(catalog.CATALOG) if keys is None else keys
+    return [(competition_id, season_id, catalog.CATALOG[(competition_id, season_id)]['kind'])
+            for competition_id, season_id in keys]
+
+
+def _job_name(competition_id, season_id):
+    entry = catalog.CATALOG.get((competition_id, season_id))
+    if entry is None:
+        return f"competition {competition_id} season {season_id}"
+    # tournament names already hold the year, e.g. 'Euro 2020'
+    return entry['name'] if entry['season'] in entry['name'] else f"{entry['name']} {entry['season']}"
+
+
+def _init_worker(limiter, progress):
+    global _limiter, _progress
+    _limiter = limiter
+    _progress = progress
+    # spawned processes do not inherit the logging setup of the parent
+    metrics.configure_logging()
+
+
+def _run_job(job, client_factory, options):
+    competition_id, season_id, mode = job
+    inner = rate_limited(client_factory())
+    client = ScheduledClient(inner, _job_name(competition_id, season_id), options.pop('retries'),
+                             options.pop('backoff'))
+    aggregate = GoalAggregate()
+    started = time.time()
+    # the per-match progress lines of ingestion would interleave, the scheduler reports progress itself
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            failed = MODES[mode](competition_id, season_id, client=client, aggregate=aggregate, **options)
+    finally:
+        # pool workers exit without running atexit, so write the cache index (merged with the other jobs') now
+        if isinstance(inner, CachedClient):
+            inner.flush()
+    return {
+        'matches': aggregate.n_matches,
+        'failed_matches': len(failed),
+        'goals': aggregate.goals(),
+        'retries': client.n_retries,
+        'started': started,
+        'duration_seconds': time.time() - started,
+    }
+
+
+def run_jobs(jobs, csv_dir="", client_factory=cached_client, max_processes=None, rate=DEFAULT_RATE,
+             retries=DEFAULT_RETRIES, backoff=BACKOFF_SECONDS, max_workers=DEFAULT_MAX_WORKERS, incremental=False,
+             report_name='ingestion_report.json'):
+    """
+    Ingest several competitions and seasons in parallel processes, one job per process at a time.
+
+    jobs: list of (competition_id, season_id, mode) with mode 'league' (make_df) or 'tournament'
+        (make_df_tournament), e.g. catalog_jobs()
+    csv_dir: folder the csvs (and the run report) are written to
+    client_factory: picklable function without arguments returning the StatsBomb client of a job
+    max_processes: number of jobs running at the same time, default the number of cores
+    rate: requests per second over all jobs
+    retries, backoff: retries of a failed request and the wait before the first one in seconds
+    max_workers, incremental: see make_df, max_workers is per job
+    report_name: name of the JSON run report in csv_dir, None writes no report
+
+    Returns:
+    The run report: dictionary with the start time, the wall time, the summed job durations and one
+    entry per job with its status, duration, number of matches, failed matches, goals and retries.
+    """
+    context = multiprocessing.get_context()
+    limiter = RateLimiter(rate, context)
+    progress = context.Queue()
+    max_processes = max_processes or os.cpu_count()
+    options = dict(csv_dir=csv_dir, max_workers=max_workers, incremental=incremental, retries=retries,
+                   backoff=backoff)
+
+    def print_progress():
+        for job, n_done, n_total in iter(progress.get, None):
+            print(f"[{job}] {n_done} / {n_total} matches")
+
+    printer = threading.Thread(target=print_progress, daemon=True)
+    printer.start()
+
+    start = time.time()
+    results = []
+    with ProcessPoolExecutor(max_workers=max_processes, mp_context=context, initializer=_init_worker,
+                             initargs=(limiter, progress)) as pool:
+        futures = {pool.submit(_run_job, job, client_factory, dict(options)): job for job in jobs}
+        for future in as_completed(futures):
+            competition_id, season_id, mode = futures[future]
+            result = {'competition_id': competition_id, 'season_id': season_id, 'mode': mode,
+                      'name': _job_name(competition_id, season_id)}
+            try:
+                result.update(status='ok', **future.result())
+            except Exception as err:
+                result.update(status='error', error=repr(err))
+            results.append(result)
+            print(f"[{result['name']}] {result['status']}" + (
+                f", {result['matches']} matches, {result['goals']} goals in {result['duration_seconds']:.1f}s"
+                if result['status'] == 'ok' else f": {result['error']}"))
+    progress.put(None)
+    printer.join()
+
+    # in the order of the jobs, not of their completion
+    order = {(job[0], job[1]): i for i, job in enumerate(jobs)}
+    results.sort(key=lambda result: order[(result['competition_id'], result['season_id'])])
+    report = {
+        'started': datetime.datetime.fromtimestamp(start).isoformat(timespec='seconds'),
+        'wall_seconds': time.time() - start,
+        'job_seconds': sum(result.get('duration_seconds', 0.0) for result in results),
+        'processes': max_processes,
+        'rate': rate,
+        'jobs': results,
+    }
+    if report_name:
+        with open(os.path.join(csv_dir, report_name), 'w') as f:
+            json.dump(report, f, indent=1)
+    return report
+
+
+def stand_in_client():
+    # client factory for trying the scheduler without network access, with the latency of the API
+    from offline_client import OfflineStatsBomb
+    return OfflineStatsBomb(n_matches=380, latency=0.05)
+
+
+if __name__ == '__main__':
+    # Ingest the whole catalog against the offline stand-in with 1, 2 and 4 processes
+    import tempfile
+
+    metrics.configure_logging()
+    for max_processes in [1, 2, 4]:
+        with tempfile.TemporaryDirectory() as tmp:
+            report = run_jobs(catalog_jobs(), csv_dir=tmp, client_factory=stand_in_client,
+                              max_processes=max_processes, rate=None)
+        print(f"{max_processes} processes: {report['wall_seconds']:.1f}s wall time, "
+              f"{report['job_seconds']:.1f}s summed over the jobs")
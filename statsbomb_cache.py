@@ -0,0 +1,229 @@
+import atexit
+import contextlib
+import hashlib
+import json
+import os
+import threading
+import time
+
+import pandas as pd
+
+import metrics
+
+try:
+    import fcntl
+except ImportError:  # Windows, the index is then written without a lock
+    fcntl = None
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.statsbomb_cache')
+
+
+class CachedClient:
+    """
+    Wrapper around a StatsBomb client (e.g. statsbombpy's sb) that keeps the match listings
+    and event frames in a persistent on-disk cache.
+
+    Every call is stored under a key derived from the function name and its arguments, as a
+    compressed pickle of the returned DataFrame. The total size of the cache is capped and the
+    least recently used entries are evicted first. Event data of a played match does not change,
+    so event frames never expire, while match listings are refetched after listing_ttl seconds
+    because new rounds get added during a season.
+
+    client: the wrapped client, answering matches(competition_id, season_id) and events(match_id)
+    cache_dir: folder holding the cache files and the index
+    max_bytes: size cap of the cache on disk
+    listing_ttl: seconds after which a cached match listing is refetched (None never expires)
+    """
+
+    FLUSH_EVERY = 200
+
+    def __init__(self, client, cache_dir=DEFAULT_CACHE_DIR, max_bytes=2 * 1024**3, listing_ttl=24 * 3600):
+        self.client = client
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.listing_ttl = listing_ttl
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self._index_path = os.path.join(cache_dir, 'index.json')
+        self._lock_path = os.path.join(cache_dir, 'index.lock')
+        self._index = self._read_index()
+        # keys removed by this process since the last write, so merging does not bring them back
+        self._removed = set()
+        # the index is written every FLUSH_EVERY changes and when the interpreter exits
+        self._changes = 0
+        atexit.register(self.flush)
+        metrics.register_collector('statsbomb', self.stats)
+
+    def matches(self, competition_id, season_id):
+        return self._cached('matches', self.listing_ttl, competition_id=competition_id, season_id=season_id)
+
+    def events(self, match_id):
+        return self._cached('events', None, match_id=match_id)
+
+    def stats(self):
+        """
+        Returns:
+        Dictionary with the number of hits, misses, expired entries and evictions,
+        the hit rate, and the number of entries and bytes currently cached.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'expired': self.expired,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'entries': len(self._index),
+                'bytes': sum(entry['size'] for entry in self._index.values()),
+            }
+
+    def flush(self):
+        with self._lock:
+            if self._changes and os.path.isdir(self.cache_dir):
+                self._write_index()
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._index):
+                self._remove(key)
+            self._write_index()
+
+    def _cached(self, function, ttl, **kwargs):
+        key = self._key(function, kwargs)
+        path = self._path(key)
+        now = time.time()
+
+        with self._lock:
+            entry = self._index.get(key)
+            if entry is not None and ttl is not None and now - entry['created'] > ttl:
+                self.expired += 1
+                self._remove(key)
+                entry = None
+
+        if entry is not None:
+            try:
+                data = pd.read_pickle(path, compression='gzip')
+            except (OSError, EOFError, ValueError):
+                data = None  # file vanished or is corrupt, fetch again
+            if data is not None:
+                with self._lock:
+                    self.hits += 1
+                    if key in self._index:
+                        self._index[key]['last_access'] = now
+                    self._changed()
+                return data
+
+        # cache miss: fetch from the wrapped client, store and evict if the cap is exceeded
+        data = getattr(self.client, function)(**kwargs)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        data.to_pickle(tmp_path, compression={'method': 'gzip', 'compresslevel': 1})
+        os.replace(tmp_path, path)
+        with self._lock:
+            self.misses += 1
+            self._index[key] = {
+                'function': function,
+                'args': kwargs,
+                'size': os.path.getsize(path),
+                'created': now,
+                'last_access': now,
+            }
+            self._evict()
+            self._changed()
+        return data
+
+    def _key(self, function, kwargs):
+        content = json.dumps({'function': function, **kwargs}, sort_keys=True, default=str)
+        return hashlib.sha1(content.encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.pkl.gz")
+
+    def _evict(self):
+        total = sum(entry['size'] for entry in self._index.values())
+        for key in sorted(self._index, key=lambda k: self._index[k]['last_access']):
+            if total <= self.max_bytes:
+                break
+            total -= self._index[key]['size']
+            self._remove(key)
+            self.evictions += 1
+
+    def _changed(self):
+        self._changes += 1
+        if self._changes >= self.FLUSH_EVERY:
+            self._write_index()
+
+    def _remove(self, key):
+        self._index.pop(key, None)
+        self._removed.add(key)
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def _load_index(self):
+        try:
+            with open(self._index_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _read_index(self):
+        index = self._load_index()
+        # drop entries whose file has been deleted by hand and adopt files written after the
+        # last flush of the index (e.g. when the previous run crashed)
+        files = {name[:-len('.pkl.gz')] for name in os.listdir(self.cache_dir) if name.endswith('.pkl.gz')}
+        index = {key: entry for key, entry in index.items() if key in files}
+        for key in files - set(index):
+            stat = os.stat(self._path(key))
+            index[key] = {'size': stat.st_size, 'created': stat.st_mtime, 'last_access': stat.st_mtime}
+        return index
+
+    @contextlib.contextmanager
+    def _index_lock(self):
+        # several processes share the cache (e.g. the jobs of scheduler.py), one writes the index at a time
+        with open(self._lock_path, 'a') as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _write_index(self):
+        with self._index_lock():
+            # merge with the entries other processes have written since, instead of overwriting them
+            merged = {key: entry for key, entry in self._load_index().items()
+                      if key not in self._removed and os.path.exists(self._path(key))}
+            for key, entry in self._index.items():
+                if key not in merged and not os.path.exists(self._path(key)):
+                    continue  # evicted by another process
+                if key not in merged or entry['last_access'] >= merged[key]['last_access']:
+                    merged[key] = entry
+            tmp_path = f"{self._index_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(merged, f)
+            os.replace(tmp_path, self._index_path)
+        self._index = merged
+        self._removed = set()
+        self._changes = 0
+
+
+if __name__ == '__main__':
+    # Compare a cold and a warm rebuild of a league season against the offline stand-in
+    import tempfile
+    from ingestion import make_df
+    from offline_client import OfflineStatsBomb
+
+    metrics.configure_logging()
+    with tempfile.TemporaryDirectory() as tmp:
+        client = CachedClient(OfflineStatsBomb(n_matches=380, latency=0.05), cache_dir=os.path.join(tmp, 'cache'))
+        for run in ['cold', 'warm']:
+            start = time.perf_counter()
+            make_df(2, 27, client=client, csv_dir=tmp)
+            print(f"{run} rebuild: {time.perf_counter() - start:.2f}s, {client.stats()}")
@@ -0,0 +1,433 @@
+import functools
+import json
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+import catalog
+from histogram_engine import AWAY, HOME, OTHER
+from rate_tests import PERIOD_MINUTES
+
+# Match ids are season_code * MAX_MATCHES + match number, so one season holds up to MAX_MATCHES matches.
+# Season codes are assigned from the registry of seasons (see SyntheticStatsBomb), at most N_SEASON_CODES
+# of them, so all ids stay in the int32 range of the dataset
+MAX_MATCHES = 10**7
+N_SEASON_CODES = 105
+
+# Events are generated for blocks of BATCH_MATCHES consecutive match ids at once (it divides MAX_MATCHES)
+BATCH_MATCHES = 1_000
+
+# Minutes of the intensity profiles, StatsBomb minutes of regular goals stay below it
+N_MINUTES = 130
+
+# Tournaments are a sequence of 64-match blocks: 48 group matches and the knockout rounds of a World Cup
+TOURNAMENT_STAGES = np.array(['Group Stage'] * 48 + ['Round of 16'] * 8 + ['Quarter-finals'] * 4
+                             + ['Semi-finals'] * 2 + ['3rd Place Final', 'Final'], dtype=object)
+TEAMS = {'league': 20, 'tournament': 32}
+
+# Event types and shot outcomes of the generated events, the filler types stand for the bulk of a match
+TYPES = np.array(['Half Start', 'Pass', 'Ball Receipt*', 'Carry', 'Pressure', 'Shot', 'Own Goal Against',
+                  'Own Goal For'], dtype=object)
+HALF_START, SHOT, OWN_GOAL_AGAINST, OWN_GOAL_FOR = 0, 5, 6, 7
+FILLER_TYPES = [1, 2, 3, 4]
+OUTCOMES = np.array([None, 'Goal', 'Saved', 'Off T', 'Blocked', 'Post', 'Wayward'], dtype=object)
+GOAL, SAVED = 1, 2
+MISS_OUTCOMES = [2, 3, 4, 5, 6]
+
+# Filler events of a match with n_filler events per 90 minutes are spread over the periods like this
+FILLER_SHARE = {1: 0.5, 2: 0.5, 3: 1 / 6, 4: 1 / 6}
+
+DEFAULT_OPTIONS = {
+    'stoppage_minutes': (2, 4, 1, 2),  # mean stoppage time of periods 1 to 4 (Poisson distributed)
+    'own_goal_share': 0.03,  # share of the goals that are own goals
+    'shots_per_match': 24,  # shots per 90 minutes, goals included
+    'penalty_success': 0.75,  # probability of scoring a penalty of a shoot-out
+}
+
+
+def intensity_profile(goals_per_match=2.75, home_share=0.56, second_half_share=0.55, late_ratio=1.4,
+                      stoppage_share=0.05, extra_time_goals=0.6, **options):
+    """
+    Parametric goal-intensity profile: the intensity rises linearly over every period and decays
+    geometrically over its stoppage time.
+
+    goals_per_match: expected goals of a match in regular time
+    home_share: share of the goals scored by the home team (0.5 for neutral venues)
+    second_half_share: share of the regular-time goals scored in the second half
+    late_ratio: intensity at the end of a period relative to its start
+    stoppage_share: share of the goals of a period scored in its stoppage time
+    extra_time_goals: expected goals of a match that goes to extra-time, during extra-time
+    options: overrides of DEFAULT_OPTIONS
+
+    Returns:
+    Profile dictionary with 'rates', the expected goals per match in every StatsBomb minute as an
+    array [side (AWAY, HOME), period - 1, minute], and the DEFAULT_OPTIONS.
+    """
+    period_goals = {1: (1 - second_half_share) * goals_per_match, 2: second_half_share * goals_per_match,
+                    3: extra_time_goals / 2, 4: extra_time_goals / 2}
+    rates = np.zeros((2, 4, N_MINUTES))
+    for period, (start, stop) in PERIOD_MINUTES.items():
+        weights = np.zeros(N_MINUTES)
+        weights[start:stop] = np.linspace(1, late_ratio, stop - start)
+        weights[start:stop] *= (1 - stoppage_share) / weights[start:stop].sum()
+        stoppage = 0.5 ** np.arange(N_MINUTES - stop)
+        weights[stop:] = stoppage_share * stoppage / stoppage.sum()
+        rates[HOME, period - 1] = home_share * period_goals[period] * weights
+        rates[AWAY, period - 1] = (1 - home_share) * period_goals[period] * weights
+    return {'rates': rates, **DEFAULT_OPTIONS, **options}
+
+
+def profile_from_aggregate(aggregate, **options):
+    """
+    Empirical goal-intensity profile: the observed goals per match and minute of an
+    aggregates.GoalAggregate, e.g. catalog.aggregate(catalog.TOP5_2015_16). Goals without a side
+    (tournaments) are split evenly between the teams, extra-time is taken from intensity_profile
+    if none of the matches went to extra-time.
+
+    options: overrides of DEFAULT_OPTIONS
+
+    Returns:
+    Profile dictionary, see intensity_profile.
+    """
+    counts = aggregate.counts[:, :4, :N_MINUTES].astype(float)
+    rates = np.zeros((2, 4, N_MINUTES))
+    rates[:, :, :counts.shape[2]] = counts[[AWAY, HOME]] + counts[OTHER] / 2
+    rates[:, :2] /= max(aggregate.n_matches, 1)
+    if aggregate.n_matches_ET:
+        rates[:, 2:] /= aggregate.n_matches_ET
+    else:
+        rates[:, 2:] = intensity_profile(home_share=0.5)['rates'][:, 2:]
+    return {'rates': rates, **DEFAULT_OPTIONS, **options}
+
+
+def _shootout(rng, success):
+    # alternating penalties, five each and then sudden death, until the result is decided
+    kicks = []
+    scored = {HOME: 0, AWAY: 0}
+    taken = {HOME: 0, AWAY: 0}
+    while True:
+        for side in [HOME, AWAY]:
+            goal = bool(rng.random() < success)
+            kicks.append((side, goal))
+            scored[side] += goal
+            taken[side] += 1
+            # decided when a team can no longer catch up with the kicks it has left of the first five
+            remaining = {s: max(5 - taken[s], 0) for s in taken}
+            if taken[AWAY] < 5 and (scored[HOME] + remaining[HOME] < scored[AWAY]
+                                    or scored[AWAY] + remaining[AWAY] < scored[HOME]):
+                return kicks
+        if taken[AWAY] >= 5 and scored[HOME] != scored[AWAY]:
+            return kicks
+
+
+class SyntheticStatsBomb:
+    """
+    Generator of StatsBomb-shaped data for scale testing, a drop-in replacement of statsbombpy's sb
+    (pass it as client to make_df / make_df_tournament, or set STATSBOMB_CLIENT=synthetic, see
+    ingestion.default_client). matches() lists any number of matches and events() returns flattened
+    event frames with Half Start, filler, shot and own-goal events, stoppage time and, for tied
+    knockout matches, extra-time and penalty shoot-outs.
+
+    Goals follow seeded goal-intensity profiles. The events of BATCH_MATCHES consecutive matches are
+    generated together from one random stream, so every match is reproducible independently of the
+    call order, and only the last few batches are kept in memory.
+
+    n_matches: number of matches of every competition and season (up to MAX_MATCHES)
+    profile: goal-intensity profile of the leagues, see intensity_profile and profile_from_aggregate
+    tournament_profile: profile of the tournaments, default a neutral-venue intensity_profile
+    tournaments: competition ids that are tournaments (group stage and knockout), default the
+        tournaments of the catalog
+    seasons: (competition_id, season_id) keys the client serves, default the datasets of the catalog;
+        every key gets its own season code, other keys raise a KeyError
+    n_filler: filler events per 90 minutes, 3000 and more for the size of real event data
+    seed: seed of the random streams
+    """
+
+    def __init__(self, n_matches=380, profile=None, tournament_profile=None, tournaments=None, seasons=None,
+                 n_filler=200, seed=0):
+        if n_matches > MAX_MATCHES:
+            raise ValueError(f"at most {MAX_MATCHES} matches per competition and season")
+        seasons = list(dict.fromkeys(map(tuple, seasons if seasons is not None else catalog.CATALOG)))
+        if len(seasons) > N_SEASON_CODES:
+            raise ValueError(f"at most {N_SEASON_CODES} competitions and seasons, the match ids would leave "
+                             f"the int32 range")
+        self.n_matches = n_matches
+        self.profiles = [profile or intensity_profile(), tournament_profile or intensity_profile(home_share=0.5)]
+        self.tournaments = set(tournaments if tournaments is not None else [key[0] for key in catalog.TOURNAMENTS])
+        # even codes for leagues and odd ones for tournaments, so events() knows the kind from the match id
+        self.season_codes = {key: 2 * index + (key[0] in self.tournaments) for index, key in enumerate(seasons)}
+        self.n_filler = n_filler
+        self.seed = seed
+        self._batch = functools.lru_cache(maxsize=4)(self._generate_batch)
+        # concurrent events() calls of the ingestion threads would otherwise all generate the same batch
+        self._lock = threading.Lock()
+
+    def _season_code(self, competition_id, season_id):
+        try:
+            return self.season_codes[(competition_id, season_id)]
+        except KeyError:
+            raise KeyError(f"competition {competition_id} season {season_id} is not among the seasons of the "
+                           f"synthetic client") from None
+
+    @staticmethod
+    def _teams(number, tournament):
+        # round-robin pairings of the league or tournament teams
+        n_teams = TEAMS['tournament' if tournament else 'league']
+        home = number % n_teams
+        away = (home + 1 + (number // n_teams) % (n_teams - 1)) % n_teams
+        names = np.array([f'Team {k}' for k in range(n_teams)], dtype=object)
+        return names[home], names[away]
+
+    def matches(self, competition_id, season_id):
+        code = self._season_code(competition_id, season_id)
+        number = np.arange(self.n_matches)
+        home_team, away_team = self._teams(number, code % 2)
+        stage = TOURNAMENT_STAGES[number % len(TOURNAMENT_STAGES)] if code % 2 else 'Regular Season'
+        return pd.DataFrame({
+            'match_id': code * MAX_MATCHES + number,
+            'home_team': home_team,
+            'away_team': away_team,
+            'competition_stage': stage,
+        })
+
+    def events(self, match_id):
+        with self._lock:
+            batch, offsets = self._batch(match_id // BATCH_MATCHES)
+        j = match_id % BATCH_MATCHES
+        return batch.iloc[offsets[j]:offsets[j + 1]].reset_index(drop=True)
+
+    def iter_event_batches(self, competition_id, season_id):
+        """
+        Events of all matches of a competition and season, BATCH_MATCHES matches per frame, in
+        match order. Faster than calling events() match by match, and memory stays bounded.
+        """
+        first = self._season_code(competition_id, season_id) * MAX_MATCHES
+        for start in range(0, self.n_matches, BATCH_MATCHES):
+            batch, offsets = self._generate_batch((first + start) // BATCH_MATCHES)
+            yield batch.iloc[:offsets[min(BATCH_MATCHES, self.n_matches - start)]]
+
+    def goals(self, competition_id, season_id):
+        """
+        Goals of all matches of a competition and season in the csv layout of make_df /
+        make_df_tournament (as read back with pd.read_csv), drawn from the same profiles as events()
+        but without generating any events, e.g. for memory tests with millions of goals. The draws
+        differ from the goals in the events, and there are no own goals of the wrong side.
+
+        Returns:
+        DataFrame with one row per goal, in the order of the matches and the clock.
+        """
+        code = self._season_code(competition_id, season_id)
+        tournament = bool(code % 2)
+        rng = np.random.default_rng([self.seed, code, MAX_MATCHES])
+        profile = self.profiles[tournament]
+        rates = profile['rates']
+        number = np.arange(self.n_matches)
+        stage = TOURNAMENT_STAGES[number % len(TOURNAMENT_STAGES)]
+        knockout = (stage != 'Group Stage') & tournament
+
+        # goals per match, side and period, extra-time for tied knockout matches, as in _generate_batch
+        expected = rates.sum(axis=2)
+        goals = rng.poisson(expected, size=(self.n_matches, 2, 4))
+        score = goals[:, :, :2].sum(axis=2)
+        extra_time = knockout & (score[:, HOME] == score[:, AWAY])
+        goals[~extra_time, :, 2:] = 0
+
+        flat = np.repeat(np.arange(goals.size), goals.reshape(-1))
+        match, side, p = flat // 8, flat // 4 % 2, flat % 4
+        minute = np.empty(len(flat), dtype=np.int64)
+        for s in [AWAY, HOME]:
+            for q in range(4):
+                rows = np.flatnonzero((side == s) & (p == q))
+                cdf = np.cumsum(rates[s, q]) / expected[s, q]
+                minute[rows] = np.minimum(np.searchsorted(cdf, rng.random(len(rows)), side='right'), N_MINUTES - 1)
+        order = np.lexsort((minute, p, match))
+        match, side, period, minute = match[order], side[order], p[order] + 1, minute[order]
+
+        match_id = code * MAX_MATCHES + match
+        if not tournament:
+            return pd.DataFrame({'match_id': match_id, 'period': period, 'n_matches': self.n_matches,
+                                 'goal_time': minute, 'home': side})
+        n_group = int((stage[:self.n_matches] == 'Group Stage').sum())
+        return pd.DataFrame({
+            'match_id': match_id, 'period': period, 'stage': stage[match], 'goal_time': minute,
+            'n_matches_group': n_group, 'n_matches_ko': self.n_matches - n_group,
+            'n_matches_ET': np.cumsum(extra_time)[match], 'ET_match': extra_time[match],
+        })
+
+    def _generate_batch(self, batch_index):
+        rng = np.random.default_rng([self.seed, batch_index])
+        match_id = batch_index * BATCH_MATCHES + np.arange(BATCH_MATCHES)
+        tournament = bool((match_id[0] // MAX_MATCHES) % 2)
+        number = match_id % MAX_MATCHES
+        profile = self.profiles[tournament]
+        rates = profile['rates']
+        knockout = (TOURNAMENT_STAGES[number % len(TOURNAMENT_STAGES)] != 'Group Stage') & tournament
+
+        # goals per match, side and period, extra-time for tied knockout matches
+        expected = rates.sum(axis=2)
+        goals = rng.poisson(expected, size=(BATCH_MATCHES, 2, 4))
+        score = goals[:, :, :2].sum(axis=2)
+        extra_time = knockout & (score[:, HOME] == score[:, AWAY])
+        goals[~extra_time, :, 2:] = 0
+        score = goals.sum(axis=2)
+        shootout = extra_time & (score[:, HOME] == score[:, AWAY])
+        played = np.ones((BATCH_MATCHES, 4), dtype=bool)
+        played[:, 2:] = extra_time[:, None]
+
+        rows = {'match': [], 'period': [], 'minute': [], 'type': [], 'outcome': [], 'side': []}
+
+        def add(match, period, minute, type_, outcome, side):
+            for column, value in zip(rows, [match, period, minute, type_, outcome, side]):
+                rows[column].append(np.broadcast_to(value, len(match)))
+
+        # goal minutes drawn from the profile, own goals give one event for each team
+        end = np.array([stop for start, stop in PERIOD_MINUTES.values()]) \
+            + rng.poisson(profile['stoppage_minutes'], size=(BATCH_MATCHES, 4))
+        for side in [AWAY, HOME]:
+            for p in range(4):
+                n = goals[:, side, p]
+                if not n.any():
+                    continue
+                match = np.repeat(np.arange(BATCH_MATCHES), n)
+                cdf = np.cumsum(rates[side, p]) / expected[side, p]
+                minute = np.minimum(np.searchsorted(cdf, rng.random(len(match)), side='right'), N_MINUTES - 1)
+                np.maximum.at(end[:, p], match, minute + 1)
+                own_goal = rng.random(len(match)) < profile['own_goal_share']
+                add(match[~own_goal], p + 1, minute[~own_goal], SHOT, GOAL, side)
+                add(match[own_goal], p + 1, minute[own_goal], OWN_GOAL_FOR, 0, side)
+                add(match[own_goal], p + 1, minute[own_goal], OWN_GOAL_AGAINST, 0, 1 - side)
+
+        for p, (period, (start, stop)) in enumerate(PERIOD_MINUTES.items()):
+            matches = np.flatnonzero(played[:, p])
+            length = end[matches, p] - start
+            for side in [AWAY, HOME]:
+                add(matches, period, start, HALF_START, 0, side)
+            # filler events and the shots that missed, spread uniformly over the period
+            n = np.full(len(matches), int(self.n_filler * FILLER_SHARE[period]))
+            match = np.repeat(matches, n)
+            minute = start + (rng.random(len(match)) * np.repeat(length, n)).astype(np.int64)
+            add(match, period, minute, rng.choice(FILLER_TYPES, len(match)), 0, rng.integers(0, 2, len(match)))
+            n = rng.poisson(profile['shots_per_match'] * (stop - start) / 90, len(matches))
+            n = np.maximum(n - goals[matches, :, p].sum(axis=1), 0)
+            match = np.repeat(matches, n)
+            minute = start + (rng.random(len(match)) * np.repeat(length, n)).astype(np.int64)
+            add(match, period, minute, SHOT, rng.choice(MISS_OUTCOMES, len(match)), rng.integers(0, 2, len(match)))
+
+        for match in np.flatnonzero(shootout):
+            kicks = _shootout(rng, profile['penalty_success'])
+            sides = np.array([side for side, goal in kicks])
+            outcomes = np.array([GOAL if goal else SAVED for side, goal in kicks])
+            add(np.full(len(kicks), match), 5, 120, SHOT, outcomes, sides)
+            add(np.full(2, match), 5, 120, HALF_START, 0, np.array([HOME, AWAY]))
+
+        columns = {column: np.concatenate(values) for column, values in rows.items()}
+        # events in the order of the matches and the clock, Half Start first and shoot-out kicks in turn
+        order = np.lexsort((columns['type'] != HALF_START, columns['minute'], columns['period'], columns['match']))
+        columns = {column: values[order] for column, values in columns.items()}
+        home_team, away_team = self._teams(number, tournament)
+        match = columns['match']
+        events = pd.DataFrame({
+            'match_id': match_id[match],
+            'type': TYPES[columns['type']],
+            'shot_outcome': OUTCOMES[columns['outcome']],
+            'period': columns['period'],
+            'minute': columns['minute'],
+            'team': np.where(columns['side'] == HOME, home_team[match], away_team[match]),
+        })
+        offsets = np.searchsorted(match, np.arange(BATCH_MATCHES + 1))
+        return events, offsets
+
+
+def write_open_data(client, root, competition_id, season_id, competition_name='Synthetic', season_name=''):
+    """
+    Write the matches and events of a competition and season in the layout of the StatsBomb open-data
+    repository: data/competitions.json, data/matches/<competition_id>/<season_id>.json and
+    data/events/<match_id>.json. The files are written batch by batch, so memory stays bounded.
+
+    client: SyntheticStatsBomb
+    root: folder of the checkout
+
+    Returns:
+    Number of matches written.
+    """
+    data_dir = os.path.join(root, 'data')
+    os.makedirs(os.path.join(data_dir, 'matches', str(competition_id)), exist_ok=True)
+    os.makedirs(os.path.join(data_dir, 'events'), exist_ok=True)
+
+    competitions_name = os.path.join(data_dir, 'competitions.json')
+    competitions = []
+    if os.path.exists(competitions_name):
+        with open(competitions_name) as f:
+            competitions = json.load(f)
+    competitions = [entry for entry in competitions
+                    if (entry['competition_id'], entry['season_id']) != (competition_id, season_id)]
+    competitions.append({'competition_id': competition_id, 'season_id': season_id,
+                         'competition_name': competition_name, 'season_name': season_name,
+                         'competition_international': competition_id in client.tournaments})
+    with open(competitions_name, 'w') as f:
+        json.dump(competitions, f, indent=1)
+
+    matches = client.matches(competition_id=competition_id, season_id=season_id)
+    with open(os.path.join(data_dir, 'matches', str(competition_id), f"{season_id}.json"), 'w') as f:
+        f.write('[')
+        for i, match in enumerate(matches.itertuples(index=False)):
+            f.write(',\n' if i else '\n')
+            json.dump({
+                'match_id': int(match.match_id),
+                'competition': {'competition_id': competition_id, 'competition_name': competition_name},
+                'season': {'season_id': season_id, 'season_name': season_name},
+                'home_team': {'home_team_name': match.home_team},
+                'away_team': {'away_team_name': match.away_team},
+                'competition_stage': {'name': match.competition_stage},
+            }, f)
+        f.write('\n]\n')
+
+    for batch in client.iter_event_batches(competition_id, season_id):
+        for match_id, events in batch.groupby('match_id', sort=False):
+            records = []
+            for index, event in enumerate(events.itertuples(index=False), start=1):
+                record = {'index': index, 'period': int(event.period), 'minute': int(event.minute), 'second': 0,
+                          'type': {'name': event.type}, 'team': {'name': event.team}}
+                if isinstance(event.shot_outcome, str):
+                    record['shot'] = {'outcome': {'name': event.shot_outcome}}
+                records.append(record)
+            with open(os.path.join(data_dir, 'events', f"{match_id}.json"), 'w') as f:
+                json.dump(records, f)
+    return len(matches)
+
+
+if __name__ == '__main__':
+    # Build the goal csvs of every dataset of the catalog from synthetic matches, e.g. to run the apps on
+    # them with GOALS_DATA_DIR=<csv_dir>
+    import argparse
+    import time
+    import metrics
+    from ingestion import make_df, make_df_tournament
+
+    metrics.configure_logging()
+
+    parser = argparse.ArgumentParser(description="Generate synthetic goal datasets for scale testing.")
+    parser.add_argument('--matches', type=int, default=3_800, help="matches per competition and season")
+    parser.add_argument('--csv-dir', default='synthetic_goals')
+    parser.add_argument('--open-data', help="also write the matches and events in the open-data layout here")
+    parser.add_argument('--empirical', action='store_true', help="use the intensity observed in the catalog")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    profiles = {}
+    if args.empirical:
+        profiles = {'profile': profile_from_aggregate(catalog.aggregate(catalog.TOP5_2015_16)),
+                    'tournament_profile': profile_from_aggregate(catalog.aggregate(catalog.TOURNAMENTS))}
+    client = SyntheticStatsBomb(n_matches=args.matches, seed=args.seed, **profiles)
+    os.makedirs(args.csv_dir, exist_ok=True)
+    for (competition_id, season_id), entry in catalog.CATALOG.items():
+        start = time.perf_counter()
+        if entry['kind'] == 'league':
+            make_df(competition_id, season_id, client=client, csv_dir=args.csv_dir)
+        else:
+            make_df_tournament(competition_id, season_id, client=client, csv_dir=args.csv_dir)
+        print(f"{entry['name']}: {args.matches} matches in {time.perf_counter() - start:.1f}s")
+        if args.open_data:
+            write_open_data(client, args.open_data, competition_id, season_id, entry['name'], entry['season'])
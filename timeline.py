@@ -0,0 +1,41 @@
+import numpy as np
+
+# Minutes reserved on the plotting timeline for the stoppage time after the first half, the second half
+# and the first half of extra-time. StatsBomb keeps counting the minutes during stoppage time (45, 46, ...),
+# so each period after the first is shifted by the slots before it to keep the 45+ minutes apart.
+STOPPAGE_SLOTS = (15, 15, 15)
+
+
+def period_offsets(stoppage_slots=STOPPAGE_SLOTS):
+    """
+    Lookup table of the timeline offset of every period.
+
+    stoppage_slots: minutes reserved after period 1, 2, ... for stoppage time
+
+    Returns:
+    Array where entry p is the offset added to the minutes of period p. Period 0 is unused and
+    the periods without a slot before them (e.g. penalty shoot-outs) are not shifted.
+    """
+    offsets = np.zeros(max(6, len(stoppage_slots) + 2), dtype=np.int16)
+    offsets[2:len(stoppage_slots) + 2] = np.cumsum(stoppage_slots)
+    return offsets
+
+
+OFFSETS = period_offsets()
+
+
+def adjusted_goal_time(period, goal_time, offsets=OFFSETS):
+    """
+    Map goal minutes to the plotting timeline, so the injury-time at the end of halves can be plotted
+    appropriately. This replaces applying the row-wise adjust_minutes with DataFrame.apply.
+
+    period: periods of the goals (1, 2 for the halves, 3, 4 for extra-time)
+    goal_time: minutes of the goals
+    offsets: lookup table from period_offsets
+
+    Returns:
+    Array with the minute of each goal on the timeline.
+    """
+    period = np.asarray(period)
+    goal_time = np.asarray(goal_time)
+    return goal_time + offsets.take(period, mode='clip')